@@ -0,0 +1,142 @@
+"""Stand-ins and helpers shared by the benchmarks."""
+
+import contextlib
+import glob
+import os
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Iterator, List, Tuple
+
+import numpy as np
+import pymupdf
+
+from pdf2zh import cache
+from pdf2zh.doclayout import DocLayoutModel, YoloResult
+from pdf2zh.translator import GoogleTranslator
+
+CORPUS = sorted(
+    glob.glob(str(Path(__file__).parent.parent / "test" / "file" / "*.pdf"))
+)
+WORDS = (
+    "the quick brown fox jumps over lazy dog model layout paragraph formula "
+    "energy matrix vector operator theorem proof lemma estimate bound"
+).split()
+
+
+class StaticLayoutModel(DocLayoutModel):
+    """
+    Layout model stand-in that marks the page body as text.
+
+    The ONNX model needs to be downloaded and dominates the run time on CPU,
+    pass --onnx to the benchmarks to use it instead.
+    """
+
+    names = {0: "plain text", 1: "figure"}
+
+    @property
+    def stride(self) -> int:
+        return 32
+
+    def predict(self, image, imgsz=1024, **kwargs) -> list:
+        h, w = image.shape[:2]
+        boxes = np.array(
+            [
+                [w * 0.05, h * 0.05, w * 0.95, h * 0.85, 0.9, 0],
+                [w * 0.1, h * 0.87, w * 0.9, h * 0.95, 0.8, 1],
+            ],
+            dtype=np.float32,
+        )
+        return [YoloResult(boxes=boxes, names=self.names)]
+
+
+class FakeTranslator:
+    """Deterministic in-process translation with a fixed latency per request."""
+
+    def __init__(self, latency: float = 0):
+        self.latency = latency
+        self.calls = 0
+
+    def __call__(self, text: str) -> str:
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return text  # 保留公式占位符，排版结果与原文长度一致
+
+
+@contextlib.contextmanager
+def fake_service(latency: float = 0) -> Iterator[str]:
+    """
+    Route the google service to a FakeTranslator and a throwaway cache.
+
+    Yields the service name to pass to translate_stream.
+    """
+    fake = FakeTranslator(latency)
+    test_db = cache.init_test_db()
+    do_translate, ignore_cache = (
+        GoogleTranslator.do_translate,
+        GoogleTranslator.ignore_cache,
+    )
+    GoogleTranslator.do_translate = lambda translator, text: fake(text)
+    GoogleTranslator.ignore_cache = True
+    try:
+        yield GoogleTranslator.name
+    finally:
+        GoogleTranslator.do_translate = do_translate
+        GoogleTranslator.ignore_cache = ignore_cache
+        cache.clean_test_db(test_db)
+
+
+def synthetic_pdf(pages: int, seed: int = 0) -> bytes:
+    """
+    Generate a paper-like PDF with text, inline symbols and rules.
+
+    Every fifth page only has vector graphics.
+    """
+    rng = random.Random(seed)
+    doc = pymupdf.open()
+    for pageno in range(pages):
+        page = doc.new_page()
+        if pageno % 5 == 4:
+            for i in range(200):
+                page.draw_line((50 + i, 100), (300, 100 + i))
+            continue
+        y = 72
+        for _ in range(6):
+            x = 72
+            for _ in range(rng.randint(20, 60)):
+                if rng.random() < 0.08:  # 行内公式符号
+                    page.insert_text((x, y), "a", fontname="Symbol", fontsize=10)
+                    x += 8
+                word = rng.choice(WORDS)
+                page.insert_text((x, y), word, fontname="Times-Roman", fontsize=10)
+                x += 6 * len(word) + 4
+                if x > 500:
+                    x = 72
+                    y += 13
+            y += 24
+        page.draw_line((72, y), (300, y))
+    return doc.tobytes()
+
+
+def load_corpus(files: List[str], synthetic_pages: int) -> List[Tuple[str, bytes]]:
+    """Read the given files (test/file by default) and a generated document."""
+    corpus = []
+    for file in files or CORPUS:
+        with open(file, "rb") as f:
+            corpus.append((os.path.basename(file), f.read()))
+    if synthetic_pages:
+        name = f"synthetic-{synthetic_pages}.pdf"
+        corpus.append((name, synthetic_pdf(synthetic_pages)))
+    return corpus
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process, 0 where it is not available."""
+    try:
+        import resource
+    except ImportError:
+        return 0.0
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024 / 1024 if sys.platform == "darwin" else rss / 1024
@@ -0,0 +1,206 @@
+"""
+Load test of the HTTP translators against the local mock server.
+
+    python -m benchmarks.loadtest --latency 0.1 --rate 100 --error-rate 0.02
+
+The real translator classes are pointed at the mock server and driven with
+increasing concurrency. Failed requests are retried like the converter
+does, --retries times with a one second pause.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from tenacity import Retrying, stop_after_attempt, wait_fixed
+
+from benchmarks.common import WORDS
+from benchmarks.mock_server import MockServer
+from pdf2zh import cache
+from pdf2zh.config import ConfigManager
+
+# 服务名 -> 指向 mock 服务的环境变量
+SERVICES: Dict[str, Dict[str, str]] = {
+    "mt": {"MT_BASE_URL": "{url}/v2/models/ensemble/generate"},
+    "deeplx": {"DEEPLX_ENDPOINT": "{url}/translate"},
+    "dify": {"DIFY_API_URL": "{url}/v1/workflows/run", "DIFY_API_KEY": "mock"},
+    "anythingllm": {
+        "AnythingLLM_URL": "{url}/api/v1/workspace/mock/chat",
+        "AnythingLLM_APIKEY": "mock",
+    },
+    "openai": {
+        "OPENAI_BASE_URL": "{url}/v1",
+        "OPENAI_API_KEY": "mock",
+        "OPENAI_MODEL": "mock",
+    },
+    "llm": {
+        "OPENAI_BASE_URL": "{url}/v1",
+        "OPENAI_API_KEY": "mock",
+        "OPENAI_MODEL": "mock",
+    },
+}
+
+
+def create_translator(service: str, url: str):
+    from pdf2zh.translator import (
+        AnythingLLMTranslator,
+        DeepLXTranslator,
+        DifyTranslator,
+        LLMTranslator,
+        MTTranslator,
+        OpenAITranslator,
+    )
+
+    translators = {
+        t.name: t
+        for t in [
+            MTTranslator,
+            DeepLXTranslator,
+            DifyTranslator,
+            AnythingLLMTranslator,
+            OpenAITranslator,
+            LLMTranslator,
+        ]
+    }
+    envs = {k: v.format(url=url) for k, v in SERVICES[service].items()}
+    return translators[service]("en", "zh-CN", None, envs=envs)
+
+
+def sample_texts(n: int) -> List[str]:
+    texts = []
+    for i in range(n):
+        words = [WORDS[(i * 7 + j * 3) % len(WORDS)] for j in range(8 + i % 24)]
+        words.insert(len(words) // 2, f"{{v{i % 3}}}")
+        texts.append(" ".join(words))
+    return texts
+
+
+def run(translator, texts: List[str], concurrency: int, retries: int) -> Dict:
+    latencies, failures = [], 0
+
+    def worker(text: str) -> Optional[float]:
+        start = time.perf_counter()
+        try:
+            for attempt in Retrying(
+                wait=wait_fixed(1), stop=stop_after_attempt(retries + 1), reraise=True
+            ):
+                with attempt:
+                    translator.translate(text, ignore_cache=True)
+        except Exception:
+            return None
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for latency in executor.map(worker, texts):
+            if latency is None:
+                failures += 1
+            else:
+                latencies.append(latency)
+    seconds = time.perf_counter() - start
+    quantiles = (
+        statistics.quantiles(latencies, n=20) if len(latencies) > 1 else latencies * 19
+    )
+    return {
+        "ok": len(latencies),
+        "failed": failures,
+        "seconds": seconds,
+        "rps": len(latencies) / seconds,
+        "p50": quantiles[9] if quantiles else 0,
+        "p95": quantiles[18] if quantiles else 0,
+    }
+
+
+def create_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--services",
+        nargs="+",
+        default=list(SERVICES),
+        choices=list(SERVICES),
+        help="translators to drive.",
+    )
+    parser.add_argument(
+        "--concurrency", type=int, nargs="+", default=[1, 10, 50], help="threads."
+    )
+    parser.add_argument("--requests", type=int, default=100, help="texts per run.")
+    parser.add_argument("--retries", type=int, default=3, help="retries per text.")
+    parser.add_argument("--url", help="use a running mock server instead.")
+    parser.add_argument("--latency", type=float, default=0.05, help="server latency.")
+    parser.add_argument("--jitter", type=float, default=0, help="latency jitter.")
+    parser.add_argument("--error-rate", type=float, default=0, help="500 share.")
+    parser.add_argument(
+        "--rate", type=float, default=0, help="requests/sec before 429."
+    )
+    parser.add_argument("--seed", type=int, default=0, help="server random seed.")
+    parser.add_argument("--output", help="write the results as JSON to this file.")
+    return parser
+
+
+def main(argv=None) -> int:
+    args = create_parser().parse_args(argv)
+    server = None
+    if args.url:
+        url = args.url.rstrip("/")
+    else:
+        server = MockServer(
+            ("127.0.0.1", 0),
+            args.latency,
+            args.jitter,
+            args.error_rate,
+            args.rate,
+            args.seed,
+        )
+        server.start()
+        url = server.url
+    # 翻译器会把 envs 写回配置文件，使用临时配置避免覆盖用户配置
+    config = tempfile.NamedTemporaryFile("w", suffix=".json", delete=False)
+    config.write("{}")
+    config.close()
+    ConfigManager.custome_config(config.name)
+    test_db = cache.init_test_db()
+
+    texts = sample_texts(args.requests)
+    results = []
+    print(
+        f"{'service':<12} {'threads':>7} {'ok':>5} {'failed':>6} {'req/s':>8} "
+        f"{'p50(ms)':>8} {'p95(ms)':>8} {'429':>5} {'500':>5}"
+    )
+    for service in args.services:
+        translator = create_translator(service, url)
+        for concurrency in args.concurrency:
+            before = dict(server.stats) if server else {}
+            with contextlib.redirect_stdout(io.StringIO()):  # mt 会打印每条译文
+                result = run(translator, texts, concurrency, args.retries)
+            if server:
+                for status in (429, 500):
+                    key = (service if service != "llm" else "openai", status)
+                    result[str(status)] = server.stats[key] - before.get(key, 0)
+            results.append({"service": service, "threads": concurrency, **result})
+            print(
+                f"{service:<12} {concurrency:>7} {result['ok']:>5} "
+                f"{result['failed']:>6} {result['rps']:>8.1f} "
+                f"{result['p50'] * 1000:>8.1f} {result['p95'] * 1000:>8.1f} "
+                f"{result.get('429', '-'):>5} {result.get('500', '-'):>5}"
+            )
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if server:
+        server.shutdown()
+        server.server_close()
+    cache.clean_test_db(test_db)
+    os.unlink(config.name)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
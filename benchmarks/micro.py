@@ -0,0 +1,265 @@
+"""
+Microbenchmarks of the CPU hot paths.
+
+    python -m benchmarks.micro --font /path/to/font.ttf
+    python -m benchmarks.micro receive_layout --save-pages pages.pkl
+    python -m benchmarks.micro receive_layout --pages pages.pkl
+
+receive_layout replays recorded pages through TranslateConverter with an
+identity translator, execute interprets the content streams of the corpus
+and preprocess runs OnnxModel.preprocess on rendered pages, apart from the
+session run.
+"""
+
+import argparse
+import contextlib
+import io
+import logging
+import os
+import pickle
+import statistics
+import sys
+import threading
+import time
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+import pymupdf
+from pdfminer.pdfdocument import PDFDocument
+from pdfminer.pdfinterp import PDFResourceManager
+from pdfminer.pdfpage import PDFPage
+from pdfminer.pdfparser import PDFParser
+from pdfminer.pdftypes import stream_value
+
+from benchmarks.common import StaticLayoutModel, fake_service, load_corpus
+from pdf2zh.converter import PDFConverterEx, TranslateConverter
+from pdf2zh.doclayout import OnnxModel
+from pdf2zh.fontcache import load_font
+from pdf2zh.high_level import NOTO_NAME, download_remote_fonts, translate_stream
+from pdf2zh.pdfinterp import PDFPageInterpreterEx
+
+
+class PreprocessModel(OnnxModel):
+    """OnnxModel without a session, preprocessing only needs the stride."""
+
+    def __init__(self, stride: int = 32):
+        self._stride = stride
+        self._buffers = threading.local()
+
+
+@contextlib.contextmanager
+def recording(pages: List[Tuple]):
+    """Record the arguments and converter state of every receive_layout call."""
+    receive_layout = TranslateConverter.receive_layout
+
+    def record(self, ltpage):
+        pages.append((ltpage, self.layout[ltpage.pageid], self.fontmap, self.fontid))
+        return receive_layout(self, ltpage)
+
+    TranslateConverter.receive_layout = record
+    try:
+        yield pages
+    finally:
+        TranslateConverter.receive_layout = receive_layout
+
+
+def measure(func: Callable[[], object], repeat: int) -> List[float]:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def render_pages(corpus, errors) -> List[Tuple[np.ndarray, int]]:
+    """Render the pages of the corpus as translate_patch passes them to the model."""
+    images = []
+    for name, stream in corpus:
+        try:
+            rendered = []
+            for page in pymupdf.open(stream=stream):
+                pix = page.get_pixmap()
+                image = np.frombuffer(pix.samples_mv, np.uint8).reshape(
+                    pix.height, pix.width, 3
+                )[:, :, ::-1]
+                rendered.append((image, int(pix.height / 32) * 32))
+            images.extend(rendered)
+        except Exception as e:
+            errors[name] = repr(e)
+    return images
+
+
+def bench_receive_layout(corpus, args, errors) -> Tuple[int, Callable[[], object]]:
+    if args.pages:
+        with open(args.pages, "rb") as f:
+            pages = pickle.load(f)
+    else:
+        pages = []
+        with recording(pages):
+            for name, stream in corpus:
+                recorded = len(pages)
+                try:
+                    translate_stream(
+                        stream,
+                        lang_in="en",
+                        lang_out=args.lang_out,
+                        service=args.service,
+                        thread=1,
+                        model=StaticLayoutModel(),
+                    )
+                except Exception as e:
+                    del pages[recorded:]  # 不回放失败文档的页面
+                    errors[name] = repr(e)
+    if args.save_pages:
+        with open(args.save_pages, "wb") as f:
+            pickle.dump(pages, f)
+
+    noto = load_font(NOTO_NAME, download_remote_fonts(args.lang_out.lower()))
+    device = TranslateConverter(
+        PDFResourceManager(),
+        None,
+        None,
+        1,
+        {},
+        "en",
+        args.lang_out,
+        args.service,
+        NOTO_NAME,
+        noto,
+    )
+
+    def run():
+        for ltpage, mask, fontmap, fontid in pages:
+            device.layout[ltpage.pageid] = mask
+            device.fontmap, device.fontid = fontmap, fontid
+            device.receive_layout(ltpage)
+
+    return len(pages), run
+
+
+def bench_execute(corpus, args, errors) -> Tuple[int, Callable[[], object]]:
+    rsrcmgr = PDFResourceManager()
+    device = PDFConverterEx(rsrcmgr)
+    interpreter = PDFPageInterpreterEx(rsrcmgr, device, {})
+    pages = []
+    for name, stream in corpus:
+        try:
+            doc = PDFDocument(PDFParser(io.BytesIO(stream)))
+            for pageno, page in enumerate(PDFPage.create_pages(doc)):
+                page.pageno = pageno
+                for obj in page.contents:  # 预先解码，只测量解释执行
+                    stream_value(obj).get_data()
+                pages.append(page)
+        except Exception as e:
+            errors[name] = repr(e)
+
+    def run():
+        for page in pages:
+            x0, y0, x1, y1 = page.cropbox
+            ctm = (1, 0, 0, 1, -x0, -y0)
+            device.begin_page(page, ctm)
+            interpreter.render_contents(page.resources, page.contents, ctm=ctm)
+
+    return len(pages), run
+
+
+def bench_preprocess(corpus, args, errors) -> Tuple[int, Callable[[], object]]:
+    model = OnnxModel(args.onnx) if args.onnx else PreprocessModel()
+    images = render_pages(corpus, errors)
+
+    def run():
+        for image, imgsz in images:
+            model.preprocess(image, imgsz)
+
+    return len(images), run
+
+
+def bench_inference(corpus, args, errors) -> Tuple[int, Callable[[], object]]:
+    model = OnnxModel(args.onnx)
+    # preprocess 复用同一块输入内存，这里需要各自的副本
+    inputs = [
+        model.preprocess(image, imgsz).copy()
+        for image, imgsz in render_pages(corpus, errors)
+    ]
+
+    def run():
+        for pix in inputs:
+            model.model.run(None, {"images": pix})
+
+    return len(inputs), run
+
+
+BENCHMARKS: Dict[str, Callable] = {
+    "receive_layout": bench_receive_layout,
+    "execute": bench_execute,
+    "preprocess": bench_preprocess,
+    "inference": bench_inference,  # 需要 --onnx
+}
+
+
+def create_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "benchmarks",
+        nargs="*",
+        help=f"benchmarks to run: {', '.join(BENCHMARKS)}, all but inference by default.",
+    )
+    parser.add_argument("--files", nargs="+", help="PDF files, defaults to test/file.")
+    parser.add_argument(
+        "--synthetic-pages",
+        type=int,
+        default=20,
+        help="pages of the generated document, 0 to skip it.",
+    )
+    parser.add_argument("--repeat", type=int, default=10, help="runs per benchmark.")
+    parser.add_argument("--lang-out", default="en", help="target language.")
+    parser.add_argument("--font", help="font file, instead of downloading one.")
+    parser.add_argument("--onnx", help="ONNX layout model for preprocess/inference.")
+    parser.add_argument("--pages", help="replay pages recorded with --save-pages.")
+    parser.add_argument("--save-pages", help="pickle the recorded pages to this file.")
+    return parser
+
+
+def main(argv=None) -> int:
+    logging.basicConfig(level=logging.WARNING)
+    args = create_parser().parse_args(argv)
+    if args.font:
+        os.environ["NOTO_FONT_PATH"] = os.path.abspath(args.font)
+    names = args.benchmarks or [name for name in BENCHMARKS if name != "inference"]
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        print(f"unknown benchmarks: {', '.join(unknown)}")
+        return 1
+    if "inference" in names and not args.onnx:
+        print("inference needs --onnx")
+        return 1
+    corpus = load_corpus(args.files, args.synthetic_pages)
+
+    print(
+        f"{'benchmark':<16} {'items':>6} {'best(ms)':>10} {'mean(ms)':>10} {'ms/item':>8}"
+    )
+    errors: Dict[str, str] = {}
+    with fake_service() as service:
+        args.service = service
+        for name in names:
+            try:
+                items, run = BENCHMARKS[name](corpus, args, errors)
+                run()  # 预热缓存
+                times = measure(run, args.repeat)
+            except Exception as e:
+                print(f"{name:<16} failed: {e!r}")
+                continue
+            best = min(times)
+            print(
+                f"{name:<16} {items:>6} {best * 1000:>10.2f} "
+                f"{statistics.mean(times) * 1000:>10.2f} "
+                f"{best * 1000 / max(items, 1):>8.3f}"
+            )
+    for document, error in errors.items():  # 失败的文档不计入结果
+        print(f"skipped {document}: {error}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
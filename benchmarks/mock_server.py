@@ -0,0 +1,262 @@
+"""
+Local stand-in for the HTTP translation services.
+
+    python -m benchmarks.mock_server --port 8899 --latency 0.2 --rate 50
+
+Speaks the protocols used by the translators, echoing the source text back
+as the translation:
+
+    POST /v2/models/ensemble/generate         mt
+    POST /translate                           deeplx
+    POST /v1/chat/completions                 openai and compatible services
+    POST /v1/workflows/run                    dify
+    POST /api/v1/workspace/<slug>/chat        anythingllm
+    GET  /stats                               request counts by route and status
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Optional, Tuple
+
+SOURCE_RE = re.compile(r"Source Text: (.*)\nTranslated Text:", re.DOTALL)
+MT_TAG_RE = re.compile(r"^<2\w+> ")
+
+
+def source_text(messages) -> str:
+    """The text to translate from a list of chat messages."""
+    if isinstance(messages, str):
+        return messages
+    content = next(
+        (m.get("content", "") for m in reversed(messages) if m.get("role") == "user"),
+        "",
+    )
+    match = SOURCE_RE.search(content)
+    return match.group(1) if match else content
+
+
+def chat_reply(messages) -> str:
+    text = source_text(messages)
+    if isinstance(messages, list) and any(
+        "<t>" in m.get("content", "") for m in messages
+    ):
+        return f"<t>{text}</t>"  # 按提示词要求放在 <t> 标签中
+    return text
+
+
+def handle_mt(body: Dict) -> Dict:
+    return {"text_output": MT_TAG_RE.sub("", body["text_input"])}
+
+
+def handle_deeplx(body: Dict) -> Dict:
+    return {"code": 200, "data": body["text"]}
+
+
+def handle_openai(body: Dict) -> Dict:
+    return {
+        "id": "chatcmpl-mock",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "mock"),
+        "choices": [
+            {
+                "index": 0,
+                "message": {
+                    "role": "assistant",
+                    "content": chat_reply(body["messages"]),
+                },
+                "finish_reason": "stop",
+            }
+        ],
+        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+    }
+
+
+def handle_dify(body: Dict) -> Dict:
+    return {
+        "data": {"status": "succeeded", "outputs": {"text": body["inputs"]["text"]}}
+    }
+
+
+def handle_anythingllm(body: Dict) -> Dict:
+    return {"type": "textResponse", "textResponse": chat_reply(body["message"])}
+
+
+def route(path: str) -> Tuple[str, Optional[Callable[[Dict], Dict]]]:
+    path = path.split("?", 1)[0].rstrip("/")
+    if path.endswith("/v2/models/ensemble/generate"):
+        return "mt", handle_mt
+    if path.endswith("/translate"):
+        return "deeplx", handle_deeplx
+    if path.endswith("/chat/completions"):
+        return "openai", handle_openai
+    if path.endswith("/workflows/run"):
+        return "dify", handle_dify
+    if re.search(r"/workspace/[^/]+/chat$", path):
+        return "anythingllm", handle_anythingllm
+    return path, None
+
+
+class TokenBucket:
+    """Allow rate requests per second on average, with bursts of burst requests."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self) -> bool:
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address: Tuple[str, int],
+        latency: float = 0,
+        jitter: float = 0,
+        error_rate: float = 0,
+        rate: float = 0,
+        seed: Optional[int] = None,
+    ):
+        super().__init__(address, MockHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.bucket = TokenBucket(rate, max(rate, 1)) if rate else None
+        self.random = random.Random(seed)
+        self.stats: Counter = Counter()  # (服务, 状态码) -> 请求数
+        self.lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, service: str, status: int):
+        with self.lock:
+            self.stats[(service, status)] += 1
+
+    def simulate(self) -> bool:
+        """Sleep for the configured latency, return whether the request fails."""
+        with self.lock:
+            jitter = self.random.uniform(-self.jitter, self.jitter)
+            failed = self.random.random() < self.error_rate
+        time.sleep(max(self.latency + jitter, 0))
+        return failed
+
+    def start(self) -> threading.Thread:
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    server: MockServer
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = (
+        True  # 头部和正文分开写入，避免延迟确认拖慢 keep-alive 连接
+    )
+
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, status: int, data: Dict, headers: Optional[Dict] = None):
+        payload = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/stats":
+            stats = {f"{s} {code}": n for (s, code), n in self.server.stats.items()}
+            return self.reply(200, stats)
+        self.reply(404, {"error": "not found"})
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        service, handler = route(self.path)
+        if handler is None:
+            self.server.count(service, 404)
+            return self.reply(404, {"error": "not found"})
+        if self.server.bucket and not self.server.bucket.take():
+            self.server.count(service, 429)
+            return self.reply(
+                429,
+                {"error": {"message": "rate limited", "type": "rate_limit"}},
+                {"Retry-After": "1"},
+            )
+        if self.server.simulate():
+            self.server.count(service, 500)
+            return self.reply(500, {"error": {"message": "mock failure"}})
+        try:
+            data = handler(json.loads(body))
+        except (KeyError, TypeError, ValueError) as e:
+            self.server.count(service, 400)
+            return self.reply(400, {"error": {"message": repr(e)}})
+        self.server.count(service, 200)
+        self.reply(200, data)
+
+
+def create_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1", help="address to bind.")
+    parser.add_argument("--port", type=int, default=8899, help="port to bind.")
+    parser.add_argument("--latency", type=float, default=0, help="seconds per request.")
+    parser.add_argument(
+        "--jitter", type=float, default=0, help="uniform +/- seconds of latency."
+    )
+    parser.add_argument(
+        "--error-rate",
+        type=float,
+        default=0,
+        help="share of requests failing with 500.",
+    )
+    parser.add_argument(
+        "--rate", type=float, default=0, help="requests/sec before 429, 0 for no limit."
+    )
+    parser.add_argument("--seed", type=int, help="seed of latency and failures.")
+    return parser
+
+
+def main(argv=None):
+    args = create_parser().parse_args(argv)
+    server = MockServer(
+        (args.host, args.port),
+        args.latency,
+        args.jitter,
+        args.error_rate,
+        args.rate,
+        args.seed,
+    )
+    print(f"Mock translation server on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
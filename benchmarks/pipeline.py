@@ -0,0 +1,189 @@
+"""
+End-to-end benchmark of translate_stream.
+
+    python -m benchmarks.pipeline --font /path/to/font.ttf
+    python -m benchmarks.pipeline --font /path/to/font.ttf --save-baseline
+
+Each document is translated --repeat times, the fastest run and the fastest
+time of each stage are kept.
+The result is compared against benchmarks/baseline.json if it was saved
+on this machine, the exit code is 1 if pages/sec or the time per page of a
+stage regressed by more than --tolerance. A stage must also be slower by
+MIN_STAGE_DELTA per page. The exit code is 1 as well if a document failed.
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+from benchmarks.common import StaticLayoutModel, fake_service, load_corpus, peak_rss_mb
+
+BENCH_DIR = Path(__file__).parent
+BASELINE = BENCH_DIR / "baseline.json"
+MIN_STAGE_SECONDS = 0.005  # 每页耗时低于 5ms 的阶段噪声太大，不做比较
+MIN_STAGE_DELTA = 0.005  # 共享的 CI 机器上同一代码前后两次相差可达数毫秒
+
+
+def create_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("files", nargs="*", help="PDF files, defaults to test/file.")
+    parser.add_argument(
+        "--synthetic-pages",
+        type=int,
+        default=20,
+        help="pages of the generated document, 0 to skip it.",
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0, help="seconds per translation request."
+    )
+    parser.add_argument("--thread", type=int, default=4, help="translation threads.")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per document.")
+    parser.add_argument("--lang-out", default="en", help="target language.")
+    parser.add_argument("--font", help="font file, instead of downloading one.")
+    parser.add_argument("--onnx", help="use this ONNX layout model.")
+    parser.add_argument("--baseline", default=str(BASELINE), help="baseline file.")
+    parser.add_argument(
+        "--save-baseline", action="store_true", help="store the results as baseline."
+    )
+    parser.add_argument(
+        "--tolerance", type=float, default=0.5, help="allowed relative slowdown."
+    )
+    parser.add_argument("--output", help="write the results as JSON to this file.")
+    return parser
+
+
+def run(stream: bytes, model, service: str, args) -> Dict:
+    from pdf2zh.high_level import translate_stream
+    from pdf2zh.profiler import Profiler
+
+    best, stages = None, {}
+    for _ in range(args.repeat):
+        profiler = Profiler()
+        start = time.perf_counter()
+        translate_stream(
+            stream,
+            lang_in="en",
+            lang_out=args.lang_out,
+            service=service,
+            thread=args.thread,
+            model=model,
+            profiler=profiler,
+        )
+        seconds = time.perf_counter() - start
+        report = profiler.report()
+        best = min(best or seconds, seconds)
+        for name, stage in report["stages"].items():  # 各阶段分别取最快的一次
+            stages[name] = min(stages.get(name, stage["seconds"]), stage["seconds"])
+    pages = report["counters"].get("pages", 0)
+    return {
+        "pages": pages,
+        "seconds": best,
+        "pages_per_sec": pages / best,
+        "peak_rss_mb": peak_rss_mb(),
+        "stages": {name: seconds / max(pages, 1) for name, seconds in stages.items()},
+    }
+
+
+def compare(results: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Return a description of every regression against the baseline."""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base or "error" in result or "error" in base:
+            continue  # 失败的文档单独报告
+        if result["pages_per_sec"] < base["pages_per_sec"] * (1 - tolerance):
+            regressions.append(
+                f"{name}: {result['pages_per_sec']:.2f} pages/sec, "
+                f"baseline {base['pages_per_sec']:.2f}"
+            )
+        for stage, seconds in base["stages"].items():
+            current = result["stages"].get(stage, 0)
+            if (
+                seconds >= MIN_STAGE_SECONDS
+                and current > seconds * (1 + tolerance)
+                and current - seconds > MIN_STAGE_DELTA
+            ):
+                regressions.append(
+                    f"{name}: {stage} {current * 1000:.1f} ms/page, "
+                    f"baseline {seconds * 1000:.1f}"
+                )
+    return regressions
+
+
+def print_results(results: Dict):
+    stages = sorted({s for r in results.values() for s in r.get("stages", {})})
+    print(f"{'document':<40} {'pages':>5} {'pages/s':>8} {'rss(MB)':>8}  ms/page")
+    for name, result in results.items():
+        if "error" in result:
+            print(f"{name:<40} failed: {result['error']}")
+            continue
+        breakdown = ", ".join(
+            f"{s} {result['stages'][s] * 1000:.1f}"
+            for s in stages
+            if s in result["stages"]
+        )
+        print(
+            f"{name:<40} {result['pages']:>5} {result['pages_per_sec']:>8.2f} "
+            f"{result['peak_rss_mb']:>8.1f}  {breakdown}"
+        )
+
+
+def main(argv=None) -> int:
+    logging.basicConfig(level=logging.WARNING)
+    args = create_parser().parse_args(argv)
+    if args.font:
+        os.environ["NOTO_FONT_PATH"] = os.path.abspath(args.font)
+    if args.onnx:
+        from pdf2zh.doclayout import OnnxModel
+
+        model = OnnxModel(args.onnx)
+    else:
+        model = StaticLayoutModel()
+
+    config = {
+        "latency": args.latency,
+        "thread": args.thread,
+        "lang_out": args.lang_out,
+        "model": "onnx" if args.onnx else "static",
+    }
+    results = {}
+    with fake_service(args.latency) as service:
+        for name, stream in load_corpus(args.files, args.synthetic_pages):
+            try:
+                results[name] = run(stream, model, service, args)
+            except Exception as e:
+                results[name] = {"error": repr(e)}
+    print_results(results)
+    # 翻译失败的文档使基准测试失败，不论是否有基线
+    failures = [name for name, result in results.items() if "error" in result]
+    for name in failures:
+        print(f"FAILED {name}: {results[name]['error']}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"config": config, "results": results}, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({"config": config, "results": results}, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        return 1 if failures else 0
+    if not os.path.exists(args.baseline):
+        return 1 if failures else 0
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline["config"] != config:
+        print(f"Baseline was recorded with {baseline['config']}, not comparing.")
+        return 1 if failures else 0
+    regressions = compare(results, baseline["results"], args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if failures or regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
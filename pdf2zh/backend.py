@@ -1,18 +1,88 @@
-from flask import Flask, request, send_file
-from celery import Celery, Task
+from flask import Flask, Request, Response, redirect, request, send_file
+from celery import Celery, Task, chord
+from celery.concurrency import get_implementation, prefork
 from celery.result import AsyncResult
+from celery.states import READY_STATES
+from celery.signals import (
+    task_failure,
+    task_revoked,
+    task_success,
+    worker_init,
+    worker_process_init,
+)
+from celery.utils import uuid
+from celery.worker import state as worker_state
+from kombu import Queue
+from pymupdf import Document, FileDataError
 from pdf2zh import translate_stream
+from pdf2zh.high_level import (
+    NOTO_NAME,
+    download_remote_fonts,
+    merge_shards,
+    translate_shard,
+)
 import tqdm
 import json
-import io
-from pdf2zh.doclayout import ModelInstance
+import hashlib
+import logging
+import math
+import queue
+import tempfile
+import time
+from pdf2zh import cache
+from pdf2zh.checkpoint import Checkpoint
+from pdf2zh.doclayout import ModelInstance, OnnxModel
+from pdf2zh.events import LocalEventBus, RedisEventBus
 from pdf2zh.config import ConfigManager
+from pdf2zh.fontcache import load_font
+from pdf2zh.metrics import LocalStore, MetricsProfiler, RedisStore, Registry
+from pdf2zh.storage import (
+    CHUNK_SIZE,
+    LocalBlobStore,
+    LocalJobIndex,
+    RedisJobIndex,
+    open_store,
+)
+
+log = logging.getLogger(__name__)
+
+
+class UploadRequest(Request):
+    def _get_file_stream(
+        self, total_content_length, content_type, filename=None, content_length=None
+    ):
+        # 上传的文件分块写入磁盘，不论大小都不在内存中缓存
+        return tempfile.NamedTemporaryFile("wb+", suffix=".pdf")
+
+
+# 短文档走快速队列，长文档和分片走默认队列，互不阻塞
+BULK_QUEUE = "celery"
+FAST_QUEUE = "fast"
 
 flask_app = Flask("pdf2zh")
+flask_app.request_class = UploadRequest
 flask_app.config.from_mapping(
     CELERY=dict(
         broker_url=ConfigManager.get("CELERY_BROKER", "redis://127.0.0.1:6379/0"),
         result_backend=ConfigManager.get("CELERY_RESULT", "redis://127.0.0.1:6379/0"),
+        task_default_queue=BULK_QUEUE,
+        # 未指定 -Q 的 worker 同时消费两个队列，优先级相同时先取快速队列
+        task_queues=[Queue(FAST_QUEUE), Queue(BULK_QUEUE)],
+        # redis 按优先级拆分队列，0 最先执行
+        broker_transport_options={
+            "priority_steps": list(range(10)),
+            "queue_order_strategy": "priority",
+            # 未确认的任务超过这么久才重新投递，需长于最长的任务
+            "visibility_timeout": int(
+                ConfigManager.get("CELERY_VISIBILITY_TIMEOUT", 6 * 3600)
+            ),
+        },
+        task_default_priority=3,
+        # 每个 worker 只预取一个任务，后提交的高优先级任务不会排在预取的任务之后
+        worker_prefetch_multiplier=1,
+        # 翻译完成后才确认，worker 被抢占时任务重新投递，从检查点继续
+        task_acks_late=True,
+        task_reject_on_worker_lost=True,
     )
 )
 
@@ -35,61 +105,622 @@ def celery_init_app(app: Flask) -> Celery:
 celery_app = celery_init_app(flask_app)
 
 
+def metrics_init_app(app: Flask) -> Registry:
+    # 各个 worker 进程通过 redis 汇总指标
+    url = ConfigManager.get("METRICS_REDIS", app.config["CELERY"]["result_backend"])
+    store = RedisStore(url) if url and url.startswith("redis") else LocalStore()
+    registry = Registry(store)
+    app.extensions["metrics"] = registry
+    return registry
+
+
+metrics = metrics_init_app(flask_app)
+# 输入和译文存放在 blob 存储中，任务参数和结果只传递 key
+store = open_store()
+
+
+def jobs_init_app(app: Flask):
+    # 相同文件和参数的任务只运行一次，多个 Flask 实例通过 redis 共享记录
+    url = ConfigManager.get("JOBS_REDIS", app.config["CELERY"]["result_backend"])
+    jobs = RedisJobIndex(url) if url and url.startswith("redis") else LocalJobIndex()
+    app.extensions["jobs"] = jobs
+    return jobs
+
+
+jobs = jobs_init_app(flask_app)
+
+
+def events_init_app(app: Flask):
+    # worker 通过 redis 发布进度，每个 Flask 进程只订阅一次再分发给客户端
+    url = ConfigManager.get("EVENTS_REDIS", app.config["CELERY"]["result_backend"])
+    events = RedisEventBus(url) if url and url.startswith("redis") else LocalEventBus()
+    app.extensions["events"] = events
+    return events
+
+
+events = events_init_app(flask_app)
+
+
+# 超过这么多页的文档拆分成多个子任务，由不同 worker 并行翻译
+SHARD_PAGES = int(ConfigManager.get("SHARD_PAGES", 50))
+# 不超过这么多页的文档进入快速队列，0 表示不区分
+FAST_LANE_PAGES = int(ConfigManager.get("FAST_LANE_PAGES", 20))
+# 超过这么多页的任务才保存检查点，被中断的短任务重新翻译
+CHECKPOINT_PAGES = int(ConfigManager.get("CHECKPOINT_PAGES", 20))
+# 任务最多投递这么多次，每次都使 worker 退出的文档不再重新投递
+TASK_MAX_DELIVERIES = int(ConfigManager.get("TASK_MAX_DELIVERIES", 3))
+# 租户每排队这么多页，其后提交的页优先级降低一级
+FAIR_SHARE_PAGES = int(ConfigManager.get("FAIR_SHARE_PAGES", 100))
+PRIORITIES = {"high": 0, "normal": 3, "low": 6}
+# 由认证代理设置的租户请求头，客户端可以伪造，未配置时按客户端地址区分租户
+TENANT_HEADER = ConfigManager.get("TENANT_HEADER", "")
+# 事件流空闲这么多秒后发送心跳并检查任务状态
+HEARTBEAT_SECONDS = 15
+# 这些 blob 随任务结果一同过期，由 celery beat 每隔这么多秒清理一次
+EXPIRING_PREFIXES = ("inputs/", "results/", "shards/", "jobs/", "checkpoints/")
+EXPIRE_INTERVAL = int(ConfigManager.get("EXPIRE_INTERVAL", 3600))
+
+
+def result_ttl() -> float:
+    """Seconds the results of a task are kept, the result_expires of Celery."""
+    return celery_app.backend.expires or 24 * 3600
+
+
+def result_key(id: str, format: str) -> str:
+    return f"results/{id}/{format}.pdf"
+
+
+def save_results(id: str, doc_mono: bytes, doc_dual: bytes) -> dict:
+    keys = {}
+    for format, doc in [("mono", doc_mono), ("dual", doc_dual)]:
+        keys[format] = result_key(id, format)
+        store.put(keys[format], doc)
+    return keys
+
+
+def job_alive(id: str) -> bool:
+    """Whether a recorded task is still running or its results can be served."""
+    state = celery_app.AsyncResult(id).state
+    if state == "SUCCESS":
+        return store.exists(result_key(id, "mono"))
+    if state == "PENDING":
+        # 未知的 id 也是 PENDING，只有提交成功的任务才有记录
+        return store.exists(f"jobs/{id}.json")
+    return state not in ("FAILURE", "REVOKED")
+
+
+def task_checkpoint(task: Task, stream: bytes, pages: int, args: dict):
+    """Checkpoint of a task, None for tasks of at most CHECKPOINT_PAGES pages."""
+    if pages <= CHECKPOINT_PAGES:
+        return None
+    return Checkpoint.of(stream, store, task.request.id, **args)
+
+
+def split_pages(page_count: int, pages: list, size: int) -> list[list[int]]:
+    """Split the selected pages, all by default, into shards of size pages."""
+    if pages:
+        pages = sorted({p for p in pages if 0 <= p < page_count})
+    else:
+        pages = list(range(page_count))
+    return [pages[i : i + size] for i in range(0, len(pages), size)]
+
+
+def shard_counts(id: str):
+    """Sizes and translated pages of the shards of a sharded task, None for other tasks."""
+    if not store.exists(f"jobs/{id}.json"):
+        return None
+    sizes = json.loads(store.get(f"jobs/{id}.json")).get("shards")
+    if sizes is None:
+        return None
+    counts = []
+    for i, size in enumerate(sizes):
+        result = celery_app.AsyncResult(f"{id}-{i}")
+        if result.state == "SUCCESS":
+            counts.append(size)
+        elif result.state == "PROGRESS":
+            counts.append(result.info["n"])
+        else:
+            counts.append(0)
+    return sizes, counts
+
+
+def shard_progress(id: str):
+    """Progress of the shards of a sharded task, None for other tasks."""
+    shards = shard_counts(id)
+    if shards is None:
+        return None
+    sizes, counts = shards
+    return {"n": sum(counts), "total": sum(sizes)}
+
+
+def task_status(id: str) -> dict:
+    result: AsyncResult = celery_app.AsyncResult(id)
+    if str(result.state) == "PROGRESS":
+        return {"state": str(result.state), "info": result.info}
+    if str(result.state) == "PENDING":
+        progress = shard_progress(id)
+        if progress is not None:
+            return {"state": "PROGRESS", "info": progress}
+    return {"state": str(result.state)}
+
+
+def file_urls(id: str) -> dict:
+    return {f: f"/v1/translate/{id}/{f}" for f in ("mono", "dual")}
+
+
+def publish_state(id: str, state: str):
+    data = {"state": state}
+    if state == "SUCCESS":
+        data["files"] = file_urls(id)
+    events.publish(id, "state", data)
+
+
+def preload_worker():
+    """Load the layout model, fonts and cache of a worker process before its first task."""
+    start = time.perf_counter()
+    threads = int(ConfigManager.get("ONNX_THREADS", 0))
+    # 推理会话和其线程池不能跨 fork 复用，每个进程重新加载
+    if isinstance(ModelInstance.value, OnnxModel):
+        model = OnnxModel(ModelInstance.value.model_path, threads)
+    else:
+        model = OnnxModel.load_available(threads)
+    model.warmup()
+    ModelInstance.value = model
+    for lang in ConfigManager.get("PRELOAD_LANGS", "zh").split(","):
+        if lang.strip():
+            load_font(NOTO_NAME, download_remote_fonts(lang.strip().lower()))
+    cache.init_db()
+    log.info(f"Worker preloaded in {time.perf_counter() - start:.2f}s")
+
+
+@worker_process_init.connect
+def init_worker_process(**kwargs):
+    try:
+        preload_worker()
+    except Exception:
+        log.exception("Failed to preload the worker process")
+
+
+@worker_init.connect
+def init_worker(sender=None, **kwargs):
+    # prefork 的子进程各自在 worker_process_init 中加载，其他执行池共用主进程
+    # pool_cls 可能还是 "prefork" 或 "processes" 这样的名字
+    if sender is not None and issubclass(
+        get_implementation(sender.pool_cls), prefork.TaskPool
+    ):
+        return
+    try:
+        preload_worker()
+    except Exception:
+        log.exception("Failed to preload the worker")
+
+
+def queue_depth(queue: str = BULK_QUEUE) -> float:
+    try:
+        with celery_app.connection_for_read() as conn:
+            conn.ensure_connection(max_retries=1)  # broker 不可用时不阻塞抓取
+            return conn.default_channel.queue_declare(
+                queue=queue, passive=True
+            ).message_count
+    except Exception:
+        return float("nan")
+
+
+def tenant_id() -> str:
+    """Tenant of the current request, the TENANT_HEADER or the client address."""
+    tenant = request.headers.get(TENANT_HEADER) if TENANT_HEADER else None
+    return tenant or request.remote_addr or "anonymous"
+
+
+def task_priority(base: int, queued: int) -> int:
+    """Priority step of a task submitted after queued pages of its tenant."""
+    return min(base + queued // FAIR_SHARE_PAGES, 9)
+
+
+def dequeue_pages(tenant: str, pages: int):
+    if tenant and pages:
+        jobs.add_pages(tenant, -pages)
+
+
+def delivery_key(id: str) -> str:
+    return f"jobs/{id}.deliveries"
+
+
+def begin_delivery(task: Task, tenant: str, cost: int):
+    """
+    Count a delivery of a task, failing it after TASK_MAX_DELIVERIES.
+
+    A task is delivered again when its worker dies, so a document crashing
+    the worker would be retried forever. The count is removed once the
+    task returns or raises.
+    """
+    key = delivery_key(task.request.id)
+    deliveries = int(store.get(key)) + 1 if store.exists(key) else 1
+    if deliveries == 1:
+        dequeue_pages(tenant, cost)  # 重新投递时页数已经减去
+    if deliveries > TASK_MAX_DELIVERIES:
+        raise RuntimeError(f"Worker lost in all {deliveries - 1} deliveries")
+    store.put(key, str(deliveries).encode())
+
+
+@task_revoked.connect
+def release_revoked_pages(request=None, terminated=False, **kwargs):
+    # 运行中被终止的任务在开始时已经减去页数
+    if request is not None and not terminated:
+        dequeue_pages(request.kwargs.get("tenant"), request.kwargs.get("cost", 0))
+
+
+class RevokedEvent:
+    """Cancellation event of a task, set once its worker receives the revocation."""
+
+    def __init__(self, id: str):
+        self.id = id
+
+    def is_set(self) -> bool:
+        # 线程执行池无法终止任务，翻译过程轮询撤销记录后自行退出
+        return self.id in worker_state.revoked
+
+
+def progress_bar(task: Task, profiler: MetricsProfiler, job: str = None, shard=None):
+    job = job or task.request.id
+    published = set()
+
+    def callback(t: tqdm.tqdm):
+        task.update_state(state="PROGRESS", meta={"n": t.n, "total": t.total})
+        print(f"Translating {t.n} / {t.total} pages")
+        profiler.flush()
+        # 推送已完成页面的各阶段耗时，回调在每页开始前调用
+        report = profiler.report()
+        pages = {k: v for k, v in report["pages"].items() if k not in published}
+        published.update(pages)
+        data = {"n": t.n, "total": t.total, "pages": pages, "stages": profiler.totals()}
+        if shard is not None:
+            data["shard"] = shard
+        events.publish(job, "progress", data)
+
+    return callback
+
+
 @celery_app.task(bind=True)
 def translate_task(
     self: Task,
-    stream: bytes,
+    input_key: str,
     args: dict,
+    tenant: str = None,
+    cost: int = 0,
 ):
-    def progress_bar(t: tqdm.tqdm):
-        self.update_state(state="PROGRESS", meta={"n": t.n, "total": t.total})  # noqa
-        print(f"Translating {t.n} / {t.total} pages")
+    profiler = MetricsProfiler(metrics, args.get("service", "").split(":", 1)[0])
+    try:
+        begin_delivery(self, tenant, cost)
+        stream = store.get(input_key)
+        doc_mono, doc_dual = translate_stream(
+            stream,
+            callback=progress_bar(self, profiler),
+            cancellation_event=RevokedEvent(self.request.id),
+            checkpoint=task_checkpoint(self, stream, cost, args),
+            model=ModelInstance.value,
+            profiler=profiler,
+            **args,
+        )
+    except BaseException:
+        metrics.inc("pdf2zh_tasks_total", state="failure")
+        raise
+    finally:
+        profiler.flush()
+        store.delete(delivery_key(self.request.id))
+    events.publish(self.request.id, "profile", profiler.report())
+    keys = save_results(self.request.id, doc_mono, doc_dual)
+    store.delete(f"jobs/{self.request.id}.json")
+    metrics.inc("pdf2zh_tasks_total", state="success")
+    return keys
+
+
+@celery_app.task(bind=True)
+def translate_shard_task(
+    self: Task,
+    input_key: str,
+    args: dict,
+    pages: list[int],
+    tenant: str = None,
+    cost: int = 0,
+):
+    profiler = MetricsProfiler(metrics, args.get("service", "").split(":", 1)[0])
+    job, _, index = self.request.id.rpartition("-")  # 分片任务 id 为 {id}-{i}
+    try:
+        begin_delivery(self, tenant, cost)
+        stream = store.get(input_key)
+        checkpoint = task_checkpoint(self, stream, len(pages), args)
+        shard = translate_shard(
+            stream,
+            pages,
+            callback=progress_bar(self, profiler, job, int(index)),
+            cancellation_event=RevokedEvent(self.request.id),
+            checkpoint=checkpoint,
+            model=ModelInstance.value,
+            profiler=profiler,
+            **args,
+        )
+    finally:
+        profiler.flush()
+        store.delete(delivery_key(self.request.id))
+    key = f"shards/{self.request.id}.json"
+    store.put(key, json.dumps(shard).encode())
+    if checkpoint:
+        checkpoint.clear()
+    events.publish(job, "profile", {**profiler.report(), "shard": int(index)})
+    events.publish(job, "shard", {"shard": int(index), "pages": pages})
+    return key
+
+
+@celery_app.task(bind=True)
+def merge_task(self: Task, shard_keys: list[str], input_key: str, args: dict):
+    try:
+        shards = [json.loads(store.get(key)) for key in shard_keys]
+        doc_mono, doc_dual = merge_shards(
+            store.get(input_key), shards, args.get("lang_out", "")
+        )
+    except BaseException:
+        metrics.inc("pdf2zh_tasks_total", state="failure")
+        raise
+    keys = save_results(self.request.id, doc_mono, doc_dual)
+    for key in shard_keys + [f"jobs/{self.request.id}.json"]:
+        store.delete(key)
+    metrics.inc("pdf2zh_tasks_total", state="success")
+    return keys
+
+
+@celery_app.task
+def expire_blobs() -> dict:
+    """Delete results and intermediate blobs older than the results of Celery."""
+    removed = {
+        prefix: store.expire(prefix, result_ttl()) for prefix in EXPIRING_PREFIXES
+    }
+    log.info(f"Expired blobs: {removed}")
+    return removed
 
-    doc_mono, doc_dual = translate_stream(
-        stream,
-        callback=progress_bar,
-        model=ModelInstance.value,
-        **args,
-    )
-    return doc_mono, doc_dual
+
+celery_app.conf.beat_schedule = {
+    "expire-blobs": {"task": expire_blobs.name, "schedule": EXPIRE_INTERVAL}
+}
+
+
+@task_success.connect
+def publish_success(sender: Task = None, **kwargs):
+    # 结果写入后端之后才发送，客户端收到后即可下载
+    if sender.name in (translate_task.name, merge_task.name):
+        publish_state(sender.request.id, "SUCCESS")
+
+
+@task_failure.connect
+def publish_failure(sender: Task = None, task_id: str = None, **kwargs):
+    if sender.name == translate_shard_task.name:
+        task_id = task_id.rpartition("-")[0]  # 分片失败即整个任务失败
+    publish_state(task_id, "FAILURE")
 
 
 @flask_app.route("/v1/translate", methods=["POST"])
 def create_translate_tasks():
     file = request.files["file"]
-    stream = file.stream.read()
     print(request.form.get("data"))
     args = json.loads(request.form.get("data"))
-    task = translate_task.delay(stream, args)
-    return {"id": task.id}
+    # 优先级不影响译文，不参与任务去重
+    priority = args.pop("priority", "normal")
+    if priority not in PRIORITIES:
+        return {"error": f"priority must be one of {', '.join(PRIORITIES)}"}, 400
+    # 分块计算哈希，按内容寻址，重复上传的文件只存一份
+    sha256 = hashlib.sha256()
+    for chunk in iter(lambda: file.stream.read(CHUNK_SIZE), b""):
+        sha256.update(chunk)
+    metrics.inc("pdf2zh_bytes_in_total", file.stream.tell())
+    digest = sha256.hexdigest()
+    try:
+        with Document(file.stream.name) as doc:
+            page_count = doc.page_count
+    except FileDataError:
+        return {"error": "file is not a valid PDF"}, 400
+    input_key = f"inputs/{digest}.pdf"
+    # 再次提交的文件重新计时，不会在新任务完成前过期
+    if not store.touch(input_key):
+        file.stream.seek(0)
+        store.put(input_key, file.stream)
+    # 同一文件和参数的任务共用已有的任务，每次提交各自得到一个 id
+    job_key = hashlib.sha256(
+        (digest + json.dumps(args, sort_keys=True)).encode()
+    ).hexdigest()
+    ttl = result_ttl()  # 与任务结果一同过期
+    id = uuid()
+    owner = jobs.claim(job_key, id, ttl)
+    if owner != id:
+        if job_alive(owner) and jobs.hold(owner, id, ttl):
+            metrics.inc("pdf2zh_deduplicated_total")
+            return {"id": id}
+        jobs.set(job_key, id, ttl)
+    try:
+        submit_task(id, input_key, page_count, args, tenant_id(), PRIORITIES[priority])
+    except Exception:
+        # 提交失败的任务不能被之后相同的提交共用
+        jobs.release(id)
+        store.delete(f"jobs/{id}.json")
+        raise
+    return {"id": id}
+
+
+def submit_task(
+    id: str,
+    input_key: str,
+    page_count: int,
+    args: dict,
+    tenant: str = None,
+    priority: int = PRIORITIES["normal"],
+):
+    shards = split_pages(page_count, args.get("pages"), SHARD_PAGES)
+    total = sum(len(pages) for pages in shards)
+    queue = FAST_QUEUE if total <= FAST_LANE_PAGES else BULK_QUEUE
+    # 按页计算公平份额：租户排队的页越多，后续页的优先级越低
+    queued = jobs.add_pages(tenant, total) - total if tenant else 0
+    if len(shards) <= 1:
+        # 排队中的任务在 Celery 中没有记录，由此区分未知的 id
+        store.put(f"jobs/{id}.json", b"{}")
+        translate_task.apply_async(
+            (input_key, args),
+            {"tenant": tenant, "cost": total},
+            task_id=id,
+            queue=queue,
+            priority=task_priority(priority, queued),
+        )
+        return
+    # 各分片并行翻译，全部完成后由 merge_task 合并，任务 id 即合并任务的 id
+    shard_args = {k: v for k, v in args.items() if k != "pages"}
+    store.put(
+        f"jobs/{id}.json", json.dumps({"shards": [len(p) for p in shards]}).encode()
+    )
+    header = []
+    for i, pages in enumerate(shards):
+        header.append(
+            translate_shard_task.s(
+                input_key, shard_args, pages, tenant=tenant, cost=len(pages)
+            ).set(
+                task_id=f"{id}-{i}",
+                queue=queue,
+                priority=task_priority(priority, queued),
+            )
+        )
+        queued += len(pages)
+    # 合并很快，尽早释放已完成的分片
+    chord(header)(
+        merge_task.s(input_key, args).set(task_id=id, queue=queue, priority=0)
+    )
 
 
 @flask_app.route("/v1/translate/<id>", methods=["GET"])
 def get_translate_task(id: str):
-    result: AsyncResult = celery_app.AsyncResult(id)
-    if str(result.state) == "PROGRESS":
-        return {"state": str(result.state), "info": result.info}
-    else:
-        return {"state": str(result.state)}
+    return task_status(jobs.resolve(id))
+
+
+def sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@flask_app.route("/v1/translate/<id>/events")
+def stream_translate_task(id: str):
+    job = jobs.resolve(id)
+    if celery_app.AsyncResult(job).state == "PENDING" and not store.exists(
+        f"jobs/{job}.json"
+    ):
+        return {"error": "task not found"}, 404
+
+    def generate():
+        # 先订阅再读取当前状态，两者之间的事件不会丢失
+        with events.subscribe(job) as subscriber:
+            status = task_status(job)
+            yield sse("status", status)
+            if status["state"] in READY_STATES:
+                return
+            shards = shard_counts(job)
+            while True:
+                try:
+                    message = subscriber.get(timeout=HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    # 长时间没有事件时确认任务仍在进行，防止 worker 退出后一直等待
+                    state = str(celery_app.AsyncResult(job).state)
+                    if state in READY_STATES:
+                        yield sse("state", {"state": state})
+                        return
+                    yield ": keep-alive\n\n"
+                    continue
+                event, data = message["event"], message["data"]
+                if event == "resync":
+                    # 事件订阅重连期间可能错过了事件，重新读取状态
+                    status = task_status(job)
+                    yield sse("status", status)
+                    if status["state"] in READY_STATES:
+                        return
+                    shards = shard_counts(job)
+                    continue
+                if event == "progress" and "shard" in data:
+                    # 分片任务汇总各分片的进度
+                    shards = shards or shard_counts(job)
+                    if shards is not None:
+                        sizes, counts = shards
+                        counts[data["shard"]] = data["n"]
+                        data = {**data, "n": sum(counts), "total": sum(sizes)}
+                if "files" in data:
+                    data = {**data, "files": file_urls(id)}
+                yield sse(event, data)
+                if event == "state":
+                    return
+
+    return Response(
+        generate(),
+        content_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @flask_app.route("/v1/translate/<id>", methods=["DELETE"])
 def delete_translate_task(id: str):
-    result: AsyncResult = celery_app.AsyncResult(id)
+    # 其他提交仍在使用的任务只释放这个 id，最后一个 id 删除时才撤销任务
+    job, remaining = jobs.release(id)
+    result: AsyncResult = celery_app.AsyncResult(job)
+    if remaining:
+        return {"state": str(result.state)}
     result.revoke(terminate=True)
+    if store.exists(f"jobs/{job}.json"):
+        sizes = json.loads(store.get(f"jobs/{job}.json")).get("shards", [])
+        for i in range(len(sizes)):
+            celery_app.AsyncResult(f"{job}-{i}").revoke(terminate=True)
+            store.delete(f"shards/{job}-{i}.json")
+        store.delete(f"jobs/{job}.json")
+    for format in ["mono", "dual"]:
+        store.delete(result_key(job, format))
+    publish_state(job, "REVOKED")
     return {"state": str(result.state)}
 
 
 @flask_app.route("/v1/translate/<id>/<format>")
 def get_translate_result(id: str, format: str):
-    result = celery_app.AsyncResult(id)
+    result = celery_app.AsyncResult(jobs.resolve(id))
     if not result.ready():
         return {"error": "task not finished"}, 400
     if not result.successful():
         return {"error": "task failed"}, 400
-    doc_mono, doc_dual = result.get()
-    to_send = doc_mono if format == "mono" else doc_dual
-    return send_file(io.BytesIO(to_send), "application/pdf")
+    key = result.get()["mono" if format == "mono" else "dual"]
+    if not store.exists(key):
+        # 译文可能先于 Celery 的任务结果被清理
+        return {"error": "result expired"}, 410
+    if not isinstance(store, LocalBlobStore):
+        # 客户端直接从对象存储下载，同样支持 Range 续传
+        metrics.inc("pdf2zh_bytes_out_total", store.size(key))
+        return redirect(store.url(key))
+    # 分块发送，支持 Range、If-Range 和 ETag，可以断点续传
+    response = send_file(
+        store.path(key),
+        "application/pdf",
+        download_name=f"{id}-{format}.pdf",
+        conditional=True,
+    )
+    metrics.inc("pdf2zh_bytes_out_total", response.content_length or 0)
+    return response
+
+
+@flask_app.route("/v1/queue")
+def get_queue():
+    tenant = tenant_id()
+    depths = {queue: queue_depth(queue) for queue in (FAST_QUEUE, BULK_QUEUE)}
+    return {
+        # broker 不可用时为 null
+        "queues": {k: None if math.isnan(v) else v for k, v in depths.items()},
+        "tenant": {"id": tenant, "pages": jobs.queued_pages(tenant)},
+    }
+
+
+@flask_app.route("/metrics")
+def get_metrics():
+    depth = queue_depth(BULK_QUEUE) + queue_depth(FAST_QUEUE)
+    gauges = {"pdf2zh_queue_depth": ("Tasks waiting in the queues.", depth)}
+    return Response(
+        metrics.render(gauges), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,95 @@
+import hashlib
+import io
+import json
+from string import Template
+from typing import Optional
+
+import numpy as np
+
+from pdf2zh.storage import open_store
+
+# 影响译文的参数，参与检查点的 key
+PARAMS = (
+    "lang_in",
+    "lang_out",
+    "service",
+    "vfont",
+    "vchar",
+    "envs",
+    "prompt",
+    "user_glossary",
+)
+
+
+class Checkpoint:
+    """
+    Finished pages of a translation, to resume it after the process died.
+
+    A page is stored as the patch of its content stream and of the objects
+    it changed, like the pages of translate_shard, and its layout is stored
+    once inferred. Both are kept in a blob store, so any process sharing the
+    store can resume the translation.
+    """
+
+    def __init__(self, key: str, store=None):
+        self.key = key
+        self.store = store or open_store()
+        self.keys = set()  # 读写过的 blob，完成后删除
+
+    @classmethod
+    def of(
+        cls, stream: bytes, store=None, task_id: str = None, **kwarg
+    ) -> "Checkpoint":
+        """
+        Checkpoint of a document and the parameters of translate_stream.
+
+        Tasks running at the same time pass their task_id, so that each of
+        them resumes its own pages.
+        """
+        from pdf2zh import __version__
+
+        params = {"version": __version__}
+        if task_id:
+            params["task_id"] = task_id
+        for name in PARAMS:
+            value = kwarg.get(name)
+            params[name] = value.template if isinstance(value, Template) else value
+        digest = hashlib.sha256(stream)
+        digest.update(json.dumps(params, sort_keys=True, default=str).encode())
+        return cls(digest.hexdigest(), store)
+
+    def blob(self, kind: str, pageno: int) -> str:
+        key = f"checkpoints/{self.key}/{kind}/{pageno}"
+        self.keys.add(key)
+        return key
+
+    def page(self, pageno: int) -> Optional[dict]:
+        """The patches of a finished page, {"contents": ops, "objects": {xref: ops}}."""
+        key = self.blob("pages", pageno)
+        if not self.store.exists(key):
+            return None
+        self.blob("layouts", pageno)  # 恢复的页面不再读取版面，也要一并删除
+        return json.loads(self.store.get(key))
+
+    def save_page(self, pageno: int, contents: str, objects: dict):
+        data = {"contents": contents, "objects": objects}
+        self.store.put(self.blob("pages", pageno), json.dumps(data).encode())
+
+    def layout(self, pageno: int) -> Optional[np.ndarray]:
+        key = self.blob("layouts", pageno)
+        if not self.store.exists(key):
+            return None
+        with np.load(io.BytesIO(self.store.get(key)), allow_pickle=False) as data:
+            return data["layout"]
+
+    def save_layout(self, pageno: int, layout: np.ndarray):
+        # 版面是大片相同值的掩码，压缩后很小
+        stream = io.BytesIO()
+        np.savez_compressed(stream, layout=layout)
+        self.store.put(self.blob("layouts", pageno), stream.getvalue())
+
+    def clear(self):
+        """Delete the pages used by this checkpoint, once the translation is done."""
+        for key in self.keys:
+            self.store.delete(key)
+        self.keys.clear()
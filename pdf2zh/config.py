@@ -63,18 +63,21 @@ class ConfigManager:
         """递归移除循环引用"""
         if seen is None:
             seen = set()
+        if not isinstance(obj, (dict, list)):
+            return obj  # 相同的数字、字符串可能是同一个对象，不是循环引用
         obj_id = id(obj)
         if obj_id in seen:
-            return None  # 遇到已处理过的对象，视为循环引用
+            return None  # 遇到正在处理的上层对象，视为循环引用
         seen.add(obj_id)
 
         if isinstance(obj, dict):
-            return {
+            result = {
                 k: self._remove_circular_references(v, seen) for k, v in obj.items()
             }
-        elif isinstance(obj, list):
-            return [self._remove_circular_references(i, seen) for i in obj]
-        return obj
+        else:
+            result = [self._remove_circular_references(i, seen) for i in obj]
+        seen.discard(obj_id)
+        return result
 
     @classmethod
     def custome_config(cls, file_path):
@@ -1,8 +1,6 @@
 from typing import Dict
-from enum import Enum
 
 from pdfminer.pdfinterp import PDFGraphicState, PDFResourceManager
-from pdfminer.pdffont import PDFCIDFont
 from pdfminer.converter import PDFConverter
 from pdfminer.pdffont import PDFUnicodeNotDefined
 from pdfminer.utils import apply_matrix_pt, mult_matrix
@@ -15,8 +13,9 @@ from pdfminer.layout import (
 import logging
 import re
 import concurrent.futures
-import numpy as np
+import time
 import unicodedata
+from asyncio import CancelledError
 from string import Template
 from tenacity import retry, wait_fixed
 from pdf2zh.translator import (
@@ -47,9 +46,63 @@ from pdf2zh.translator import (
     QwenMtTranslator,
 )
 from pymupdf import Font
+from pdf2zh.fontcache import GlyphMetrics, PDFFontMetrics
+from pdf2zh.profiler import Profiler, stage
+from pdf2zh.typesetter import (
+    DEFAULT_LINE_HEIGHT,
+    LANG_LINEHEIGHT_MAP,
+    Paragraph,
+    Typesetter,
+)
 
 log = logging.getLogger(__name__)
 
+# latex 字体
+LATEX_FONT_RE = re.compile(
+    r"(CM[^R]|MS.M|XY|MT|BL|RM|EU|LA|RS|LINE|LCIRCLE|TeX-|rsfs|txsy|wasy|stmary|.*Mono|.*Code|.*Ital|.*Sym|.*Math)"
+)
+# 文字修饰符、数学符号、分隔符号
+FORMULA_CATEGORIES = frozenset(["Lm", "Mn", "Sk", "Sm", "Zl", "Zp", "Zs"])
+# 等待翻译结果和重试时检查取消的间隔
+CANCEL_POLL_SECONDS = 0.1
+
+
+def is_cancelled(cancellation_event) -> bool:
+    return bool(cancellation_event and cancellation_event.is_set())
+
+
+def cancellable_sleep(cancellation_event, seconds: float):
+    """Sleep for seconds, returning early once the event is set."""
+    deadline = time.monotonic() + seconds
+    while not is_cancelled(cancellation_event) and time.monotonic() < deadline:
+        time.sleep(min(CANCEL_POLL_SECONDS, max(deadline - time.monotonic(), 0)))
+
+
+def gather(futures: list, cancellation_event=None) -> list:
+    """
+    Results of futures in order, raising CancelledError as soon as the event is set.
+
+    Futures not started yet are cancelled when the results are abandoned,
+    so a shared executor moves on to other work.
+    """
+    try:
+        pending = futures
+        while pending:
+            if is_cancelled(cancellation_event):
+                raise CancelledError("task cancelled")
+            done, pending = concurrent.futures.wait(
+                pending,
+                timeout=CANCEL_POLL_SECONDS,
+                return_when=concurrent.futures.FIRST_EXCEPTION,
+            )
+            for f in done:
+                if not f.cancelled() and f.exception():
+                    raise f.exception()
+        return [f.result() for f in futures]
+    finally:
+        for f in futures:
+            f.cancel()
+
 
 class PDFConverterEx(PDFConverter):
     def __init__(
@@ -95,42 +148,87 @@ class PDFConverterEx(PDFConverter):
         ncs,
         graphicstate: PDFGraphicState,
     ) -> float:
-        # 重载设置 cid 和 font
+        # 重载使用精简的字符记录，只保留 receive_layout 需要的属性
         try:
             text = font.to_unichr(cid)
             assert isinstance(text, str), str(type(text))
         except PDFUnicodeNotDefined:
             text = self.handle_undefined_char(font, cid)
-        textwidth = font.char_width(cid)
-        textdisp = font.char_disp(cid)
-        item = LTChar(
-            matrix,
-            font,
-            fontsize,
-            scaling,
-            rise,
-            text,
-            textwidth,
-            textdisp,
-            ncs,
-            graphicstate,
-        )
+        item = CharRecord(matrix, font, fontsize, scaling, rise, cid, text)
         self.cur_item.add(item)
-        item.cid = cid  # hack 插入原字符编码
-        item.font = font  # hack 插入原字符字体
         return item.adv
 
 
-class Paragraph:
-    def __init__(self, y, x, x0, x1, y0, y1, size, brk):
-        self.y: float = y  # 初始纵坐标
-        self.x: float = x  # 初始横坐标
-        self.x0: float = x0  # 左边界
-        self.x1: float = x1  # 右边界
-        self.y0: float = y0  # 上边界
-        self.y1: float = y1  # 下边界
-        self.size: float = size  # 字体大小
-        self.brk: bool = brk  # 换行标记
+class CharRecord:
+    """Glyph record kept instead of a full LTChar while a page is parsed.
+
+    The bounding box is computed the same way as LTChar, but color spaces,
+    graphic state and the rest of the pdfminer layout machinery are dropped.
+    """
+
+    __slots__ = (
+        "x0",
+        "y0",
+        "x1",
+        "y1",
+        "size",
+        "adv",
+        "cid",
+        "font",
+        "fontname",
+        "matrix",
+        "_text",
+    )
+
+    def __init__(
+        self,
+        matrix,
+        font,
+        fontsize: float,
+        scaling: float,
+        rise: float,
+        cid: int,
+        text: str,
+    ) -> None:
+        self._text = text
+        self.matrix = matrix
+        self.cid = cid  # 原字符编码
+        self.font = font  # 原字符字体
+        self.fontname = font.fontname
+        self.adv = font.char_width(cid) * fontsize * scaling
+        if font.is_vertical():
+            vx, vy = font.char_disp(cid)
+            if vx is None:
+                vx = fontsize * 0.5
+            else:
+                vx = vx * fontsize * 0.001
+            vy = (1000 - vy) * fontsize * 0.001
+            px0, py0 = (-vx, vy + rise + self.adv)
+            px1, py1 = (-vx + fontsize, vy + rise)
+        else:
+            descent = font.get_descent() * fontsize
+            px0, py0 = (0, descent + rise)
+            px1, py1 = (self.adv, descent + rise + fontsize)
+        a, b, c, d, e, f = matrix
+        x0, y0 = a * px0 + c * py0 + e, b * px0 + d * py0 + f
+        x1, y1 = a * px1 + c * py1 + e, b * px1 + d * py1 + f
+        if x1 < x0:
+            x0, x1 = (x1, x0)
+        if y1 < y0:
+            y0, y1 = (y1, y0)
+        self.x0, self.y0, self.x1, self.y1 = x0, y0, x1, y1
+        self.size = x1 - x0 if font.is_vertical() else y1 - y0
+
+    @property
+    def width(self) -> float:
+        return self.x1 - self.x0
+
+    @property
+    def height(self) -> float:
+        return self.y1 - self.y0
+
+    def get_text(self) -> str:
+        return self._text
 
 
 # fmt: off
@@ -150,14 +248,27 @@ class TranslateConverter(PDFConverterEx):
         envs: Dict = None,
         prompt: Template = None,
         user_glossary: list[dict] = None,  # 新增词库参数
+        profiler: Profiler = None,
+        executor: concurrent.futures.Executor = None,
+        cancellation_event=None,
     ) -> None:
         super().__init__(rsrcmgr)
         self.vfont = vfont
         self.vchar = vchar
+        self.vfont_re = re.compile(vfont) if vfont else None
+        self.vchar_re = re.compile(vchar) if vchar else None
+        self.font_vflag: Dict[object, bool] = {}    # 字体名 -> 是否公式字体
+        self.char_vflag: Dict[str, bool] = {}       # 字符 -> 是否公式字符
         self.thread = thread
+        self.executor = executor    # 多个文档共用的翻译线程池，为空时每页新建
+        self.cancellation_event = cancellation_event
         self.layout = layout
         self.noto_name = noto_name
         self.noto = noto
+        self.noto_metrics = GlyphMetrics.of(noto) if noto else None
+        self.font_metrics: Dict[object, PDFFontMetrics] = {}
+        self.fontmap: Dict[object, object] = {}  # 由解释器在每页结束前设置
+        self.fontid: Dict[object, object] = {}
         self.translator: BaseTranslator = None
         param = service.split(":", 1)
         service_name = param[0]
@@ -177,6 +288,39 @@ class TranslateConverter(PDFConverterEx):
                 )
         if not self.translator:
             raise ValueError("Unsupported translation service")
+        self.profiler = profiler
+        self.translator.profiler = profiler
+
+    def get_font_metrics(self, font) -> PDFFontMetrics:
+        metrics = self.font_metrics.get(font)
+        if metrics is None:
+            metrics = self.font_metrics[font] = PDFFontMetrics(font)
+        return metrics
+
+    def is_formula_font(self, font: str) -> bool:
+        # 基于字体名规则的判定
+        if isinstance(font, bytes):     # 不一定能 decode，直接转 str
+            try:
+                font = font.decode('utf-8')  # 尝试使用 UTF-8 解码
+            except UnicodeDecodeError:
+                font = ""
+        font = font.split("+")[-1]      # 字体名截断
+        if self.vfont_re:
+            return bool(self.vfont_re.match(font))
+        return bool(LATEX_FONT_RE.match(font))
+
+    def is_formula_char(self, char: str) -> bool:
+        # 基于字符集规则的判定
+        if self.vchar_re:
+            return bool(self.vchar_re.match(char))
+        return bool(
+            char
+            and char != " "                                     # 非空格
+            and (
+                unicodedata.category(char[0]) in FORMULA_CATEGORIES   # 文字修饰符、数学符号、分隔符号
+                or 0x370 <= ord(char[0]) < 0x400                # 希腊字母
+            )
+        )
 
     def receive_layout(self, ltpage: LTPage):
         # 段落
@@ -184,67 +328,44 @@ class TranslateConverter(PDFConverterEx):
         pstk: list[Paragraph] = []      # 段落属性栈
         vbkt: int = 0                   # 段落公式括号计数
         # 公式组
-        vstk: list[LTChar] = []         # 公式符号组
+        vstk: list[CharRecord] = []     # 公式符号组
         vlstk: list[LTLine] = []        # 公式线条组
         vfix: float = 0                 # 公式纵向偏移
         # 公式组栈
-        var: list[list[LTChar]] = []    # 公式符号组栈
+        var: list[list[CharRecord]] = []    # 公式符号组栈
         varl: list[list[LTLine]] = []   # 公式线条组栈
         varf: list[float] = []          # 公式纵向偏移栈
         vlen: list[float] = []          # 公式宽度栈
         # 全局
         lstk: list[LTLine] = []         # 全局线条栈
-        xt: LTChar = None               # 上一个字符
+        xt: CharRecord = None           # 上一个字符
         xt_cls: int = -1                # 上一个字符所属段落，保证无论第一个字符属于哪个类别都可以触发新段落
         vmax: float = ltpage.width / 4  # 行内公式最大宽度
         ops: str = ""                   # 渲染结果
 
         def vflag(font: str, char: str):    # 匹配公式（和角标）字体
-            if isinstance(font, bytes):     # 不一定能 decode，直接转 str
-                try:
-                    font = font.decode('utf-8')  # 尝试使用 UTF-8 解码
-                except UnicodeDecodeError:
-                    font = ""
-            font = font.split("+")[-1]      # 字体名截断
-            if re.match(r"\(cid:", char):
+            if char.startswith("(cid:"):
                 return True
-            # 基于字体名规则的判定
-            if self.vfont:
-                if re.match(self.vfont, font):
-                    return True
-            else:
-                if re.match(                                            # latex 字体
-                    r"(CM[^R]|MS.M|XY|MT|BL|RM|EU|LA|RS|LINE|LCIRCLE|TeX-|rsfs|txsy|wasy|stmary|.*Mono|.*Code|.*Ital|.*Sym|.*Math)",
-                    font,
-                ):
-                    return True
-            # 基于字符集规则的判定
-            if self.vchar:
-                if re.match(self.vchar, char):
-                    return True
-            else:
-                if (
-                    char
-                    and char != " "                                     # 非空格
-                    and (
-                        unicodedata.category(char[0])
-                        in ["Lm", "Mn", "Sk", "Sm", "Zl", "Zp", "Zs"]   # 文字修饰符、数学符号、分隔符号
-                        or ord(char[0]) in range(0x370, 0x400)          # 希腊字母
-                    )
-                ):
-                    return True
-            return False
+            flag = self.font_vflag.get(font)
+            if flag is None:
+                flag = self.font_vflag[font] = self.is_formula_font(font)
+            if flag:
+                return True
+            flag = self.char_vflag.get(char)
+            if flag is None:
+                flag = self.char_vflag[char] = self.is_formula_char(char)
+            return flag
 
         ############################################################
         # A. 原文档解析
         for child in ltpage:
-            if isinstance(child, LTChar):
+            if isinstance(child, (CharRecord, LTChar)):
                 cur_v = False
                 layout = self.layout[ltpage.pageid]
                 # ltpage.height 可能是 fig 里面的高度，这里统一用 layout.shape
                 h, w = layout.shape
                 # 读取当前字符在 layout 中的类别
-                cx, cy = np.clip(int(child.x0), 0, w - 1), np.clip(int(child.y0), 0, h - 1)
+                cx, cy = min(max(int(child.x0), 0), w - 1), min(max(int(child.y0), 0), h - 1)
                 cls = layout[cy, cx]
                 # 锚定文档中 bullet 的位置
                 if child.get_text() == "•":
@@ -332,7 +453,7 @@ class TranslateConverter(PDFConverterEx):
                 # ltpage.height 可能是 fig 里面的高度，这里统一用 layout.shape
                 h, w = layout.shape
                 # 读取当前线条在 layout 中的类别
-                cx, cy = np.clip(int(child.x0), 0, w - 1), np.clip(int(child.y0), 0, h - 1)
+                cx, cy = min(max(int(child.x0), 0), w - 1), min(max(int(child.y0), 0), h - 1)
                 cls = layout[cy, cx]
                 if vstk and cls == xt_cls:      # 公式线条
                     vlstk.append(child)
@@ -356,10 +477,13 @@ class TranslateConverter(PDFConverterEx):
         # B. 段落翻译
         log.debug("\n==========[SSTACK]==========\n")
 
-        @retry(wait=wait_fixed(1))
+        # 失败后一直重试，取消时立即停止等待，下一次尝试抛出 CancelledError
+        @retry(wait=wait_fixed(1), sleep=lambda t: cancellable_sleep(self.cancellation_event, t))
         def worker(s: str):  # 多线程翻译
             if not s.strip() or re.match(r"^\{v\d+\}$", s):  # 空白和公式不翻译
                 return s
+            if is_cancelled(self.cancellation_event):
+                raise CancelledError("task cancelled")
             try:
                 new = self.translator.translate(s)
                 return new
@@ -369,177 +493,44 @@ class TranslateConverter(PDFConverterEx):
                 else:
                     log.exception(e, exc_info=False)
                 raise e
-        with concurrent.futures.ThreadPoolExecutor(
-            max_workers=self.thread
-        ) as executor:
-            news = list(executor.map(worker, sstk))
+        with stage(self.profiler, "translate", ltpage.pageid):
+            executor = self.executor or concurrent.futures.ThreadPoolExecutor(max_workers=self.thread)
+            try:
+                news = gather([executor.submit(worker, s) for s in sstk], self.cancellation_event)
+            except CancelledError:
+                self.translator.close()  # 断开连接，不再等待进行中的请求
+                raise
+            finally:
+                if executor is not self.executor:
+                    executor.shutdown(wait=False)
 
         ############################################################
         # C. 新文档排版
-        def raw_string(fcur: str, cstk: str):  # 编码字符串
-            if fcur == self.noto_name:
-                return "".join(["%04x" % self.noto.has_glyph(ord(c)) for c in cstk])
-            elif isinstance(self.fontmap[fcur], PDFCIDFont):  # 判断编码长度
-                return "".join(["%04x" % ord(c) for c in cstk])
-            else:
-                return "".join(["%02x" % ord(c) for c in cstk])
-
-        # 根据目标语言获取默认行距
-        LANG_LINEHEIGHT_MAP = {
-            "zh-cn": 1.4, "zh-tw": 1.4, "zh-hans": 1.4, "zh-hant": 1.4, "zh": 1.4,
-            "ja": 1.1, "ko": 1.2, "en": 1.2, "ar": 1.0, "ru": 0.8, "uk": 0.8, "ta": 0.8
-        }
-        default_line_height = LANG_LINEHEIGHT_MAP.get(self.translator.lang_out.lower(), 1.1) # 小语种默认1.1
-        _x, _y = 0, 0
-        ops_list = []
-
-        def gen_op_txt(font, size, x, y, rtxt):
-            return f"/{font} {size:f} Tf 1 0 0 1 {x:f} {y:f} Tm [<{rtxt}>] TJ "
-
-        def gen_op_line(x, y, xlen, ylen, linewidth):
-            return f"ET q 1 0 0 1 {x:f} {y:f} cm [] 0 d 0 J {linewidth:f} w 0 0 m {xlen:f} {ylen:f} l S Q BT "
-
-        for id, new in enumerate(news):
-            x: float = pstk[id].x                       # 段落初始横坐标
-            y: float = pstk[id].y                       # 段落初始纵坐标
-            x0: float = pstk[id].x0                     # 段落左边界
-            x1: float = pstk[id].x1                     # 段落右边界
-            height: float = pstk[id].y1 - pstk[id].y0   # 段落高度
-            size: float = pstk[id].size                 # 段落字体大小
-            brk: bool = pstk[id].brk                    # 段落换行标记
-            cstk: str = ""                              # 当前文字栈
-            fcur: str = None                            # 当前字体 ID
-            lidx = 0                                    # 记录换行次数
-            tx = x
-            fcur_ = fcur
-            ptr = 0
-            log.debug(f"< {y} {x} {x0} {x1} {size} {brk} > {sstk[id]} | {new}")
-
-            ops_vals: list[dict] = []
-
-            while ptr < len(new):
-                vy_regex = re.match(
-                    r"\{\s*v([\d\s]+)\}", new[ptr:], re.IGNORECASE
-                )  # 匹配 {vn} 公式标记
-                mod = 0  # 文字修饰符
-                if vy_regex:  # 加载公式
-                    ptr += len(vy_regex.group(0))
-                    try:
-                        vid = int(vy_regex.group(1).replace(" ", ""))
-                        adv = vlen[vid]
-                    except Exception:
-                        continue  # 翻译器可能会自动补个越界的公式标记
-                    if var[vid][-1].get_text() and unicodedata.category(var[vid][-1].get_text()[0]) in ["Lm", "Mn", "Sk"]:  # 文字修饰符
-                        mod = var[vid][-1].width
-                else:  # 加载文字
-                    ch = new[ptr]
-                    fcur_ = None
-                    try:
-                        if fcur_ is None and self.fontmap["tiro"].to_unichr(ord(ch)) == ch:
-                            fcur_ = "tiro"  # 默认拉丁字体
-                    except Exception:
-                        pass
-                    if fcur_ is None:
-                        fcur_ = self.noto_name  # 默认非拉丁字体
-                    if fcur_ == self.noto_name: # FIXME: change to CONST
-                        adv = self.noto.char_lengths(ch, size)[0]
-                    else:
-                        adv = self.fontmap[fcur_].char_width(ord(ch)) * size
-                    ptr += 1
-                if (                                # 输出文字缓冲区
-                    fcur_ != fcur                   # 1. 字体更新
-                    or vy_regex                     # 2. 插入公式
-                    or x + adv > x1 + 0.1 * size    # 3. 到达右边界（可能一整行都被符号化，这里需要考虑浮点误差）
-                ):
-                    if cstk:
-                        ops_vals.append({
-                            "type": OpType.TEXT,
-                            "font": fcur,
-                            "size": size,
-                            "x": tx,
-                            "dy": 0,
-                            "rtxt": raw_string(fcur, cstk),
-                            "lidx": lidx
-                        })
-                        cstk = ""
-                if brk and x + adv > x1 + 0.1 * size:  # 到达右边界且原文段落存在换行
-                    x = x0
-                    lidx += 1
-                if vy_regex:  # 插入公式
-                    fix = 0
-                    if fcur is not None:  # 段落内公式修正纵向偏移
-                        fix = varf[vid]
-                    for vch in var[vid]:  # 排版公式字符
-                        vc = chr(vch.cid)
-                        ops_vals.append({
-                            "type": OpType.TEXT,
-                            "font": self.fontid[vch.font],
-                            "size": vch.size,
-                            "x": x + vch.x0 - var[vid][0].x0,
-                            "dy": fix + vch.y0 - var[vid][0].y0,
-                            "rtxt": raw_string(self.fontid[vch.font], vc),
-                            "lidx": lidx
-                        })
-                        if log.isEnabledFor(logging.DEBUG):
-                            lstk.append(LTLine(0.1, (_x, _y), (x + vch.x0 - var[vid][0].x0, fix + y + vch.y0 - var[vid][0].y0)))
-                            _x, _y = x + vch.x0 - var[vid][0].x0, fix + y + vch.y0 - var[vid][0].y0
-                    for l in varl[vid]:  # 排版公式线条
-                        if l.linewidth < 5:  # hack 有的文档会用粗线条当图片背景
-                            ops_vals.append({
-                                "type": OpType.LINE,
-                                "x": l.pts[0][0] + x - var[vid][0].x0,
-                                "dy": l.pts[0][1] + fix - var[vid][0].y0,
-                                "linewidth": l.linewidth,
-                                "xlen": l.pts[1][0] - l.pts[0][0],
-                                "ylen": l.pts[1][1] - l.pts[0][1],
-                                "lidx": lidx
-                            })
-                else:  # 插入文字缓冲区
-                    if not cstk:  # 单行开头
-                        tx = x
-                        if x == x0 and ch == " ":  # 消除段落换行空格
-                            adv = 0
-                        else:
-                            cstk += ch
-                    else:
-                        cstk += ch
-                adv -= mod # 文字修饰符
-                fcur = fcur_
-                x += adv
-                if log.isEnabledFor(logging.DEBUG):
-                    lstk.append(LTLine(0.1, (_x, _y), (x, y)))
-                    _x, _y = x, y
-            # 处理结尾
-            if cstk:
-                ops_vals.append({
-                    "type": OpType.TEXT,
-                    "font": fcur,
-                    "size": size,
-                    "x": tx,
-                    "dy": 0,
-                    "rtxt": raw_string(fcur, cstk),
-                    "lidx": lidx
-                })
-
-            line_height = default_line_height
-
-            while (lidx + 1) * size * line_height > height and line_height >= 1:
-                line_height -= 0.05
-
-            for vals in ops_vals:
-                if vals["type"] == OpType.TEXT:
-                    ops_list.append(gen_op_txt(vals["font"], vals["size"], vals["x"], vals["dy"] + y - vals["lidx"] * size * line_height, vals["rtxt"]))
-                elif vals["type"] == OpType.LINE:
-                    ops_list.append(gen_op_line(vals["x"], vals["dy"] + y - vals["lidx"] * size * line_height, vals["xlen"], vals["ylen"], vals["linewidth"]))
-
-        for l in lstk:  # 排版全局线条
-            if l.linewidth < 5:  # hack 有的文档会用粗线条当图片背景
-                ops_list.append(gen_op_line(l.pts[0][0], l.pts[0][1], l.pts[1][0] - l.pts[0][0], l.pts[1][1] - l.pts[0][1], l.linewidth))
-
-        ops = f"BT {''.join(ops_list)}ET "
+        with stage(self.profiler, "typeset", ltpage.pageid):
+            default_line_height = LANG_LINEHEIGHT_MAP.get(self.translator.lang_out.lower(), DEFAULT_LINE_HEIGHT)
+            tiro = self.fontmap.get("tiro")
+            typesetter = Typesetter(
+                self.fontmap,
+                self.fontid,
+                self.noto_name,
+                self.noto_metrics,
+                self.get_font_metrics(tiro) if tiro is not None else None,
+                var,
+                varl,
+                varf,
+                vlen,
+                lstk if log.isEnabledFor(logging.DEBUG) else None,
+            )
+
+            for id, new in enumerate(news):
+                para = pstk[id]
+                log.debug(f"< {para.y} {para.x} {para.x0} {para.x1} {para.size} {para.brk} > {sstk[id]} | {new}")
+                items, size, line_height = typesetter.fit(para, new, default_line_height)
+                # 缩小字号时保持段落上边界不变
+                typesetter.render(items, para.y + para.size - size, size, line_height)
+
+            for l in lstk:  # 排版全局线条
+                typesetter.render_line(l)
+
+        ops = f"BT {''.join(typesetter.ops)}ET "
         return ops
-
-
-class OpType(Enum):
-    TEXT = "text"
-    LINE = "line"
@@ -1,5 +1,6 @@
 import abc
 import os.path
+import threading
 
 import cv2
 import numpy as np
@@ -13,16 +14,17 @@ from pdf2zh.config import ConfigManager
 
 class DocLayoutModel(abc.ABC):
     @staticmethod
-    def load_onnx():
+    def load_onnx(threads: int = 0):
         model = OnnxModel.from_pretrained(
             repo_id="wybxc/DocLayout-YOLO-DocStructBench-onnx",
             filename="doclayout_yolo_docstructbench_imgsz1024.onnx",
+            threads=threads,
         )
         return model
 
     @staticmethod
-    def load_available():
-        return DocLayoutModel.load_onnx()
+    def load_available(threads: int = 0):
+        return DocLayoutModel.load_onnx(threads)
 
     @property
     @abc.abstractmethod
@@ -47,10 +49,38 @@ class YoloResult:
     """Helper class to store detection results from ONNX model."""
 
     def __init__(self, boxes, names):
-        self.boxes = [YoloBox(data=d) for d in boxes]
-        self.boxes.sort(key=lambda x: x.conf, reverse=True)
+        data = np.asarray(boxes)
+        if data.size == 0:
+            data = data.reshape(0, 6)
+        # 按置信度从高到低排列，置信度相同时保持原有顺序
+        self.data = data[np.argsort(-data[:, -2], kind="stable")]
         self.names = names
 
+    @property
+    def xyxy(self):
+        return self.data[:, :4]
+
+    @property
+    def conf(self):
+        return self.data[:, -2]
+
+    @property
+    def cls(self):
+        return self.data[:, -1].astype(int)
+
+    @property
+    def boxes(self):
+        return [YoloBox(data=d) for d in self.data]
+
+    def class_ids(self, names):
+        """Ids of the classes with one of the given names."""
+        items = (
+            self.names.items()
+            if isinstance(self.names, dict)
+            else enumerate(self.names)
+        )
+        return [i for i, name in items if name in names]
+
 
 class YoloBox:
     """Helper class to store detection results from ONNX model."""
@@ -61,8 +91,35 @@ class YoloBox:
         self.cls = data[-1]
 
 
+def nms(boxes, scores, iou=0.7):
+    """
+    Greedy non-maximum suppression.
+
+    Args:
+        boxes: (N, 4) boxes in the format of (x1, y1, x2, y2).
+        scores: (N,) confidence of every box.
+        iou: Boxes overlapping a better one by more than this are dropped.
+
+    Returns:
+        Indices of the kept boxes, by decreasing score.
+    """
+    order = np.argsort(-scores, kind="stable")
+    boxes = boxes[order]
+    area = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    # 一次算出两两之间的交并比，再按置信度顺序贪心抑制
+    lt = np.maximum(boxes[:, None, :2], boxes[None, :, :2])
+    rb = np.minimum(boxes[:, None, 2:], boxes[None, :, 2:])
+    inter = np.prod(np.clip(rb - lt, 0, None), axis=2)
+    overlap = inter / np.maximum(area[:, None] + area[None, :] - inter, 1e-9) > iou
+    keep = np.ones(len(boxes), dtype=bool)
+    for i in range(len(boxes)):
+        if keep[i]:
+            keep[i + 1 :] &= ~overlap[i, i + 1 :]
+    return order[keep]
+
+
 class OnnxModel(DocLayoutModel):
-    def __init__(self, model_path: str):
+    def __init__(self, model_path: str, threads: int = 0):
         self.model_path = model_path
 
         model = onnx.load(model_path)
@@ -70,10 +127,15 @@ class OnnxModel(DocLayoutModel):
         self._stride = ast.literal_eval(metadata["stride"])
         self._names = ast.literal_eval(metadata["names"])
 
-        self.model = onnxruntime.InferenceSession(model.SerializeToString())
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = threads  # 0 表示由 onnxruntime 决定
+        self.model = onnxruntime.InferenceSession(
+            model.SerializeToString(), sess_options=options
+        )
+        self._buffers = threading.local()  # 每个线程复用一块模型输入内存
 
     @staticmethod
-    def from_pretrained(repo_id: str, filename: str):
+    def from_pretrained(repo_id: str, filename: str, threads: int = 0):
         if ConfigManager.get("USE_MODELSCOPE", "0") == "1":
             repo_mapping = {
                 # Edit here to add more models
@@ -85,7 +147,7 @@ class OnnxModel(DocLayoutModel):
             pth = os.path.join(model_dir, filename)
         else:
             pth = hf_hub_download(repo_id=repo_id, filename=filename, etag_timeout=1)
-        return OnnxModel(pth)
+        return OnnxModel(pth, threads)
 
     @property
     def stride(self):
@@ -157,23 +219,82 @@ class OnnxModel(DocLayoutModel):
         boxes[..., :4] = (boxes[..., :4] - [pad_x, pad_y, pad_x, pad_y]) / gain
         return boxes
 
+    def input_buffer(self, height, width):
+        """Float32 BCHW buffer of this thread, reallocated only when the size changes."""
+        buffer = getattr(self._buffers, "value", None)
+        if buffer is None or buffer.shape[2:] != (height, width):
+            buffer = np.empty((1, 3, height, width), dtype=np.float32)
+            self._buffers.value = buffer
+        return buffer
+
+    def preprocess(self, image, imgsz=1024):
+        """
+        Turn an HWC uint8 image into the normalized BCHW float32 model input.
+
+        The channel order, normalization and layout change are written in one
+        pass into a buffer that is reused by the next call on the same thread.
+        """
+        swap = image.ndim == 3 and image.strides[2] < 0
+        if swap:  # 通道倒序的视图，直接缩放底层的连续数据，写入时再交换通道
+            image = image[:, :, ::-1]
+        pix = self.resize_and_pad_image(image, new_shape=imgsz)
+        buffer = self.input_buffer(*pix.shape[:2])
+        for c in range(3):
+            np.divide(
+                pix[:, :, 2 - c if swap else c],
+                np.float32(255),
+                out=buffer[0, c],
+                dtype=np.float32,
+            )
+        return buffer
+
+    def postprocess(
+        self, preds, input_shape, orig_shape, conf=0.25, iou=0.7, classes=None
+    ):
+        """
+        Filter, rescale and deduplicate the raw predictions of one image.
+
+        Args:
+            preds: (N, 6) predictions, (x1, y1, x2, y2, conf, cls) on the model input.
+            input_shape: (height, width) of the model input.
+            orig_shape: (height, width) of the original image.
+            conf: Minimum confidence.
+            iou: IoU threshold of the per-class NMS, None to skip it.
+            classes: Only keep these class ids, None to keep all.
+
+        Returns:
+            (M, 6) predictions on the original image, by decreasing confidence.
+        """
+        preds = preds[preds[:, 4] > conf]
+        if classes is not None:
+            preds = preds[np.isin(preds[:, 5], classes)]
+        preds[:, :4] = self.scale_boxes(input_shape, preds[:, :4], orig_shape)
+        h, w = orig_shape
+        preds[:, [0, 2]] = np.clip(preds[:, [0, 2]], 0, w)
+        preds[:, [1, 3]] = np.clip(preds[:, [1, 3]], 0, h)
+        preds = preds[(preds[:, 2] > preds[:, 0]) & (preds[:, 3] > preds[:, 1])]
+        if iou is None:
+            return preds[np.argsort(-preds[:, 4], kind="stable")]
+        # 按类别错开坐标，一次 NMS 只抑制同类别的框
+        offset = preds[:, 5:6] * (max(h, w) + 1)
+        return preds[nms(preds[:, :4] + offset, preds[:, 4], iou)]
+
+    def warmup(self, height=842, width=595):
+        """Run one inference on a blank A4 page, the first run of a session is slow."""
+        image = np.full((height, width, 3), 255, dtype=np.uint8)
+        self.predict(image, imgsz=int(height / 32) * 32)
+
     def predict(self, image, imgsz=1024, **kwargs):
         # Preprocess input image
         orig_h, orig_w = image.shape[:2]
-        pix = self.resize_and_pad_image(image, new_shape=imgsz)
-        pix = np.transpose(pix, (2, 0, 1))  # CHW
-        pix = np.expand_dims(pix, axis=0)  # BCHW
-        pix = pix.astype(np.float32) / 255.0  # Normalize to [0, 1]
+        pix = self.preprocess(image, imgsz)
         new_h, new_w = pix.shape[2:]
 
         # Run inference
         preds = self.model.run(None, {"images": pix})[0]
 
         # Postprocess predictions
-        preds = preds[preds[..., 4] > 0.25]
-        preds[..., :4] = self.scale_boxes(
-            (new_h, new_w), preds[..., :4], (orig_h, orig_w)
-        )
+        preds = self.postprocess(preds[0], (new_h, new_w), (orig_h, orig_w), **kwargs)
         return [YoloResult(boxes=preds, names=self._names)]
 
 
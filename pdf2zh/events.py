@@ -0,0 +1,102 @@
+import json
+import logging
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Set
+
+log = logging.getLogger(__name__)
+# 订阅等待 Redis 确认的最长时间，超时后依靠订阅方轮询状态
+SUBSCRIBE_TIMEOUT = 5
+
+
+class LocalEventBus:
+    """Task events fanned out to subscribers of the same process."""
+
+    def __init__(self):
+        self.subscribers: Dict[str, Set[queue.Queue]] = {}
+        self.lock = threading.Lock()
+
+    def publish(self, channel: str, event: str, data: dict):
+        self.deliver(channel, {"event": event, "data": data})
+
+    def deliver(self, channel: str, message: dict):
+        with self.lock:
+            subscribers = list(self.subscribers.get(channel, ()))
+        for subscriber in subscribers:
+            subscriber.put(message)
+
+    @contextmanager
+    def subscribe(self, channel: str) -> Iterator[queue.Queue]:
+        """A queue receiving the events of channel until the block exits."""
+        subscriber = queue.Queue()
+        with self.lock:
+            self.subscribers.setdefault(channel, set()).add(subscriber)
+        try:
+            yield subscriber
+        finally:
+            with self.lock:
+                subscribers = self.subscribers.get(channel, set())
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    self.subscribers.pop(channel, None)
+
+
+class RedisEventBus(LocalEventBus):
+    """
+    Task events published through Redis by all workers.
+
+    Every process holds one pattern subscription, opened by its first
+    subscriber, and fans the events out locally, so the number of clients
+    does not change the load of Redis. Subscribers receive a resync event
+    when the subscription is restored after a lost connection, the events
+    published in between are lost.
+    """
+
+    def __init__(self, url: str, prefix: str = "pdf2zh:events:"):
+        super().__init__()
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self.listener = None
+        self.ready = threading.Event()
+
+    def publish(self, channel: str, event: str, data: dict):
+        message = json.dumps({"event": event, "data": data})
+        self.client.publish(self.prefix + channel, message)
+
+    def subscribe(self, channel: str):
+        with self.lock:
+            if self.listener is None:
+                self.listener = threading.Thread(target=self.listen, daemon=True)
+                self.listener.start()
+        # 订阅确认之前发布的事件收不到，等待确认后订阅方再读取状态
+        if not self.ready.wait(SUBSCRIBE_TIMEOUT):
+            log.warning("Event subscription not confirmed, events may be lost")
+        return super().subscribe(channel)
+
+    def listen(self):
+        while True:
+            try:
+                pubsub = self.client.pubsub()
+                pubsub.psubscribe(self.prefix + "*")
+                for message in pubsub.listen():
+                    if message["type"] == "psubscribe":
+                        # 重连之前的订阅方可能错过了事件，通知其重新读取状态
+                        self.resync()
+                        self.ready.set()
+                    elif message["type"] == "pmessage":
+                        channel = message["channel"].decode()[len(self.prefix) :]
+                        self.deliver(channel, json.loads(message["data"]))
+            except Exception:
+                self.ready.clear()
+                log.exception("Event subscription lost, reconnecting")
+                time.sleep(1)
+
+    def resync(self):
+        with self.lock:
+            channels = list(self.subscribers)
+        for channel in channels:
+            self.deliver(channel, {"event": "resync", "data": {}})
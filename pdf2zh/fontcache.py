@@ -0,0 +1,81 @@
+import functools
+import threading
+from typing import Dict, Optional
+
+from pdfminer.pdffont import PDFFont
+from pymupdf import Font
+
+
+@functools.lru_cache(maxsize=None)
+def load_font(font_name: str, font_path: Optional[str] = None) -> Font:
+    """
+    Load a PyMuPDF font once per process.
+
+    Parsing a CJK font file takes a noticeable amount of time, and every
+    document translated to the same language uses the same file.
+    """
+    return Font(font_name, font_path)
+
+
+class GlyphMetrics:
+    """Memoized glyph ids and advances of a PyMuPDF font, shared per process."""
+
+    _instances: Dict[Font, "GlyphMetrics"] = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, font: Font):
+        self.font = font
+        self.glyphs: Dict[int, int] = {}  # codepoint -> glyph id
+        self.advances: Dict[int, float] = {}  # codepoint -> advance at size 1
+        self.lock = threading.Lock()  # MuPDF 的字体对象不保证线程安全
+
+    @classmethod
+    def of(cls, font: Font) -> "GlyphMetrics":
+        metrics = cls._instances.get(font)
+        if metrics is None:
+            with cls._instances_lock:
+                metrics = cls._instances.setdefault(font, cls(font))
+        return metrics
+
+    def glyph(self, code: int) -> int:
+        """Glyph id of a codepoint, 0 if the font has no such glyph."""
+        gid = self.glyphs.get(code)
+        if gid is None:
+            with self.lock:
+                gid = self.glyphs[code] = self.font.has_glyph(code)
+        return gid
+
+    def advance(self, code: int) -> float:
+        """Advance width of a codepoint at font size 1."""
+        adv = self.advances.get(code)
+        if adv is None:
+            with self.lock:
+                adv = self.advances[code] = self.font.char_lengths(chr(code), 1)[0]
+        return adv
+
+
+class PDFFontMetrics:
+    """Memoized unicode mapping and widths of a pdfminer font."""
+
+    def __init__(self, font: PDFFont):
+        self.font = font
+        self.unichrs: Dict[int, bool] = {}  # codepoint -> maps back to itself
+        self.widths: Dict[int, float] = {}  # codepoint -> width at size 1
+
+    def maps_to_self(self, code: int) -> bool:
+        """Whether the font's encoding maps the code back to the same character."""
+        result = self.unichrs.get(code)
+        if result is None:
+            try:
+                result = self.font.to_unichr(code) == chr(code)
+            except Exception:
+                result = False
+            self.unichrs[code] = result
+        return result
+
+    def width(self, code: int) -> float:
+        """Width of a character code at font size 1."""
+        width = self.widths.get(code)
+        if width is None:
+            width = self.widths[code] = self.font.char_width(code)
+        return width
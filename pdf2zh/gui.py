@@ -2,8 +2,10 @@ import asyncio
 import cgi
 import os
 import shutil
+import threading
 import uuid
 from asyncio import CancelledError
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import gradio as gr
@@ -106,6 +108,22 @@ if ConfigManager.get("PDF2ZH_DEMO"):
     client_key = ConfigManager.get("PDF2ZH_CLIENT_KEY")
     server_key = ConfigManager.get("PDF2ZH_SERVER_KEY")
 
+# Limit concurrent translations, further jobs wait in the queue of gradio
+concurrency_limit = int(ConfigManager.get("PDF2ZH_GUI_CONCURRENCY", 2))
+queue_size = int(ConfigManager.get("PDF2ZH_GUI_QUEUE_SIZE", 32))
+# Limit running translations per user
+user_limit = int(ConfigManager.get("PDF2ZH_GUI_USER_JOBS", 1))
+# Header with the client address set by a reverse proxy, e.g. X-Forwarded-For
+client_header = ConfigManager.get("PDF2ZH_GUI_CLIENT_HEADER", "")
+# Translation threads shared by all jobs, 0 for a pool per job
+# Defaults to the 4 threads of a job for each concurrent translation
+translate_threads = int(ConfigManager.get("PDF2ZH_GUI_THREADS", 4 * concurrency_limit))
+translate_executor = (
+    ThreadPoolExecutor(max_workers=translate_threads) if translate_threads else None
+)
+user_jobs: dict[str, int] = {}
+user_jobs_lock = threading.Lock()
+
 
 # Public demo control
 def verify_recaptcha(response):
@@ -151,6 +169,52 @@ def download_with_limit(url: str, save_path: str, size_limit: int) -> str:
     return save_path / filename
 
 
+def request_user(request: gr.Request) -> str:
+    """
+    This function identifies the user of a request for the job limit.
+
+    Inputs:
+        - request: The request of the user
+
+    Returns:
+        - The login name, the client address from the configured header
+          or the browser session
+    """
+    if request.username:
+        return request.username
+    if client_header:
+        # The proxy appends the address it sees, earlier entries come from the client
+        address = request.headers.get(client_header, "").split(",")[-1].strip()
+        if address:
+            return address
+    # Behind a proxy the client address is the proxy for all users
+    return request.session_hash or "anonymous"
+
+
+def acquire_user_job(user: str) -> bool:
+    """
+    This function reserves a running job for a user.
+
+    Inputs:
+        - user: The user returned by request_user
+
+    Returns:
+        - Whether the user is below the limit of running jobs
+    """
+    with user_jobs_lock:
+        if user_limit and user_jobs.get(user, 0) >= user_limit:
+            return False
+        user_jobs[user] = user_jobs.get(user, 0) + 1
+        return True
+
+
+def release_user_job(user: str) -> None:
+    with user_jobs_lock:
+        user_jobs[user] -= 1
+        if not user_jobs[user]:
+            del user_jobs[user]
+
+
 def stop_translate_file(state: dict) -> None:
     """
     This function stops the translation process.
@@ -181,6 +245,7 @@ def translate_file(
     recaptcha_response,
     state,
     progress=gr.Progress(),
+    request: gr.Request = None,
     *envs,
 ):
     """
@@ -200,6 +265,7 @@ def translate_file(
         - recaptcha_response: The reCAPTCHA response
         - state: The state of the translation process
         - progress: The progress bar
+        - request: The request of the user
         - envs: The environment variables
 
     Returns:
@@ -210,17 +276,69 @@ def translate_file(
         - The progress bar
         - The progress bar
     """
-    session_id = uuid.uuid4()
-    state["session_id"] = session_id
-    cancellation_event_map[session_id] = asyncio.Event()
     # Translate PDF content using selected service.
     if flag_demo and not verify_recaptcha(recaptcha_response):
         raise gr.Error("reCAPTCHA fail")
 
-    progress(0, desc="Starting translation...")
-
-    output = Path("pdf2zh_files")
+    user = request_user(request) if request is not None else "anonymous"
+    if not acquire_user_job(user):
+        raise gr.Error(
+            f"You already have {user_limit} translation(s) running, please wait"
+        )
+    session_id = uuid.uuid4()
+    state["session_id"] = session_id
+    cancellation_event_map[session_id] = asyncio.Event()
+    # Every job writes to its own directory, files of the same name do not clash
+    output = Path("pdf2zh_files") / session_id.hex
     output.mkdir(parents=True, exist_ok=True)
+    try:
+        return translate_job(
+            file_type,
+            file_input,
+            link_input,
+            service,
+            lang_from,
+            lang_to,
+            page_range,
+            page_input,
+            prompt,
+            threads,
+            output,
+            cancellation_event_map[session_id],
+            progress,
+            *envs,
+        )
+    except BaseException:
+        shutil.rmtree(output, ignore_errors=True)
+        raise
+    finally:
+        cancellation_event_map.pop(session_id, None)
+        release_user_job(user)
+
+
+def translate_job(
+    file_type,
+    file_input,
+    link_input,
+    service,
+    lang_from,
+    lang_to,
+    page_range,
+    page_input,
+    prompt,
+    threads,
+    output,
+    cancellation_event,
+    progress,
+    *envs,
+):
+    """
+    This function runs a translation job of translate_file in its output directory.
+
+    Returns:
+        - The outputs of translate_file
+    """
+    progress(0, desc="Starting translation...")
 
     if file_type == "File":
         if not file_input:
@@ -277,15 +395,15 @@ def translate_file(
         "output": output,
         "thread": int(threads),
         "callback": progress_bar,
-        "cancellation_event": cancellation_event_map[session_id],
+        "cancellation_event": cancellation_event,
         "envs": _envs,
         "prompt": Template(prompt) if prompt else None,
         "model": ModelInstance.value,
+        "executor": translate_executor,
     }
     try:
         translate(**param)
     except CancelledError:
-        del cancellation_event_map[session_id]
         raise gr.Error("Translation cancelled")
     print(f"Files after translation: {os.listdir(output)}")
 
@@ -437,7 +555,10 @@ with gr.Blocks(
             with gr.Accordion("Open for More Experimental Options!", open=False):
                 gr.Markdown("#### Experimental")
                 threads = gr.Textbox(
-                    label="number of threads", interactive=True, value="4"
+                    label="number of threads",
+                    interactive=True,
+                    value="4",
+                    visible=translate_executor is None,
                 )
                 prompt = gr.Textbox(
                     label="Custom Prompt for llm", interactive=True, visible=False
@@ -569,6 +690,8 @@ with gr.Blocks(
             output_file_dual,
             output_title,
         ],
+        concurrency_limit=concurrency_limit,
+        concurrency_id="translate",
     ).then(lambda: None, js="()=>{grecaptcha.reset()}" if flag_demo else "")
 
     cancellation_btn.click(
@@ -621,6 +744,7 @@ def setup_gui(
         - None
     """
     user_list, html = parse_user_passwd(auth_file)
+    demo.queue(max_size=queue_size)
     if flag_demo:
         demo.launch(server_name="0.0.0.0", max_file_size="5mb", inbrowser=True)
     else:
@@ -1,16 +1,19 @@
 """Functions that can be used for the most common use-cases for pdf2zh.six"""
 
 import asyncio
+import hashlib
 import io
+import json
 import os
 import re
 import sys
 import tempfile
 import urllib.request
 from asyncio import CancelledError
+from concurrent.futures import Executor
 from pathlib import Path
 from string import Template
-from typing import Any, BinaryIO, List, Optional, Dict
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional
 
 import numpy as np
 import requests
@@ -20,11 +23,15 @@ from pdfminer.pdfexceptions import PDFValueError
 from pdfminer.pdfinterp import PDFResourceManager
 from pdfminer.pdfpage import PDFPage
 from pdfminer.pdfparser import PDFParser
+from pdfminer.pdftypes import dict_value
 from pymupdf import Document, Font
 
+from pdf2zh.checkpoint import Checkpoint
 from pdf2zh.converter import TranslateConverter
 from pdf2zh.doclayout import OnnxModel
+from pdf2zh.fontcache import load_font
 from pdf2zh.pdfinterp import PDFPageInterpreterEx
+from pdf2zh.profiler import Profiler, stage
 
 from pdf2zh.config import ConfigManager
 
@@ -64,6 +71,88 @@ def check_files(files: List[str]) -> List[str]:
     return missing_files
 
 
+def get_pages(
+    doc: PDFDocument, doc_zh: Document, pages: Optional[list[int]] = None
+) -> Iterator[tuple[int, PDFPage]]:
+    """
+    Yield (pageno, page) for the selected pages in document order.
+
+    Selected pages are located through the page index of doc_zh, which shares
+    its object numbers with doc, so unselected pages are never parsed.
+    Inheritable attributes are collected by walking up the /Parent chain.
+    """
+    if not pages:
+        yield from enumerate(PDFPage.create_pages(doc))
+        return
+    for pageno in sorted({p for p in pages if 0 <= p < doc_zh.page_count}):
+        objid = doc_zh.page_xref(pageno)
+        attrs = dict_value(doc.getobj(objid)).copy()
+        parent, visited = attrs.get("Parent"), {objid}
+        while parent is not None:  # 补全从页面树继承的属性
+            parent_objid = getattr(parent, "objid", None)
+            if parent_objid in visited:
+                break
+            visited.add(parent_objid)
+            node = dict_value(parent)
+            for k in PDFPage.INHERITABLE_ATTRS:
+                if k not in attrs and k in node:
+                    attrs[k] = node[k]
+            parent = node.get("Parent")
+        yield pageno, PDFPage(doc, objid, attrs, None)
+
+
+def layout_mask(page_layout, height: int, width: int) -> np.ndarray:
+    """
+    Render the layout boxes of a page into a mask in PDF coordinates.
+
+    Text boxes are marked with their index + 2, boxes to keep as they are
+    with 0 and the rest of the page with 1.
+    """
+    # kdtree 是不可能 kdtree 的，不如直接渲染成图片，用空间换时间
+    vcls = ["abandon", "figure", "table", "isolate_formula", "formula_caption"]
+    box = np.ones((height, width), dtype=np.uint16)
+    h, w = box.shape
+    x0, y0, x1, y1 = page_layout.xyxy.T
+    # 一次换算出所有框在 mask 中的范围，左右上下各外扩一个像素
+    rects = np.stack(
+        [
+            np.clip((x0 - 1).astype(int), 0, w - 1),
+            np.clip((h - y1 - 1).astype(int), 0, h - 1),
+            np.clip((x1 + 1).astype(int), 0, w - 1),
+            np.clip((h - y0 + 1).astype(int), 0, h - 1),
+        ],
+        axis=1,
+    )
+    keep = np.isin(page_layout.cls, page_layout.class_ids(vcls))
+    # 先画文字框，后面的框覆盖前面的，再把保留区域置 0
+    for i, (l, t, r, b) in zip(np.flatnonzero(~keep).tolist(), rects[~keep].tolist()):
+        box[t:b, l:r] = i + 2
+    for l, t, r, b in rects[keep].tolist():
+        box[t:b, l:r] = 0
+    return box
+
+
+def new_contents(doc_zh: Document, pageno: int) -> int:
+    """Point the page to a new empty content stream and return its xref."""
+    xref = doc_zh.get_new_xref()  # hack 插入页面的新 xref
+    doc_zh.update_object(xref, "<<>>")
+    doc_zh.update_stream(xref, b"")
+    doc_zh[pageno].set_contents(xref)
+    return xref
+
+
+class PatchRecorder(dict):
+    """Patches by xref, recording the xrefs written since written was cleared."""
+
+    def __init__(self):
+        super().__init__()
+        self.written = set()
+
+    def __setitem__(self, xref: int, ops: str):
+        self.written.add(xref)
+        super().__setitem__(xref, ops)
+
+
 def translate_patch(
     inf: BinaryIO,
     pages: Optional[list[int]] = None,
@@ -83,6 +172,9 @@ def translate_patch(
     envs: Dict = None,
     prompt: Template = None,
     user_glossary: list[dict] = None,
+    profiler: Profiler = None,
+    executor: Executor = None,
+    checkpoint: Checkpoint = None,
     **kwarg: Any,
 ) -> None:
     rsrcmgr = PDFResourceManager()
@@ -101,13 +193,16 @@ def translate_patch(
         envs,
         prompt,
         user_glossary,
+        profiler,
+        executor,
+        cancellation_event,
     )
 
     assert device is not None
-    obj_patch = {}
+    obj_patch = PatchRecorder() if checkpoint else {}
     interpreter = PDFPageInterpreterEx(rsrcmgr, device, obj_patch)
     if pages:
-        total_pages = len(pages)
+        total_pages = len({p for p in pages if 0 <= p < doc_zh.page_count})
     else:
         total_pages = doc_zh.page_count
 
@@ -117,11 +212,9 @@ def translate_patch(
     doc = PDFDocument(parser)
 
     with tqdm.tqdm(total=total_pages) as progress:
-        for pageno, page in enumerate(PDFPage.create_pages(doc)):
+        for pageno, page in get_pages(doc, doc_zh, pages):
             if cancellation_event and cancellation_event.is_set():
                 raise CancelledError("task cancelled")
-            if pages and (pageno not in pages):
-                continue
 
             current_page += 1
             progress.update()
@@ -136,46 +229,55 @@ def translate_patch(
                         "total": total_pages,
                         "percentage": current_page / total_pages * 100,
                         "page": pageno,
+                        "stages": profiler.totals() if profiler else {},
                     }
                 )
 
             page.pageno = pageno
-            pix = doc_zh[page.pageno].get_pixmap()
-            image = np.fromstring(pix.samples, np.uint8).reshape(
-                pix.height, pix.width, 3
-            )[:, :, ::-1]
-            page_layout = model.predict(image, imgsz=int(pix.height / 32) * 32)[0]
-            # kdtree 是不可能 kdtree 的，不如直接渲染成图片，用空间换时间
-            box = np.ones((pix.height, pix.width))
-            h, w = box.shape
-            vcls = ["abandon", "figure", "table", "isolate_formula", "formula_caption"]
-            for i, d in enumerate(page_layout.boxes):
-                if page_layout.names[int(d.cls)] not in vcls:
-                    x0, y0, x1, y1 = d.xyxy.squeeze()
-                    x0, y0, x1, y1 = (
-                        np.clip(int(x0 - 1), 0, w - 1),
-                        np.clip(int(h - y1 - 1), 0, h - 1),
-                        np.clip(int(x1 + 1), 0, w - 1),
-                        np.clip(int(h - y0 + 1), 0, h - 1),
-                    )
-                    box[y0:y1, x0:x1] = i + 2
-            for i, d in enumerate(page_layout.boxes):
-                if page_layout.names[int(d.cls)] in vcls:
-                    x0, y0, x1, y1 = d.xyxy.squeeze()
-                    x0, y0, x1, y1 = (
-                        np.clip(int(x0 - 1), 0, w - 1),
-                        np.clip(int(h - y1 - 1), 0, h - 1),
-                        np.clip(int(x1 + 1), 0, w - 1),
-                        np.clip(int(h - y0 + 1), 0, h - 1),
-                    )
-                    box[y0:y1, x0:x1] = 0
+            if profiler:
+                profiler.incr("pages")
+            saved = checkpoint.page(pageno) if checkpoint else None
+            if saved is not None:
+                # 上次已完成的页面直接使用保存的补丁，不再推理和解析
+                obj_patch[new_contents(doc_zh, pageno)] = saved["contents"]
+                for xref, ops in saved["objects"].items():
+                    obj_patch[int(xref)] = ops
+                if profiler:
+                    profiler.incr("pages_resumed")
+                continue
+            if not interpreter.has_text(page.contents, page.resources):
+                continue  # 无文字页面保持原样，跳过版面分析和解析
+            box = checkpoint.layout(pageno) if checkpoint else None
+            if box is None:
+                with stage(profiler, "render", pageno):
+                    pix = doc_zh[page.pageno].get_pixmap()
+                    # 直接引用 pixmap 的内存，BGR 为倒序视图，不产生拷贝
+                    image = np.frombuffer(pix.samples_mv, np.uint8).reshape(
+                        pix.height, pix.width, 3
+                    )[:, :, ::-1]
+                with stage(profiler, "predict", pageno):
+                    page_layout = model.predict(image, imgsz=int(pix.height / 32) * 32)[
+                        0
+                    ]
+                with stage(profiler, "mask", pageno):
+                    box = layout_mask(page_layout, pix.height, pix.width)
+                if checkpoint:
+                    checkpoint.save_layout(pageno, box)
             layout[page.pageno] = box
             # 新建一个 xref 存放新指令流
-            page.page_xref = doc_zh.get_new_xref()  # hack 插入页面的新 xref
-            doc_zh.update_object(page.page_xref, "<<>>")
-            doc_zh.update_stream(page.page_xref, b"")
-            doc_zh[page.pageno].set_contents(page.page_xref)
-            interpreter.process_page(page)
+            page.page_xref = new_contents(doc_zh, page.pageno)
+            if checkpoint:
+                obj_patch.written.clear()
+            with stage(profiler, "interpret", pageno):
+                interpreter.process_page(page)
+            if checkpoint:
+                # 原文档对象的 xref 不变，新指令流的 xref 恢复时重新分配
+                objects = {
+                    xref: obj_patch[xref]
+                    for xref in obj_patch.written
+                    if xref != page.page_xref
+                }
+                checkpoint.save_page(pageno, obj_patch[page.page_xref], objects)
 
     device.close()
     return obj_patch
@@ -197,20 +299,42 @@ def translate_stream(
     envs: Dict = None,
     prompt: Template = None,
     user_glossary: list[dict] = None,
+    profiler: Profiler = None,
+    executor: Executor = None,
+    checkpoint: Checkpoint = None,
     **kwarg: Any,
 ):
+    if profiler is None:  # 计时开销很小，始终记录供进度回调使用
+        profiler = Profiler()
+    doc_en, doc_zh, noto_name, noto = prepare_documents(stream, lang_out)
+    fp = io.BytesIO()
+    doc_zh.save(fp)
+    obj_patch: dict = translate_patch(fp, **locals())
+    result = finish_documents(doc_en, doc_zh, obj_patch, profiler)
+    if checkpoint:
+        checkpoint.clear()
+    return result
+
+
+def prepare_documents(stream: bytes, lang_out: str) -> tuple:
+    """
+    Open the original document and the copy to patch, with the fonts of the
+    translation inserted into every page of the copy.
+
+    Returns (doc_en, doc_zh, noto_name, noto). The result only depends on
+    the input, so patches of one copy apply to any other copy.
+    """
     font_list = [("tiro", None)]
 
     font_path = download_remote_fonts(lang_out.lower())
     noto_name = NOTO_NAME
-    noto = Font(noto_name, font_path)
+    noto = load_font(noto_name, font_path)
     font_list.append((noto_name, font_path))
 
     doc_en = Document(stream=stream)
     stream = io.BytesIO()
     doc_en.save(stream)
     doc_zh = Document(stream=stream)
-    page_count = doc_zh.page_count
     # font_list = [("GoNotoKurrent-Regular.ttf", font_path), ("tiro", None)]
     font_id = {}
     for page in doc_zh:
@@ -240,12 +364,19 @@ def translate_stream(
                             )
             except Exception:
                 pass
+    return doc_en, doc_zh, noto_name, noto
 
-    fp = io.BytesIO()
 
-    doc_zh.save(fp)
-    obj_patch: dict = translate_patch(fp, **locals())
+def finish_documents(
+    doc_en: Document, doc_zh: Document, obj_patch: dict, profiler: Profiler = None
+) -> tuple[bytes, bytes]:
+    """
+    Apply the patches to doc_zh and write the mono and dual documents.
 
+    The output only depends on the patches, except for the random tags of
+    the font subsets.
+    """
+    page_count = doc_zh.page_count
     for obj_id, ops_new in obj_patch.items():
         # ops_old=doc_en.xref_stream(obj_id)
         # print(obj_id)
@@ -257,12 +388,80 @@ def translate_stream(
     for id in range(page_count):
         doc_en.move_page(page_count + id, id * 2 + 1)
 
-    doc_zh.subset_fonts(fallback=True)
-    doc_en.subset_fonts(fallback=True)
-    return (
-        doc_zh.write(deflate=True, garbage=3, use_objstms=1),
-        doc_en.write(deflate=True, garbage=3, use_objstms=1),
+    # 文件标识的第二项由 MuPDF 随机生成，改为由补丁导出，相同输入得到相同输出
+    digest = hashlib.md5()
+    for obj_id in sorted(obj_patch):
+        digest.update(obj_patch[obj_id].encode())
+    for doc in (doc_zh, doc_en):
+        kind, value = doc.xref_get_key(-1, "ID")
+        if kind == "array":
+            first = re.match(r"\[\s*(<\w*>)", value).group(1)
+            doc.xref_set_key(-1, "ID", f"[{first}<{digest.hexdigest().upper()}>]")
+
+    with stage(profiler, "subset_fonts"):
+        doc_zh.subset_fonts(fallback=True)
+        doc_en.subset_fonts(fallback=True)
+    with stage(profiler, "write"):
+        return (
+            doc_zh.write(deflate=True, garbage=3, use_objstms=1, no_new_id=True),
+            doc_en.write(deflate=True, garbage=3, use_objstms=1, no_new_id=True),
+        )
+
+
+def translate_shard(
+    stream: bytes, pages: list[int], lang_out: str = "", **kwarg: Any
+) -> dict:
+    """
+    Translate some pages of a document, for merge_shards to assemble.
+
+    Takes the arguments of translate_stream. Returns the new content stream
+    of every translated page by page number and the patches of the shared
+    objects by xref, both JSON serializable.
+    """
+    doc_en, doc_zh, noto_name, noto = prepare_documents(stream, lang_out)
+    xreflen = doc_zh.xref_length()
+    fp = io.BytesIO()
+    doc_zh.save(fp)
+    obj_patch = translate_patch(
+        fp,
+        pages=pages,
+        lang_out=lang_out,
+        doc_zh=doc_zh,
+        noto_name=noto_name,
+        noto=noto,
+        **kwarg,
     )
+    # 页面的新指令流使用本地新建的 xref，按页码传递，合并时再重新分配
+    shard = {"pages": {}, "objects": {}}
+    contents = {}
+    for pageno in range(doc_zh.page_count):
+        xrefs = doc_zh[pageno].get_contents()
+        if len(xrefs) == 1 and xrefs[0] >= xreflen:
+            contents[xrefs[0]] = pageno
+    for xref, ops in obj_patch.items():
+        if xref in contents:
+            shard["pages"][contents[xref]] = ops
+        else:
+            shard["objects"][xref] = ops
+    return shard
+
+
+def merge_shards(
+    stream: bytes, shards: list[dict], lang_out: str = "", profiler: Profiler = None
+) -> tuple[bytes, bytes]:
+    """Assemble the results of translate_shard into the mono and dual documents."""
+    doc_en, doc_zh, _, _ = prepare_documents(stream, lang_out)
+    obj_patch, pages = {}, {}
+    for shard in shards:
+        # 经过 JSON 序列化后键会变成字符串
+        for xref, ops in shard["objects"].items():
+            obj_patch[int(xref)] = ops
+        for pageno, ops in shard["pages"].items():
+            pages[int(pageno)] = ops
+    # 按页码顺序分配 xref，与 translate_stream 的输出一致
+    for pageno in sorted(pages):
+        obj_patch[new_contents(doc_zh, pageno)] = pages[pageno]
+    return finish_documents(doc_en, doc_zh, obj_patch, profiler)
 
 
 def convert_to_pdfa(input_path, output_path):
@@ -331,6 +530,9 @@ def translate(
     model: OnnxModel = None,
     envs: Dict = None,
     prompt: Template = None,
+    profile: str = "",
+    executor: Executor = None,
+    resume: bool = False,
     **kwarg: Any,
 ):
     if not files:
@@ -345,6 +547,7 @@ def translate(
         raise PDFValueError("Some files do not exist.")
 
     result_files = []
+    reports = []
 
     for file in files:
         if type(file) is str and (
@@ -385,6 +588,9 @@ def translate(
 
         if file.startswith(tempfile.gettempdir()):
             os.unlink(file)
+        profiler = Profiler() if profile else None
+        # 逐页保存进度，进程中断后再次运行从未完成的页面继续
+        checkpoint = Checkpoint.of(s_raw, **locals()) if resume else None
         s_mono, s_dual = translate_stream(
             s_raw,
             **locals(),
@@ -398,6 +604,12 @@ def translate(
         doc_mono.close()
         doc_dual.close()
         result_files.append((str(file_mono), str(file_dual)))
+        if profiler:
+            reports.append({"file": file, **profiler.report()})
+
+    if profile:
+        with open(profile, "w", encoding="utf-8") as f:
+            json.dump({"documents": reports}, f, indent=2)
 
     return result_files
 
@@ -0,0 +1,213 @@
+import math
+import re
+import threading
+from collections import defaultdict
+from typing import Dict, Optional, Tuple
+
+from pdf2zh.profiler import Profiler
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# 指标名 -> (类型, 说明, 直方图分桶)
+METRICS: Dict[str, Tuple[str, str, Optional[Tuple[float, ...]]]] = {
+    "pdf2zh_tasks_total": ("counter", "Finished translation tasks by state.", None),
+    "pdf2zh_deduplicated_total": (
+        "counter",
+        "Submissions attached to an existing task.",
+        None,
+    ),
+    "pdf2zh_pages_total": ("counter", "Translated pages.", None),
+    "pdf2zh_bytes_in_total": ("counter", "Bytes of uploaded documents.", None),
+    "pdf2zh_bytes_out_total": ("counter", "Bytes of served documents.", None),
+    "pdf2zh_cache_requests_total": (
+        "counter",
+        "Translation cache lookups by result.",
+        None,
+    ),
+    "pdf2zh_translator_request_seconds": (
+        "histogram",
+        "Latency of translation service requests.",
+        LATENCY_BUCKETS,
+    ),
+    "pdf2zh_layout_seconds": (
+        "histogram",
+        "Latency of layout model inference per page.",
+        LATENCY_BUCKETS,
+    ),
+}
+
+SERIES_RE = re.compile(r"^(\w+?)(_bucket|_sum|_count)?(?:\{(.*)\})?$")
+
+
+def escape(value: object) -> str:
+    """Escape a label value, e.g. a service name from the configuration."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def series(name: str, **labels) -> str:
+    """Series key in the text exposition format, e.g. name{k="v"}."""
+    if not labels:
+        return name
+    pairs = ",".join(f'{k}="{escape(v)}"' for k, v in sorted(labels.items()))
+    return f"{name}{{{pairs}}}"
+
+
+def format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if math.isnan(value):
+        return "NaN"
+    return repr(float(value))
+
+
+class Samples:
+    """Metric increments buffered locally and pushed to a store in one go."""
+
+    def __init__(self):
+        self.values: Dict[str, float] = defaultdict(float)
+
+    def inc(self, name: str, value: float = 1, **labels):
+        self.values[series(name, **labels)] += value
+
+    def observe(self, name: str, value: float, **labels):
+        for le in METRICS[name][2] + (math.inf,):
+            if value <= le:
+                self.inc(f"{name}_bucket", le=format_value(le), **labels)
+        self.inc(f"{name}_sum", value, **labels)
+        self.inc(f"{name}_count", 1, **labels)
+
+
+class LocalStore:
+    """In-process store, used when the Flask app and the workers share a process."""
+
+    def __init__(self):
+        self.values: Dict[str, float] = defaultdict(float)
+        self.lock = threading.Lock()
+
+    def push(self, values: Dict[str, float]):
+        with self.lock:
+            for key, value in values.items():
+                self.values[key] += value
+
+    def pull(self) -> Dict[str, float]:
+        with self.lock:
+            return dict(self.values)
+
+
+class RedisStore:
+    """Store shared by all Celery workers and the Flask app through Redis."""
+
+    def __init__(self, url: str, key: str = "pdf2zh:metrics"):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.key = key
+
+    def push(self, values: Dict[str, float]):
+        pipe = self.client.pipeline(transaction=False)
+        for field, value in values.items():
+            pipe.hincrbyfloat(self.key, field, value)
+        pipe.execute()
+
+    def pull(self) -> Dict[str, float]:
+        return {k.decode(): float(v) for k, v in self.client.hgetall(self.key).items()}
+
+
+class Registry:
+    def __init__(self, store=None):
+        self.store = store or LocalStore()
+
+    def push(self, samples: Samples):
+        if samples.values:
+            self.store.push(samples.values)
+            samples.values.clear()
+
+    def inc(self, name: str, value: float = 1, **labels):
+        samples = Samples()
+        samples.inc(name, value, **labels)
+        self.push(samples)
+
+    def render(self, gauges: Optional[Dict[str, Tuple[str, float]]] = None) -> str:
+        """
+        Render all metrics in the Prometheus text exposition format.
+
+        gauges maps extra gauge names to (help, value), they are computed by
+        the caller at scrape time, e.g. the queue depth.
+        """
+        values = self.store.pull()
+        groups: Dict[str, list] = defaultdict(list)
+        for key, value in values.items():
+            match = SERIES_RE.match(key)
+            if match is None:
+                continue
+            name, suffix, labels = match.group(1), match.group(2) or "", match.group(3)
+            if name not in METRICS:  # 如 xxx_total_count 之类的误匹配
+                name, suffix = name + suffix, ""
+            le = re.search(r'le="([^"]+)"', labels or "")
+            order = (
+                re.sub(r',?le="[^"]+"', "", labels or ""),
+                ["_bucket", "_sum", "_count", ""].index(suffix),
+                float(le.group(1)) if le else 0,
+            )
+            groups[name].append((order, key, value))
+
+        lines = []
+        for name, (kind, help, _) in METRICS.items():
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for _, key, value in sorted(groups.get(name, [])):
+                lines.append(f"{key} {format_value(value)}")
+        hits = values.get(series("pdf2zh_cache_requests_total", result="hit"), 0)
+        misses = values.get(series("pdf2zh_cache_requests_total", result="miss"), 0)
+        gauges = {
+            "pdf2zh_cache_hit_ratio": (
+                "Share of cache lookups that hit.",
+                hits / (hits + misses) if hits + misses else 0,
+            ),
+            **(gauges or {}),
+        }
+        for name, (help, value) in gauges.items():
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+class MetricsProfiler(Profiler):
+    """
+    Profiler that also records task metrics.
+
+    Samples are buffered and pushed by flush(), so the translation threads
+    never wait on the store.
+    """
+
+    def __init__(self, registry: Registry, service: str):
+        super().__init__()
+        self.registry = registry
+        self.service = service
+        self.samples = Samples()
+
+    def add(self, name: str, seconds: float, page: Optional[int] = None):
+        super().add(name, seconds, page)
+        with self.lock:
+            if name == "translator":
+                self.samples.observe(
+                    "pdf2zh_translator_request_seconds", seconds, service=self.service
+                )
+            elif name == "predict":
+                self.samples.observe("pdf2zh_layout_seconds", seconds)
+
+    def incr(self, name: str, value: int = 1):
+        super().incr(name, value)
+        with self.lock:
+            if name == "pages":
+                self.samples.inc("pdf2zh_pages_total", value)
+            elif name in ("cache_hit", "cache_miss"):
+                self.samples.inc(
+                    "pdf2zh_cache_requests_total", value, result=name[len("cache_") :]
+                )
+
+    def flush(self):
+        with self.lock:
+            samples, self.samples = self.samples, Samples()
+        self.registry.push(samples)
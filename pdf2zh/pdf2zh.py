@@ -167,6 +167,18 @@ def create_parser() -> argparse.ArgumentParser:
         help="config file.",
     )
 
+    parse_params.add_argument(
+        "--profile",
+        type=str,
+        help="write per-stage timings as JSON to this file.",
+    )
+
+    parse_params.add_argument(
+        "--resume",
+        action="store_true",
+        help="save finished pages and continue from them after an interruption.",
+    )
+
     parse_params.add_argument(
         "--babeldoc",
         default=False,
@@ -1,5 +1,6 @@
 import logging
-from typing import Any, Dict, Optional, Sequence, Tuple, cast
+import re
+from typing import Any, Dict, Optional, Sequence, Set, Tuple, cast
 import numpy as np
 
 from pdfminer import settings
@@ -40,6 +41,9 @@ from pdfminer.utils import (
 
 log = logging.getLogger(__name__)
 
+# 可能产生文字的指令：文字对象和 XObject 调用
+TEXT_OPERATORS = re.compile(rb"(?<![^\s\])>}])(BT|Do)(?![^\s\[(<{/%])")
+
 
 def safe_float(o: Any) -> Optional[float]:
     try:
@@ -60,9 +64,59 @@ class PDFPageInterpreterEx(PDFPageInterpreter):
         self.rsrcmgr = rsrcmgr
         self.device = device
         self.obj_patch = obj_patch
+        self.text_cache: Dict[int, bool] = {}
+        self.text_pending: Set[int] = set()
 
     def dup(self) -> "PDFPageInterpreterEx":
-        return self.__class__(self.rsrcmgr, self.device, self.obj_patch)
+        interpreter = self.__class__(self.rsrcmgr, self.device, self.obj_patch)
+        interpreter.text_cache = self.text_cache
+        return interpreter
+
+    def has_text(self, streams: Sequence[object], resources: object) -> bool:
+        """Check whether content streams may show text, directly or via forms.
+
+        Streams without BT and without form XObjects that contain text can be
+        left untouched. Any error is treated as text to stay on the safe side.
+        """
+        try:
+            found = set()
+            for stream in streams:
+                found.update(TEXT_OPERATORS.findall(stream_value(stream).get_data()))
+            if b"BT" in found:
+                return True
+            if b"Do" not in found:
+                return False
+            xobjmap = dict_value(dict_value(resources).get("XObject", {}))
+            return any(self.form_has_text(x, resources) for x in xobjmap.values())
+        except Exception:
+            return True
+
+    def form_has_text(self, xobjstrm: object, resources: object) -> bool:
+        """Check whether an XObject is a form that may show text, cached by objid.
+
+        Forms without their own Resources use the resources of the caller, so
+        their result is not cached.
+        """
+        objid = getattr(xobjstrm, "objid", None)
+        if objid in self.text_cache:
+            return self.text_cache[objid]
+        if objid in self.text_pending:
+            return True  # 防止循环引用
+        xobj = stream_value(xobjstrm)
+        if xobj.get("Subtype") is not LITERAL_FORM:
+            result = False
+        else:
+            if objid is not None:
+                self.text_pending.add(objid)
+            try:
+                result = self.has_text([xobj], xobj.get("Resources") or resources)
+            finally:
+                self.text_pending.discard(objid)
+            if not xobj.get("Resources"):
+                return result  # 结果取决于调用方的资源
+        if objid is not None:
+            self.text_cache[objid] = result
+        return result
 
     def init_resources(self, resources: Dict[object, object]) -> None:
         # 重载设置 fontid 和 descent
@@ -109,6 +163,16 @@ class PDFPageInterpreterEx(PDFPageInterpreter):
                 for xobjid, xobjstrm in dict_value(v).items():
                     self.xobjmap[xobjid] = xobjstrm
 
+    def do_Tf(self, fontid: PDFStackT, fontsize: PDFStackT) -> None:
+        # 重载记录未定义的字体，公式字符按原文引用的名字写回
+        name = literal_name(fontid)
+        if name not in self.fontmap and not settings.STRICT:
+            font = self.rsrcmgr.get_font(None, {})
+            font.descent = 0  # hack fix descent
+            self.fontmap[name] = font
+            self.fontid[font] = name
+        super().do_Tf(fontid, fontsize)
+
     def do_S(self) -> None:
         # 重载过滤非公式线条
         """Stroke path"""
@@ -217,6 +281,8 @@ class PDFPageInterpreterEx(PDFPageInterpreter):
                 resources = dict_value(xobjres)
             else:
                 resources = self.resources.copy()
+            if not self.form_has_text(self.xobjmap[xobjid], resources):
+                return  # 无文字的 form 保持原样
             self.device.begin_figure(xobjid, bbox, matrix)
             ctm = mult_matrix(matrix, self.ctm)
             ops_base = interpreter.render_contents(
@@ -298,69 +364,85 @@ class PDFPageInterpreterEx(PDFPageInterpreter):
         self.init_state(ctm)
         return self.execute(list_value(streams))
 
+    @classmethod
+    def get_operator(cls, keyword: PSKeyword) -> Optional[Tuple[Any, int, bool, str]]:
+        """Return (func, nargs, emit, name) for an operator keyword, cached per class.
+
+        emit tells whether the operator is written back to the base stream.
+        """
+        table = cls.__dict__.get("_operator_table")
+        if table is None:
+            table = cls._operator_table = {}
+        if keyword in table:
+            return table[keyword]
+        name = keyword_name(keyword)
+        method = "do_%s" % name.replace("*", "_a").replace('"', "_w").replace(
+            "'",
+            "_q",
+        )
+        func = getattr(cls, method, None)
+        if func is None:
+            table[keyword] = None
+            return None
+        nargs = func.__code__.co_argcount - 1
+        if nargs:
+            # 过滤 T 系列文字指令，因为 EI 的参数是 obj 所以也需要过滤（只在少数文档中画横线时使用），过滤 marked 系列指令
+            emit = not (
+                name[0] == "T" or name in ['"', "'", "EI", "MP", "DP", "BMC", "BDC"]
+            )
+        else:
+            emit = not (name[0] == "T" or name in ["BI", "ID", "EMC"])
+        table[keyword] = (func, nargs, emit, name)
+        return table[keyword]
+
     def execute(self, streams: Sequence[object]) -> None:
         # 重载返回指令流
-        ops = ""
+        ops = []
         try:
             parser = PDFContentParser(streams)
         except PSEOF:
             # empty page
             return
+        get_operator = self.get_operator
         while True:
             try:
                 (_, obj) = parser.nextobject()
             except PSEOF:
                 break
             if isinstance(obj, PSKeyword):
-                name = keyword_name(obj)
-                method = "do_%s" % name.replace("*", "_a").replace('"', "_w").replace(
-                    "'",
-                    "_q",
-                )
-                if hasattr(self, method):
-                    func = getattr(self, method)
-                    nargs = func.__code__.co_argcount - 1
-                    if nargs:
-                        args = self.pop(nargs)
-                        # log.debug("exec: %s %r", name, args)
-                        if len(args) == nargs:
-                            func(*args)
-                            if not (
-                                name[0] == "T"
-                                or name in ['"', "'", "EI", "MP", "DP", "BMC", "BDC"]
-                            ):  # 过滤 T 系列文字指令，因为 EI 的参数是 obj 所以也需要过滤（只在少数文档中画横线时使用），过滤 marked 系列指令
-                                p = " ".join(
-                                    [
-                                        (
-                                            f"{x:f}"
-                                            if isinstance(x, float)
-                                            else str(x).replace("'", "")
-                                        )
-                                        for x in args
-                                    ]
+                operator = get_operator(obj)
+                if operator is None:
+                    if settings.STRICT:
+                        error_msg = "Unknown operator: %r" % keyword_name(obj)
+                        raise PDFInterpreterError(error_msg)
+                    continue
+                func, nargs, emit, name = operator
+                if nargs:
+                    args = self.pop(nargs)
+                    # log.debug("exec: %s %r", name, args)
+                    if len(args) != nargs:
+                        continue
+                    func(self, *args)
+                else:
+                    # log.debug("exec: %s", name)
+                    args = func(self)
+                    if args is None:
+                        args = []
+                if emit:
+                    ops.append(
+                        " ".join(
+                            [
+                                (
+                                    f"{x:f}"
+                                    if isinstance(x, float)
+                                    else str(x).replace("'", "")
                                 )
-                                ops += f"{p} {name} "
-                    else:
-                        # log.debug("exec: %s", name)
-                        targs = func()
-                        if targs is None:
-                            targs = []
-                        if not (name[0] == "T" or name in ["BI", "ID", "EMC"]):
-                            p = " ".join(
-                                [
-                                    (
-                                        f"{x:f}"
-                                        if isinstance(x, float)
-                                        else str(x).replace("'", "")
-                                    )
-                                    for x in targs
-                                ]
-                            )
-                            ops += f"{p} {name} "
-                elif settings.STRICT:
-                    error_msg = "Unknown operator: %r" % name
-                    raise PDFInterpreterError(error_msg)
+                                for x in args
+                            ]
+                        )
+                    )
+                    ops.append(f" {name} ")
             else:
                 self.push(obj)
         # print('REV DATA',ops)
-        return ops
+        return "".join(ops)
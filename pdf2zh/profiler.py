@@ -0,0 +1,72 @@
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import ContextManager, Dict, List, Optional
+
+
+class Profiler:
+    """
+    Accumulate wall time per pipeline stage, per page and per document.
+
+    Stages may nest (interpret contains translate and typeset) and may be
+    entered from the translation worker threads, so their sum is not the
+    elapsed time of the document.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.lock = threading.Lock()
+        self.stages: Dict[str, List[float]] = {}  # stage -> [seconds, count]
+        self.pages: Dict[int, Dict[str, float]] = {}  # pageno -> stage -> seconds
+        self.counters: Dict[str, int] = {}  # 页数、缓存命中等计数
+
+    @contextmanager
+    def stage(self, name: str, page: Optional[int] = None):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start, page)
+
+    def add(self, name: str, seconds: float, page: Optional[int] = None):
+        with self.lock:
+            total = self.stages.setdefault(name, [0.0, 0])
+            total[0] += seconds
+            total[1] += 1
+            if page is not None:
+                stages = self.pages.setdefault(page, {})
+                stages[name] = stages.get(name, 0.0) + seconds
+
+    def incr(self, name: str, value: int = 1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def totals(self) -> Dict[str, float]:
+        """Seconds spent in each stage so far."""
+        with self.lock:
+            return {name: total[0] for name, total in self.stages.items()}
+
+    def report(self) -> Dict:
+        """A JSON serializable snapshot of all counters."""
+        with self.lock:
+            return {
+                "elapsed": time.perf_counter() - self.start,
+                "stages": {
+                    name: {"seconds": seconds, "count": count}
+                    for name, (seconds, count) in self.stages.items()
+                },
+                "pages": {
+                    str(pageno): dict(stages)
+                    for pageno, stages in sorted(self.pages.items())
+                },
+                "counters": dict(self.counters),
+            }
+
+
+def stage(
+    profiler: Optional[Profiler], name: str, page: Optional[int] = None
+) -> ContextManager:
+    """Time a stage if profiling is enabled."""
+    if profiler is None:
+        return nullcontext()
+    return profiler.stage(name, page)
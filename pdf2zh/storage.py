@@ -0,0 +1,375 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import BinaryIO, Optional, Union
+
+from pdf2zh.config import ConfigManager
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def default_root() -> str:
+    return os.path.join(os.path.expanduser("~"), ".cache", "pdf2zh", "blobs")
+
+
+class LocalBlobStore:
+    """Blobs stored as files below a directory, shared by processes of one host."""
+
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+
+    def path(self, key: str) -> str:
+        path = os.path.abspath(os.path.join(self.root, key))
+        if os.path.commonpath([self.root, path]) != self.root:
+            raise ValueError(f"Invalid blob key: {key}")
+        return path
+
+    def put(self, key: str, data: Union[bytes, BinaryIO]) -> int:
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 先写临时文件再改名，读取方不会看到写了一半的文件
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                if isinstance(data, (bytes, bytearray, memoryview)):
+                    f.write(data)
+                else:
+                    shutil.copyfileobj(data, f, CHUNK_SIZE)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        return os.path.getsize(path)
+
+    def open(self, key: str) -> BinaryIO:
+        return open(self.path(key), "rb")
+
+    def get(self, key: str) -> bytes:
+        with self.open(key) as f:
+            return f.read()
+
+    def size(self, key: str) -> int:
+        return os.path.getsize(self.path(key))
+
+    def exists(self, key: str) -> bool:
+        return os.path.isfile(self.path(key))
+
+    def touch(self, key: str) -> bool:
+        """Reset the age of a blob for expire, False if it does not exist."""
+        try:
+            os.utime(self.path(key))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def delete(self, key: str):
+        path = self.path(key)
+        try:
+            os.unlink(path)
+            os.rmdir(os.path.dirname(path))  # 顺便清理空目录
+        except OSError:
+            pass
+
+    def expire(self, prefix: str, max_age: float) -> int:
+        """Delete the blobs below prefix older than max_age seconds, return their count."""
+        deadline = time.time() - max_age
+        top = self.path(prefix)
+        removed = 0
+        for dirpath, _, filenames in os.walk(top, topdown=False):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                try:
+                    if os.path.getmtime(path) < deadline:
+                        os.unlink(path)
+                        removed += 1
+                except OSError:  # 其他进程同时删除
+                    pass
+            if dirpath != top:
+                try:
+                    os.rmdir(dirpath)  # 只删除空目录
+                except OSError:
+                    pass
+        return removed
+
+
+class S3BlobStore:
+    """
+    Blobs stored in an S3 compatible object store, shared by all hosts.
+
+    Credentials are read by boto3 from the usual AWS variables, endpoint_url
+    points to other implementations such as a local MinIO.
+    """
+
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: str = None):
+        import boto3
+
+        self.client = boto3.client("s3", endpoint_url=endpoint_url)
+        self.bucket = bucket
+        self.prefix = prefix.strip("/") + "/" if prefix.strip("/") else ""
+
+    def put(self, key: str, data: Union[bytes, BinaryIO]) -> int:
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            self.client.put_object(Bucket=self.bucket, Key=self.prefix + key, Body=data)
+        else:
+            # 大文件自动分片上传
+            self.client.upload_fileobj(data, self.bucket, self.prefix + key)
+        return self.size(key)
+
+    def open(self, key: str) -> BinaryIO:
+        return self.client.get_object(Bucket=self.bucket, Key=self.prefix + key)["Body"]
+
+    def get(self, key: str) -> bytes:
+        return self.open(key).read()
+
+    def size(self, key: str) -> int:
+        return self.client.head_object(Bucket=self.bucket, Key=self.prefix + key)[
+            "ContentLength"
+        ]
+
+    def exists(self, key: str) -> bool:
+        from botocore.exceptions import ClientError
+
+        try:
+            self.size(key)
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey"):
+                return False
+            raise
+        return True
+
+    def touch(self, key: str) -> bool:
+        """Reset the age of a blob for expire, False if it does not exist."""
+        from botocore.exceptions import ClientError
+
+        # 对象不可修改，复制到自身以更新 LastModified
+        try:
+            self.client.copy_object(
+                Bucket=self.bucket,
+                Key=self.prefix + key,
+                CopySource={"Bucket": self.bucket, "Key": self.prefix + key},
+                MetadataDirective="REPLACE",
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey"):
+                return False
+            raise
+        return True
+
+    def delete(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=self.prefix + key)
+
+    def expire(self, prefix: str, max_age: float) -> int:
+        """Delete the blobs below prefix older than max_age seconds, return their count."""
+        deadline = datetime.now(timezone.utc) - timedelta(seconds=max_age)
+        paginator = self.client.get_paginator("list_objects_v2")
+        removed = 0
+        # 每页最多 1000 个对象，正好是批量删除的上限
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix + prefix):
+            objects = [
+                {"Key": obj["Key"]}
+                for obj in page.get("Contents", [])
+                if obj["LastModified"] < deadline
+            ]
+            if objects:
+                self.client.delete_objects(
+                    Bucket=self.bucket, Delete={"Objects": objects, "Quiet": True}
+                )
+                removed += len(objects)
+        return removed
+
+    def url(self, key: str, expires: int = 3600) -> str:
+        """Presigned download url, valid for expires seconds."""
+        return self.client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": self.bucket, "Key": self.prefix + key},
+            ExpiresIn=expires,
+        )
+
+
+class LocalJobIndex:
+    """Job ids by content hash, for a backend whose workers share its process."""
+
+    def __init__(self):
+        self.jobs = {}  # key -> (id, 过期时间)
+        self.holders = {}  # id -> (key, 持有任务的 id)
+        self.aliases = {}  # 去重得到的 id -> 任务 id
+        self.pages = {}  # 租户 -> 排队中的页数
+        self.lock = threading.Lock()
+
+    def claim(self, key: str, id: str, ttl: float) -> str:
+        """Record id for key unless a job is recorded, return the recorded id."""
+        with self.lock:
+            current = self.jobs.get(key)
+            if current and current[1] > time.monotonic():
+                return current[0]
+            self.jobs[key] = (id, time.monotonic() + ttl)
+            self.holders[id] = (key, {id})
+            return id
+
+    def set(self, key: str, id: str, ttl: float):
+        with self.lock:
+            self.jobs[key] = (id, time.monotonic() + ttl)
+            self.holders[id] = (key, {id})
+
+    def hold(self, job: str, alias: str, ttl: float) -> bool:
+        """Record alias as another id of job, False once job is released."""
+        with self.lock:
+            if job not in self.holders:
+                return False
+            self.holders[job][1].add(alias)
+            self.aliases[alias] = job
+            return True
+
+    def resolve(self, id: str) -> str:
+        """The job of an id returned by claim or hold."""
+        with self.lock:
+            return self.aliases.get(id, id)
+
+    def release(self, id: str) -> tuple[str, int]:
+        """Drop an id, return its job and the number of ids still holding it."""
+        with self.lock:
+            job = self.aliases.pop(id, id)
+            key, holders = self.holders.get(job, (None, set()))
+            holders.discard(id)
+            if holders:
+                return job, len(holders)
+            # 最后一个 id 释放后删除记录，相同的提交重新创建任务
+            self.holders.pop(job, None)
+            if key in self.jobs and self.jobs[key][0] == job:
+                del self.jobs[key]
+            return job, 0
+
+    def add_pages(self, tenant: str, pages: int) -> int:
+        """Add to the queued pages of a tenant, return the new count."""
+        with self.lock:
+            count = max(self.pages.get(tenant, 0) + pages, 0)
+            if count:
+                self.pages[tenant] = count
+            else:
+                self.pages.pop(tenant, None)
+            return count
+
+    def queued_pages(self, tenant: str) -> int:
+        with self.lock:
+            return self.pages.get(tenant, 0)
+
+
+class RedisJobIndex:
+    """Job ids by content hash, shared by all backends through Redis."""
+
+    def __init__(self, url: str, prefix: str = "pdf2zh:job:"):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def claim(self, key: str, id: str, ttl: float) -> str:
+        """Record id for key unless a job is recorded, return the recorded id."""
+        # SET NX 保证并发提交时只有一个请求创建任务，持有者与记录同时写入
+        pipe = self.client.pipeline()
+        pipe.set(self.prefix + key, id, nx=True, ex=int(ttl))
+        self._record(pipe, key, id, ttl)
+        if pipe.execute()[0]:
+            return id
+        self.client.delete(f"{self.prefix}holders:{id}", f"{self.prefix}key:{id}")
+        current = self.client.get(self.prefix + key)
+        return current.decode() if current else self.claim(key, id, ttl)
+
+    def set(self, key: str, id: str, ttl: float):
+        pipe = self.client.pipeline()
+        pipe.set(self.prefix + key, id, ex=int(ttl))
+        self._record(pipe, key, id, ttl)
+        pipe.execute()
+
+    def _record(self, pipe, key: str, id: str, ttl: float):
+        pipe.sadd(f"{self.prefix}holders:{id}", id)
+        pipe.expire(f"{self.prefix}holders:{id}", int(ttl))
+        pipe.set(f"{self.prefix}key:{id}", key, ex=int(ttl))
+
+    def hold(self, job: str, alias: str, ttl: float) -> bool:
+        """Record alias as another id of job, False once job is released."""
+        from redis import WatchError
+
+        holders = f"{self.prefix}holders:{job}"
+        with self.client.pipeline() as pipe:
+            while True:
+                try:
+                    # 与 release 并发时，要么先加入持有者，要么发现任务已释放
+                    pipe.watch(holders)
+                    if not pipe.exists(holders):
+                        return False
+                    pipe.multi()
+                    pipe.sadd(holders, alias)
+                    pipe.expire(holders, int(ttl))
+                    pipe.set(f"{self.prefix}alias:{alias}", job, ex=int(ttl))
+                    pipe.execute()
+                    return True
+                except WatchError:
+                    continue
+
+    def resolve(self, id: str) -> str:
+        """The job of an id returned by claim or hold."""
+        job = self.client.get(f"{self.prefix}alias:{id}")
+        return job.decode() if job else id
+
+    def release(self, id: str) -> tuple[str, int]:
+        """Drop an id, return its job and the number of ids still holding it."""
+        from redis import WatchError
+
+        job = self.resolve(id)
+        pipe = self.client.pipeline()
+        pipe.srem(f"{self.prefix}holders:{job}", id)
+        pipe.delete(f"{self.prefix}alias:{id}")
+        pipe.scard(f"{self.prefix}holders:{job}")
+        remaining = pipe.execute()[-1]
+        if remaining:
+            return job, remaining
+        # 最后一个 id 释放后删除记录，相同的提交重新创建任务
+        key = self.client.get(f"{self.prefix}key:{job}")
+        if key:
+            with self.client.pipeline() as pipe:
+                try:
+                    pipe.watch(self.prefix + key.decode())
+                    if pipe.get(self.prefix + key.decode()) == job.encode():
+                        pipe.multi()
+                        pipe.delete(self.prefix + key.decode())
+                        pipe.execute()
+                except WatchError:
+                    pass  # 记录已被新的任务替换
+        self.client.delete(f"{self.prefix}key:{job}")
+        return job, 0
+
+    def add_pages(self, tenant: str, pages: int, ttl: float = 24 * 3600) -> int:
+        """Add to the queued pages of a tenant, return the new count."""
+        key = f"{self.prefix}pages:{tenant}"
+        pipe = self.client.pipeline()
+        pipe.incrby(key, pages)
+        # 计数随租户空闲而过期，worker 异常退出时漏减的页数不会一直累积
+        pipe.expire(key, int(ttl))
+        count = pipe.execute()[0]
+        if count <= 0:
+            self.client.delete(key)
+        return max(count, 0)
+
+    def queued_pages(self, tenant: str) -> int:
+        count = self.client.get(f"{self.prefix}pages:{tenant}")
+        return max(int(count), 0) if count else 0
+
+
+def open_store(url: Optional[str] = None):
+    """
+    Open the blob store of an url, s3://bucket/prefix or a local directory.
+
+    Defaults to BLOB_STORE of the config, the endpoint of S3 compatible
+    stores is read from S3_ENDPOINT_URL.
+    """
+    url = url or ConfigManager.get("BLOB_STORE", default_root())
+    if url.startswith("s3://"):
+        bucket, _, prefix = url[len("s3://") :].partition("/")
+        return S3BlobStore(bucket, prefix, ConfigManager.get("S3_ENDPOINT_URL"))
+    if url.startswith("file://"):
+        url = url[len("file://") :]
+    return LocalBlobStore(url)
@@ -10,6 +10,7 @@ import openai
 import xinference_client
 import requests
 from pdf2zh.cache import TranslationCache
+from pdf2zh.profiler import stage
 from azure.ai.translation.text import TextTranslationClient
 from azure.core.credentials import AzureKeyCredential
 from tencentcloud.common import credential
@@ -35,6 +36,7 @@ class BaseTranslator:
     lang_map = {}
     CustomPrompt = False
     ignore_cache = False
+    profiler = None  # 由调用方设置，记录缓存和翻译耗时
 
     def __init__(self, lang_in, lang_out, model):
         lang_in = self.lang_map.get(lang_in.lower(), lang_in)
@@ -71,6 +73,19 @@ class BaseTranslator:
                 self.envs[key] = envs[key]
             ConfigManager.set_translator_by_name(self.name, self.envs)
 
+    def close(self):
+        """
+        Close the connections of the translator, requests in flight fail
+        where the client allows it.
+        """
+        for client in (getattr(self, "session", None), getattr(self, "client", None)):
+            close = getattr(client, "close", None)
+            if callable(close):
+                try:
+                    close()
+                except Exception:
+                    pass
+
     def add_cache_impact_parameters(self, k: str, v):
         """
         Add parameters that affect the translation quality to distinguish the translation effects under different parameters.
@@ -86,12 +101,17 @@ class BaseTranslator:
         :return: translated text
         """
         if not (self.ignore_cache or ignore_cache):
-            cache = self.cache.get(text)
+            with stage(self.profiler, "cache"):
+                cache = self.cache.get(text)
+            if self.profiler:
+                self.profiler.incr("cache_miss" if cache is None else "cache_hit")
             if cache is not None:
                 return cache
 
-        translation = self.do_translate(text)
-        self.cache.set(text, translation)
+        with stage(self.profiler, "translator"):
+            translation = self.do_translate(text)
+        with stage(self.profiler, "cache"):
+            self.cache.set(text, translation)
         return translation
 
     def do_translate(self, text):
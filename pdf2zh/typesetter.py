@@ -0,0 +1,331 @@
+import logging
+import re
+import unicodedata
+from enum import Enum
+from typing import Dict, List, Optional, Tuple, Union
+
+from pdfminer.layout import LTLine
+from pdfminer.pdffont import PDFCIDFont
+
+from pdf2zh.fontcache import GlyphMetrics, PDFFontMetrics
+
+log = logging.getLogger(__name__)
+
+# 匹配 {vn} 公式标记
+FORMULA_RE = re.compile(r"\{\s*v([\d\s]+)\}", re.IGNORECASE)
+
+# 根据目标语言获取默认行距
+LANG_LINEHEIGHT_MAP = {
+    "zh-cn": 1.4,
+    "zh-tw": 1.4,
+    "zh-hans": 1.4,
+    "zh-hant": 1.4,
+    "zh": 1.4,
+    "ja": 1.1,
+    "ko": 1.2,
+    "en": 1.2,
+    "ar": 1.0,
+    "ru": 0.8,
+    "uk": 0.8,
+    "ta": 0.8,
+}
+DEFAULT_LINE_HEIGHT = 1.1  # 小语种默认1.1
+MIN_LINE_HEIGHT = 1.0  # 压缩行距的下限
+MIN_FONT_SCALE = 0.7  # 缩小字号的下限
+FIT_PASSES = 4  # 二分搜索字号的次数
+MIN_SIZE = 1e-3  # 不超过这个字号视为 0 Tf 设置的不可见文字，不缩放
+
+
+class OpType(Enum):
+    TEXT = "text"
+    LINE = "line"
+
+
+class Paragraph:
+    def __init__(self, y, x, x0, x1, y0, y1, size, brk):
+        self.y: float = y  # 初始纵坐标
+        self.x: float = x  # 初始横坐标
+        self.x0: float = x0  # 左边界
+        self.x1: float = x1  # 右边界
+        self.y0: float = y0  # 上边界
+        self.y1: float = y1  # 下边界
+        self.size: float = size  # 字体大小
+        self.brk: bool = brk  # 换行标记
+
+
+def tokenize(text: str, nformula: int) -> List[Union[str, int]]:
+    """
+    Split a translated paragraph into text runs and formula ids in one scan.
+
+    Placeholders whose id is malformed or out of range are dropped, the
+    translator may add them on its own.
+    """
+    tokens: List[Union[str, int]] = []
+    pos = 0
+    for match in FORMULA_RE.finditer(text):
+        if match.start() > pos:
+            tokens.append(text[pos : match.start()])
+        try:
+            vid = int(match.group(1).replace(" ", ""))
+        except ValueError:
+            vid = -1
+        if 0 <= vid < nformula:
+            tokens.append(vid)
+        pos = match.end()
+    if pos < len(text):
+        tokens.append(text[pos:])
+    return tokens
+
+
+def gen_op_txt(font, size, x, y, rtxt):
+    return f"/{font} {size:f} Tf 1 0 0 1 {x:f} {y:f} Tm [<{rtxt}>] TJ "
+
+
+def gen_op_line(x, y, xlen, ylen, linewidth):
+    return f"ET q 1 0 0 1 {x:f} {y:f} cm [] 0 d 0 J {linewidth:f} w 0 0 m {xlen:f} {ylen:f} l S Q BT "
+
+
+class Typesetter:
+    """
+    Lay out translated paragraphs of one page (or form) and emit PDF operators.
+
+    Formulas are referenced by index into var (characters), varl (lines),
+    varf (vertical offsets) and vlen (widths), as collected by receive_layout.
+    """
+
+    def __init__(
+        self,
+        fontmap: Dict,
+        fontid: Dict,
+        noto_name: str,
+        noto_metrics: Optional[GlyphMetrics],
+        tiro_metrics: Optional[PDFFontMetrics],
+        var: list,
+        varl: list,
+        varf: List[float],
+        vlen: List[float],
+        trace: Optional[List[LTLine]] = None,
+    ):
+        self.fontmap = fontmap
+        self.fontid = fontid
+        self.noto_name = noto_name
+        self.noto_metrics = noto_metrics
+        self.tiro_metrics = tiro_metrics
+        self.var = var
+        self.varl = varl
+        self.varf = varf
+        self.vlen = vlen
+        self.trace = trace  # 调试模式下记录排版轨迹
+        self._x, self._y = 0, 0
+        self.glyphs: Dict[str, Tuple[str, float, str]] = {}
+        self.ops: List[str] = []
+
+    def glyph(self, ch: str) -> Tuple[str, float, str]:
+        """Return (font id, advance at size 1, hex code) of a text character."""
+        glyph = self.glyphs.get(ch)
+        if glyph is None:
+            code = ord(ch)
+            if self.tiro_metrics is not None and self.tiro_metrics.maps_to_self(code):
+                glyph = ("tiro", self.tiro_metrics.width(code), self.encode("tiro", ch))
+            else:
+                glyph = (
+                    self.noto_name,
+                    self.noto_metrics.advance(code),
+                    "%04x" % self.noto_metrics.glyph(code),
+                )
+            self.glyphs[ch] = glyph
+        return glyph
+
+    def encode(self, font: str, text: str) -> str:
+        if font == self.noto_name:
+            return "".join(["%04x" % self.noto_metrics.glyph(ord(c)) for c in text])
+        elif isinstance(self.fontmap[font], PDFCIDFont):  # 判断编码长度
+            return "".join(["%04x" % ord(c) for c in text])
+        else:
+            return "".join(["%02x" % ord(c) for c in text])
+
+    def layout(self, para: Paragraph, text: str, size: float) -> Tuple[list, int]:
+        """
+        Break a paragraph into positioned items.
+
+        Returns the items and the index of the last line. Each item carries
+        its line index, the vertical position is resolved by render().
+        """
+        return self.layout_tokens(para, tokenize(text, len(self.vlen)), size)
+
+    def fit(
+        self, para: Paragraph, text: str, line_height: float
+    ) -> Tuple[list, float, float]:
+        """
+        Fit a paragraph into its original box.
+
+        The line height is first reduced towards MIN_LINE_HEIGHT. If the text
+        still overflows, the largest font scale in [MIN_FONT_SCALE, 1] that
+        fits is found by binary search. Formulas are scaled with the text.
+        Tokens and glyph metrics are reused across the passes, only line
+        breaking is redone.
+
+        Returns the items, the font size and the line height to render with.
+        """
+        height = para.y1 - para.y0
+        min_line_height = min(MIN_LINE_HEIGHT, line_height)
+
+        def fit_line_height(lidx: int, size: float) -> float:
+            if lidx == 0 or size <= MIN_SIZE:  # 单行段落不受行距影响
+                return line_height
+            return max(min(line_height, height / ((lidx + 1) * size)), min_line_height)
+
+        def fits(lidx: int, size: float, lh: float) -> bool:
+            return lidx == 0 or (lidx + 1) * size * lh <= height
+
+        tokens = tokenize(text, len(self.vlen))
+        size = para.size
+        items, lidx = self.layout_tokens(para, tokens, size)
+        lh = fit_line_height(lidx, size)
+        if fits(lidx, size, lh):
+            return items, size, lh
+        lo, hi = MIN_FONT_SCALE, 1.0
+        best = None
+        for i in range(FIT_PASSES + 1):
+            scale = lo if i == 0 else (lo + hi) / 2
+            items_, lidx_ = self.layout_tokens(para, tokens, para.size * scale)
+            lh_ = fit_line_height(lidx_, para.size * scale)
+            if fits(lidx_, para.size * scale, lh_):
+                best = (items_, para.size * scale, lh_)
+                lo = scale
+            elif i == 0:  # 最小字号仍然放不下，直接使用最小字号
+                return items_, para.size * scale, lh_
+            else:
+                hi = scale
+        return best
+
+    def layout_tokens(
+        self, para: Paragraph, tokens: List[Union[str, int]], size: float
+    ) -> Tuple[list, int]:
+        x = para.x
+        x0, x1 = para.x0, para.x1
+        brk = para.brk
+        var, varl = self.var, self.varl
+        items: list = []
+        hexes: List[str] = []  # 当前文字栈
+        fcur: Optional[str] = None  # 当前字体 ID
+        lidx = 0  # 记录换行次数
+        tx = x
+        limit = x1 + 0.1 * size  # 右边界（可能一整行都被符号化，这里需要考虑浮点误差）
+        debug = self.trace is not None
+        # 公式随段落字号一起缩放
+        scale = size / para.size if para.size > MIN_SIZE else 1
+        for token in tokens:
+            if isinstance(token, int):  # 插入公式
+                vid = token
+                adv = self.vlen[vid] * scale
+                mod = 0  # 文字修饰符
+                last = var[vid][-1].get_text()
+                if last and unicodedata.category(last[0]) in ["Lm", "Mn", "Sk"]:
+                    mod = var[vid][-1].width * scale
+                if hexes:
+                    items.append((OpType.TEXT, lidx, fcur, size, tx, 0, "".join(hexes)))
+                    hexes = []
+                if brk and x + adv > limit:  # 到达右边界且原文段落存在换行
+                    x = x0
+                    lidx += 1
+                fix = 0
+                if fcur is not None:  # 段落内公式修正纵向偏移
+                    fix = self.varf[vid] * scale
+                vx0, vy0 = var[vid][0].x0, var[vid][0].y0
+                for vch in var[vid]:  # 排版公式字符
+                    fid = self.fontid[vch.font]
+                    items.append(
+                        (
+                            OpType.TEXT,
+                            lidx,
+                            fid,
+                            vch.size * scale,
+                            x + (vch.x0 - vx0) * scale,
+                            fix + (vch.y0 - vy0) * scale,
+                            self.encode(fid, chr(vch.cid)),
+                        )
+                    )
+                    if debug:
+                        self.move_to(
+                            x + (vch.x0 - vx0) * scale,
+                            fix + para.y + (vch.y0 - vy0) * scale,
+                        )
+                for line in varl[vid]:  # 排版公式线条
+                    if line.linewidth < 5:  # hack 有的文档会用粗线条当图片背景
+                        items.append(
+                            (
+                                OpType.LINE,
+                                lidx,
+                                x + (line.pts[0][0] - vx0) * scale,
+                                fix + (line.pts[0][1] - vy0) * scale,
+                                (line.pts[1][0] - line.pts[0][0]) * scale,
+                                (line.pts[1][1] - line.pts[0][1]) * scale,
+                                line.linewidth * scale,
+                            )
+                        )
+                x += adv - mod
+                if debug:
+                    self.move_to(x, para.y)
+                continue
+            for ch in token:  # 插入文字
+                font, adv, code = self.glyph(ch)
+                adv *= size
+                if font != fcur or x + adv > limit:  # 字体更新或到达右边界
+                    if hexes:
+                        items.append(
+                            (OpType.TEXT, lidx, fcur, size, tx, 0, "".join(hexes))
+                        )
+                        hexes = []
+                if brk and x + adv > limit:  # 到达右边界且原文段落存在换行
+                    x = x0
+                    lidx += 1
+                if not hexes:  # 单行开头
+                    tx = x
+                    if x == x0 and ch == " ":  # 消除段落换行空格
+                        adv = 0
+                    else:
+                        hexes.append(code)
+                else:
+                    hexes.append(code)
+                fcur = font
+                x += adv
+                if debug:
+                    self.move_to(x, para.y)
+        # 处理结尾
+        if hexes:
+            items.append((OpType.TEXT, lidx, fcur, size, tx, 0, "".join(hexes)))
+        return items, lidx
+
+    def move_to(self, x: float, y: float):
+        self.trace.append(LTLine(0.1, (self._x, self._y), (x, y)))
+        self._x, self._y = x, y
+
+    def render(self, items: list, y: float, size: float, line_height: float):
+        """Append the operators of laid out items to the output buffer."""
+        ops = self.ops
+        for item in items:
+            if item[0] is OpType.TEXT:
+                _, lidx, font, fsize, x, dy, rtxt = item
+                ops.append(
+                    gen_op_txt(font, fsize, x, dy + y - lidx * size * line_height, rtxt)
+                )
+            else:
+                _, lidx, x, dy, xlen, ylen, linewidth = item
+                ops.append(
+                    gen_op_line(
+                        x, dy + y - lidx * size * line_height, xlen, ylen, linewidth
+                    )
+                )
+
+    def render_line(self, line: LTLine):
+        if line.linewidth < 5:  # hack 有的文档会用粗线条当图片背景
+            self.ops.append(
+                gen_op_line(
+                    line.pts[0][0],
+                    line.pts[0][1],
+                    line.pts[1][0] - line.pts[0][0],
+                    line.pts[1][1] - line.pts[0][1],
+                    line.linewidth,
+                )
+            )
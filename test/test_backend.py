@@ -0,0 +1,351 @@
+import io
+import json
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import Mock, patch
+
+from pdf2zh.config import ConfigManager
+from pymupdf import Document
+from pdf2zh.storage import S3BlobStore
+
+try:
+    import celery  # noqa: F401
+    import flask  # noqa: F401
+except ImportError:
+    raise unittest.SkipTest("the backend dependencies are not installed")
+
+backend = None
+DOCUMENT = b"%PDF-1.7\n" + bytes(range(256)) * 40
+
+
+def setUpModule():
+    global backend, config, tmpdir
+    # 使用临时配置，broker 和结果都在内存中，不读写用户配置
+    tmpdir = tempfile.TemporaryDirectory()
+    path = os.path.join(tmpdir.name, "config.json")
+    with open(path, "w") as f:
+        json.dump(
+            {
+                "CELERY_BROKER": "memory://",
+                "CELERY_RESULT": "cache+memory://",
+                "BLOB_STORE": os.path.join(tmpdir.name, "blobs"),
+            },
+            f,
+        )
+    config = ConfigManager._instance
+    ConfigManager.custome_config(path)
+    from pdf2zh import backend
+
+
+def tearDownModule():
+    ConfigManager._instance = config
+    tmpdir.cleanup()
+
+
+def finish(id: str, data: bytes = DOCUMENT):
+    """Record a successful task with data as both results."""
+    keys = backend.save_results(id, data, data)
+    backend.celery_app.backend.store_result(id, keys, "SUCCESS")
+
+
+class TestDownload(unittest.TestCase):
+    def setUp(self):
+        self.client = backend.flask_app.test_client()
+
+    def test_download(self):
+        finish("download")
+        response = self.client.get("/v1/translate/download/mono")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, DOCUMENT)
+        self.assertEqual(response.headers["Accept-Ranges"], "bytes")
+        self.assertIn("download-mono.pdf", response.headers["Content-Disposition"])
+
+    def test_range(self):
+        finish("range")
+        response = self.client.get(
+            "/v1/translate/range/dual", headers={"Range": "bytes=100-"}
+        )
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.data, DOCUMENT[100:])
+        self.assertEqual(
+            response.headers["Content-Range"],
+            f"bytes 100-{len(DOCUMENT) - 1}/{len(DOCUMENT)}",
+        )
+
+    def test_etag(self):
+        finish("etag")
+        etag = self.client.get("/v1/translate/etag/mono").headers["ETag"]
+        response = self.client.get(
+            "/v1/translate/etag/mono", headers={"If-None-Match": etag}
+        )
+        self.assertEqual(response.status_code, 304)
+        # A download is only resumed while the file is unchanged
+        headers = {"Range": "bytes=0-9", "If-Range": etag}
+        response = self.client.get("/v1/translate/etag/mono", headers=headers)
+        self.assertEqual((response.status_code, response.data), (206, DOCUMENT[:10]))
+        headers["If-Range"] = '"stale"'
+        response = self.client.get("/v1/translate/etag/mono", headers=headers)
+        self.assertEqual((response.status_code, response.data), (200, DOCUMENT))
+
+    def test_unfinished(self):
+        response = self.client.get("/v1/translate/unknown/mono")
+        self.assertEqual(response.status_code, 400)
+
+    def test_expired(self):
+        finish("gone")
+        backend.store.delete(backend.result_key("gone", "mono"))
+        response = self.client.get("/v1/translate/gone/mono")
+        self.assertEqual(response.status_code, 410)
+
+    def test_s3_redirect(self):
+        finish("s3")
+        s3 = S3BlobStore.__new__(S3BlobStore)
+        s3.client, s3.bucket, s3.prefix = Mock(), "bucket", "pdf2zh/"
+        s3.client.head_object.return_value = {"ContentLength": len(DOCUMENT)}
+        s3.exists = Mock(return_value=True)  # botocore is only needed to report 404
+        s3.client.generate_presigned_url.return_value = "https://s3.test/mono.pdf"
+        with patch.object(backend, "store", s3):
+            response = self.client.get("/v1/translate/s3/mono")
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response.headers["Location"], "https://s3.test/mono.pdf")
+        s3.client.generate_presigned_url.assert_called_once_with(
+            "get_object",
+            Params={"Bucket": "bucket", "Key": "pdf2zh/results/s3/mono.pdf"},
+            ExpiresIn=3600,
+        )
+
+
+class TestDedup(unittest.TestCase):
+    def setUp(self):
+        self.client = backend.flask_app.test_client()
+        doc = Document()
+        doc.new_page().insert_text((72, 72), f"{self.id()}")
+        self.document = doc.tobytes()
+        patcher = patch.object(backend, "submit_task", side_effect=self.record)
+        self.submit_task = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def record(self, id: str, *args):
+        backend.store.put(f"jobs/{id}.json", b"{}")
+
+    def post(self, document: bytes = None):
+        data = {"file": (io.BytesIO(document or self.document), "a.pdf"), "data": "{}"}
+        return self.client.post("/v1/translate", data=data)
+
+    def submit(self) -> str:
+        return self.post().json["id"]
+
+    def test_same_document(self):
+        first, second = self.submit(), self.submit()
+        self.submit_task.assert_called_once()
+        self.assertEqual(self.submit_task.call_args.args[0], first)
+        self.assertNotEqual(first, second)
+        finish(first)
+        for id in (first, second):
+            response = self.client.get(f"/v1/translate/{id}")
+            self.assertEqual(response.json, {"state": "SUCCESS"})
+
+    def test_delete_shared(self):
+        first, second = self.submit(), self.submit()
+        finish(first)
+        self.client.delete(f"/v1/translate/{first}")
+        # The other submission keeps the task and its results
+        response = self.client.get(f"/v1/translate/{second}/mono")
+        self.assertEqual((response.status_code, response.data), (200, DOCUMENT))
+        self.client.delete(f"/v1/translate/{second}")
+        self.assertFalse(backend.store.exists(backend.result_key(first, "mono")))
+        # A new submission creates a new task
+        self.submit()
+        self.assertEqual(self.submit_task.call_count, 2)
+
+    def test_invalid_document(self):
+        for _ in range(2):
+            response = self.post(b"not a pdf")
+            self.assertEqual(response.status_code, 400)
+        self.submit_task.assert_not_called()
+
+    def test_submit_failure(self):
+        self.submit_task.side_effect = ConnectionError()
+        self.assertEqual(self.post().status_code, 500)
+        self.submit_task.side_effect = self.record
+        # The failed task is not shared with the next submission
+        id = self.submit()
+        self.assertEqual(self.submit_task.call_count, 2)
+        self.assertEqual(self.submit_task.call_args.args[0], id)
+
+    def test_unsubmitted(self):
+        # A task id without a record is not reused, it never reached the broker
+        first = self.submit()
+        backend.store.delete(f"jobs/{first}.json")
+        second = self.submit()
+        self.assertEqual(self.submit_task.call_args.args[0], second)
+
+
+class TestEvents(unittest.TestCase):
+    def setUp(self):
+        self.client = backend.flask_app.test_client()
+
+    def test_unknown(self):
+        response = self.client.get("/v1/translate/unknown/events")
+        self.assertEqual(response.status_code, 404)
+
+    def test_queued(self):
+        with patch.object(backend.translate_task, "apply_async"):
+            backend.submit_task("queued", "inputs/a.pdf", 1, {})
+        response = self.client.get("/v1/translate/queued/events", buffered=False)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            next(response.response), b'event: status\ndata: {"state": "PENDING"}\n\n'
+        )
+        response.close()
+
+    def test_finished(self):
+        finish("finished")
+        response = self.client.get("/v1/translate/finished/events")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'"SUCCESS"', response.data)
+
+
+class TestTenant(unittest.TestCase):
+    def setUp(self):
+        self.client = backend.flask_app.test_client()
+
+    def tenant(self) -> str:
+        response = self.client.get("/v1/queue", headers={"X-Tenant": "team-a"})
+        return response.json["tenant"]["id"]
+
+    def test_client_address(self):
+        # Clients cannot choose their tenant unless a proxy sets the header
+        self.assertEqual(self.tenant(), "127.0.0.1")
+
+    def test_header(self):
+        with patch.object(backend, "TENANT_HEADER", "X-Tenant"):
+            self.assertEqual(self.tenant(), "team-a")
+
+    def test_fast_queue_first(self):
+        queues = backend.celery_app.conf.task_queues
+        self.assertEqual(queues[0].name, backend.FAST_QUEUE)
+
+
+class TestTaskCheckpoint(unittest.TestCase):
+    def test_task_checkpoint(self):
+        task = Mock()
+        task.request.id = "a"
+        pages = backend.CHECKPOINT_PAGES
+        self.assertIsNone(backend.task_checkpoint(task, DOCUMENT, pages, {}))
+        checkpoint = backend.task_checkpoint(task, DOCUMENT, pages + 1, {})
+        # Another task of the same document keeps its own pages
+        task.request.id = "b"
+        other = backend.task_checkpoint(task, DOCUMENT, pages + 1, {})
+        self.assertNotEqual(checkpoint.key, other.key)
+
+
+class TestDeliveries(unittest.TestCase):
+    def setUp(self):
+        backend.store.put("inputs/deliveries.pdf", DOCUMENT)
+        patches = [
+            patch.object(backend, "translate_stream", return_value=(DOCUMENT,) * 2),
+            patch.object(backend, "dequeue_pages"),
+        ]
+        self.translate_stream, self.dequeue_pages = [p.start() for p in patches]
+        for p in patches:
+            self.addCleanup(p.stop)
+
+    def run_task(self, id: str):
+        return backend.translate_task.apply(
+            ("inputs/deliveries.pdf", {}), {"tenant": "t", "cost": 1}, task_id=id
+        )
+
+    def test_first_delivery(self):
+        self.assertEqual(self.run_task("first").state, "SUCCESS")
+        self.dequeue_pages.assert_called_once_with("t", 1)
+        self.assertFalse(backend.store.exists(backend.delivery_key("first")))
+
+    def test_redelivery(self):
+        # The worker died during the first delivery
+        backend.store.put(backend.delivery_key("again"), b"1")
+        self.assertEqual(self.run_task("again").state, "SUCCESS")
+        self.dequeue_pages.assert_not_called()
+
+    def test_max_deliveries(self):
+        deliveries = str(backend.TASK_MAX_DELIVERIES).encode()
+        backend.store.put(backend.delivery_key("lost"), deliveries)
+        result = self.run_task("lost")
+        self.assertEqual(result.state, "FAILURE")
+        self.assertIsInstance(result.result, RuntimeError)
+        self.translate_stream.assert_not_called()
+        self.assertFalse(backend.store.exists(backend.delivery_key("lost")))
+
+
+class TestSplitPages(unittest.TestCase):
+    def test_all_pages(self):
+        self.assertEqual(backend.split_pages(5, [], 2), [[0, 1], [2, 3], [4]])
+        self.assertEqual(backend.split_pages(5, None, 2), [[0, 1], [2, 3], [4]])
+
+    def test_one_shard(self):
+        self.assertEqual(backend.split_pages(3, [], 10), [[0, 1, 2]])
+
+    def test_selected_pages(self):
+        # 排序去重，并丢弃超出范围的页码
+        shards = backend.split_pages(10, [7, 2, 2, 9, 0, 42, -1], 2)
+        self.assertEqual(shards, [[0, 2], [7, 9]])
+        self.assertEqual(backend.split_pages(3, [42], 2), [])
+
+
+class TestInitWorker(unittest.TestCase):
+    def test_prefork(self):
+        from celery.concurrency.prefork import TaskPool
+
+        with patch.object(backend, "preload_worker") as preload:
+            for pool_cls in ("prefork", "processes", TaskPool):
+                backend.init_worker(Mock(pool_cls=pool_cls))
+            preload.assert_not_called()
+            for pool_cls in ("solo", "threads"):
+                backend.init_worker(Mock(pool_cls=pool_cls))
+            backend.init_worker()
+            self.assertEqual(preload.call_count, 3)
+
+
+class TestExpire(unittest.TestCase):
+    def test_expire_blobs(self):
+        store = backend.store
+        finish("expired")
+        finish("kept")
+        store.put("checkpoints/a/pages/0", b"{}")
+        expired = time.time() - backend.result_ttl() - 60
+        for key in ("results/expired/mono.pdf", "checkpoints/a/pages/0"):
+            os.utime(store.path(key), (expired, expired))
+        removed = backend.expire_blobs()
+        self.assertEqual(removed["results/"], 1)
+        self.assertEqual(removed["checkpoints/"], 1)
+        self.assertFalse(store.exists("results/expired/mono.pdf"))
+        self.assertTrue(store.exists("results/expired/dual.pdf"))
+        self.assertTrue(store.exists("results/kept/mono.pdf"))
+
+    def test_expire_inputs(self):
+        store = backend.store
+        client = backend.flask_app.test_client()
+        documents = []
+        for text in ("expired", "resubmitted"):
+            doc = Document()
+            doc.new_page().insert_text((72, 72), text)
+            documents.append(doc.tobytes())
+        expired = time.time() - backend.result_ttl() - 60
+        with patch.object(backend, "submit_task") as submit_task:
+            for document in documents:
+                data = {"file": (io.BytesIO(document), "a.pdf"), "data": "{}"}
+                client.post("/v1/translate", data=data)
+                os.utime(store.path(submit_task.call_args.args[1]), (expired, expired))
+            keys = [call.args[1] for call in submit_task.call_args_list]
+            # Submitting a stored input again keeps it for the new task
+            data = {"file": (io.BytesIO(documents[1]), "a.pdf"), "data": '{"x": 1}'}
+            client.post("/v1/translate", data=data)
+        backend.expire_blobs()
+        self.assertFalse(store.exists(keys[0]))
+        self.assertTrue(store.exists(keys[1]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+import tempfile
+import unittest
+from string import Template
+
+import numpy as np
+
+from pdf2zh.checkpoint import Checkpoint
+from pdf2zh.storage import LocalBlobStore
+
+
+class TestCheckpoint(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.store = LocalBlobStore(self.tmpdir.name)
+        self.params = {"lang_in": "en", "lang_out": "zh", "service": "google"}
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_key(self):
+        key = Checkpoint.of(b"pdf", self.store, **self.params).key
+        self.assertEqual(key, Checkpoint.of(b"pdf", self.store, **self.params).key)
+        # Parameters not affecting the translation keep the key
+        other = Checkpoint.of(b"pdf", self.store, thread=8, **self.params)
+        self.assertEqual(key, other.key)
+        self.assertNotEqual(key, Checkpoint.of(b"pdf2", self.store, **self.params).key)
+        self.params["service"] = "bing"
+        self.assertNotEqual(key, Checkpoint.of(b"pdf", self.store, **self.params).key)
+        prompt = Checkpoint.of(b"pdf", self.store, prompt=Template("a"), **self.params)
+        self.assertNotEqual(
+            prompt.key,
+            Checkpoint.of(b"pdf", self.store, prompt=Template("b"), **self.params).key,
+        )
+        # Tasks running at the same time keep their own pages
+        task = Checkpoint.of(b"pdf", self.store, "a", **self.params)
+        self.assertNotEqual(task.key, key)
+        self.assertNotEqual(
+            task.key, Checkpoint.of(b"pdf", self.store, "b", **self.params).key
+        )
+
+    def test_page(self):
+        checkpoint = Checkpoint.of(b"pdf", self.store, **self.params)
+        self.assertIsNone(checkpoint.page(0))
+        checkpoint.save_page(0, "BT ET", {"12": "q Q"})
+        resumed = Checkpoint.of(b"pdf", self.store, **self.params)
+        self.assertEqual(
+            resumed.page(0), {"contents": "BT ET", "objects": {"12": "q Q"}}
+        )
+
+    def test_layout(self):
+        checkpoint = Checkpoint.of(b"pdf", self.store, **self.params)
+        self.assertIsNone(checkpoint.layout(0))
+        layout = np.ones((800, 600), dtype=np.uint16)
+        layout[100:200, 50:300] = 3
+        checkpoint.save_layout(0, layout)
+        resumed = checkpoint.layout(0)
+        self.assertEqual(resumed.dtype, np.uint16)
+        np.testing.assert_array_equal(resumed, layout)
+
+    def test_clear(self):
+        checkpoint = Checkpoint.of(b"pdf", self.store, **self.params)
+        checkpoint.save_page(0, "BT ET", {})
+        checkpoint.save_layout(0, np.zeros((2, 2), dtype=np.uint16))
+        checkpoint.clear()
+        self.assertIsNone(checkpoint.page(0))
+        self.assertIsNone(checkpoint.layout(0))
+
+    def test_clear_resumed(self):
+        checkpoint = Checkpoint.of(b"pdf", self.store, **self.params)
+        checkpoint.save_page(0, "BT ET", {})
+        checkpoint.save_layout(0, np.zeros((2, 2), dtype=np.uint16))
+        # A resumed page is not laid out again, its layout is removed anyway
+        resumed = Checkpoint.of(b"pdf", self.store, **self.params)
+        self.assertIsNotNone(resumed.page(0))
+        resumed.clear()
+        self.assertIsNone(checkpoint.layout(0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,39 @@
+import json
+import os
+import tempfile
+import unittest
+
+from pdf2zh.config import ConfigManager
+
+
+class TestConfigManager(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "config.json")
+        with open(self.path, "w") as f:
+            f.write("{}")
+        self.instance = ConfigManager._instance
+        ConfigManager.custome_config(self.path)
+
+    def tearDown(self):
+        ConfigManager._instance = self.instance
+        self.tmpdir.cleanup()
+
+    def test_shared_values(self):
+        # Equal defaults can be the same object, they are saved as they are
+        ConfigManager.get("A", 20)
+        ConfigManager.get("B", 20)
+        ConfigManager.set("C", [1, 1])
+        with open(self.path) as f:
+            self.assertEqual(json.load(f), {"A": 20, "B": 20, "C": [1, 1]})
+
+    def test_circular_references(self):
+        value = {"a": []}
+        value["a"].append(value)
+        ConfigManager.set("C", value)
+        with open(self.path) as f:
+            self.assertEqual(json.load(f)["C"], {"a": [None]})
+
+
+if __name__ == "__main__":
+    unittest.main()
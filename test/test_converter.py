@@ -1,8 +1,18 @@
+import threading
+import time
 import unittest
+from asyncio import CancelledError
+from concurrent.futures import ThreadPoolExecutor
 from unittest.mock import Mock, patch, MagicMock
 from pdfminer.layout import LTPage, LTChar, LTLine
 from pdfminer.pdfinterp import PDFResourceManager
-from pdf2zh.converter import PDFConverterEx, TranslateConverter
+from pdf2zh.converter import (
+    CharRecord,
+    PDFConverterEx,
+    TranslateConverter,
+    cancellable_sleep,
+    gather,
+)
 
 
 class TestPDFConverterEx(unittest.TestCase):
@@ -39,6 +49,26 @@ class TestPDFConverterEx(unittest.TestCase):
         )
         self.assertEqual(result, 120.0)  # Expected text width
 
+    def test_char_record_matches_ltchar(self):
+        for vertical in (False, True):
+            font = Mock()
+            font.fontname = "ABCDEF+CMR10"
+            font.is_vertical.return_value = vertical
+            font.char_width.return_value = 0.5
+            font.char_disp.return_value = (None, 880) if vertical else 0
+            font.get_descent.return_value = -0.2
+            matrix = (10, 0, 0, 12, 72, 300)
+            record = CharRecord(matrix, font, 1.0, 1.0, 0.5, 65, "A")
+            ltchar = LTChar(
+                matrix, font, 1.0, 1.0, 0.5, "A", 0.5, font.char_disp(65), None, None
+            )
+            self.assertEqual((record.x0, record.y0, record.x1, record.y1), ltchar.bbox)
+            self.assertEqual(record.size, ltchar.size)
+            self.assertEqual(record.adv, ltchar.adv)
+            self.assertEqual(record.width, ltchar.width)
+            self.assertEqual(record.get_text(), "A")
+            self.assertEqual(record.cid, 65)
+
 
 class TestTranslateConverter(unittest.TestCase):
     def setUp(self):
@@ -95,6 +125,42 @@ class TestTranslateConverter(unittest.TestCase):
         result = self.converter.receive_layout(ltpage)
         self.assertIsNotNone(result)
 
+    def test_receive_layout_with_executor(self):
+        ltpage = LTPage(1, (0, 0, 500, 500))
+        ltpage.add(LTLine(0.1, (0, 0), (10, 20)))
+        mock_layout = MagicMock()
+        mock_layout.shape = (100, 100)
+        self.converter.layout = [None, mock_layout]
+        # Paragraphs are translated in the shared pool, which is kept running
+        executor = MagicMock(wraps=ThreadPoolExecutor(1))
+        self.converter.executor = executor
+        self.assertIsNotNone(self.converter.receive_layout(ltpage))
+        executor.shutdown.assert_not_called()
+
+    def test_formula_font_and_char(self):
+        self.assertTrue(self.converter.is_formula_font("ABCDEF+CMMI10"))
+        self.assertTrue(self.converter.is_formula_font(b"CMSY10"))
+        self.assertFalse(self.converter.is_formula_font("ABCDEF+CMR10"))
+        self.assertTrue(self.converter.is_formula_char("α"))
+        self.assertTrue(self.converter.is_formula_char("∑"))
+        self.assertFalse(self.converter.is_formula_char("a"))
+        self.assertFalse(self.converter.is_formula_char(" "))
+
+    def test_formula_custom_regex(self):
+        converter = TranslateConverter(
+            self.rsrcmgr,
+            vfont=r".*Times",
+            vchar=r"[0-9]",
+            layout=self.layout,
+            lang_in="en",
+            lang_out="zh",
+            service="google",
+        )
+        self.assertTrue(converter.is_formula_font("ABCDEF+NimbusTimes"))
+        self.assertFalse(converter.is_formula_font("CMMI10"))
+        self.assertTrue(converter.is_formula_char("7"))
+        self.assertFalse(converter.is_formula_char("α"))
+
     def test_invalid_translation_service(self):
         with self.assertRaises(ValueError):
             TranslateConverter(
@@ -106,5 +172,33 @@ class TestTranslateConverter(unittest.TestCase):
             )
 
 
+class TestCancellation(unittest.TestCase):
+    def test_gather(self):
+        with ThreadPoolExecutor(2) as executor:
+            futures = [executor.submit(lambda x: x * 2, i) for i in range(5)]
+            self.assertEqual(gather(futures, threading.Event()), [0, 2, 4, 6, 8])
+
+    def test_gather_cancelled(self):
+        event, release = threading.Event(), threading.Event()
+        executor = ThreadPoolExecutor(1)
+        futures = [executor.submit(release.wait, 10) for _ in range(3)]
+        threading.Timer(0.2, event.set).start()
+        start = time.monotonic()
+        with self.assertRaises(CancelledError):
+            gather(futures, event)
+        # The running call is not waited for, the queued ones are dropped
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertTrue(futures[2].cancelled())
+        release.set()
+        executor.shutdown()
+
+    def test_cancellable_sleep(self):
+        event = threading.Event()
+        threading.Timer(0.1, event.set).start()
+        start = time.monotonic()
+        cancellable_sleep(event, 10)
+        self.assertLess(time.monotonic() - start, 1)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -5,6 +5,7 @@ from pdf2zh.doclayout import (
     OnnxModel,
     YoloResult,
     YoloBox,
+    nms,
 )
 
 
@@ -43,6 +44,36 @@ class TestOnnxModel(unittest.TestCase):
         self.assertGreater(padded_height, 0)
         self.assertGreater(padded_width, 0)
 
+    def test_preprocess(self):
+        image = np.full((100, 200, 3), 255, dtype=np.uint8)
+        pix = self.model.preprocess(image, 1024)
+
+        # Validate the layout, type and range of the model input
+        self.assertEqual(pix.shape, (1, 3, 512, 1024))
+        self.assertEqual(pix.dtype, np.float32)
+        self.assertAlmostEqual(float(pix.min()), 1.0)
+        self.assertAlmostEqual(float(pix.max()), 1.0)
+
+    def test_preprocess_reversed_view(self):
+        rgb = np.random.randint(0, 256, (100, 200, 3), dtype=np.uint8)
+        bgr = np.ascontiguousarray(rgb[:, :, ::-1])
+        expected = self.model.preprocess(bgr, 1024).copy()
+
+        # A reversed view of RGB pixels gives the same input as BGR pixels
+        pix = self.model.preprocess(rgb[:, :, ::-1], 1024)
+        np.testing.assert_array_equal(pix, expected)
+        np.testing.assert_allclose(pix[0, 0, 0, 0], bgr[0, 0, 0] / 255.0, rtol=1e-6)
+
+    def test_preprocess_reuses_buffer(self):
+        image = np.ones((100, 200, 3), dtype=np.uint8)
+        first = self.model.preprocess(image, 1024)
+        second = self.model.preprocess(image, 1024)
+        self.assertIs(first, second)
+
+        # A different size allocates a new buffer
+        third = self.model.preprocess(image, 512)
+        self.assertEqual(third.shape, (1, 3, 256, 512))
+
     def test_scale_boxes(self):
         img1_shape = (1024, 1024)  # Model input shape
         img0_shape = (500, 300)  # Original image shape
@@ -54,9 +85,23 @@ class TestOnnxModel(unittest.TestCase):
         self.assertEqual(scaled_boxes.shape, boxes.shape)
         self.assertTrue(np.all(scaled_boxes <= max(img0_shape)))
 
+    def test_warmup(self):
+        self.model.model.run.return_value = [np.zeros((1, 0, 6), dtype=np.float32)]
+        self.model.warmup()
+
+        # One inference on a blank A4 page at the size used for translation
+        self.model.model.run.assert_called_once()
+        pix = self.model.model.run.call_args[0][1]["images"]
+        self.assertEqual(pix.shape[:3], (1, 3, 832))
+        self.assertAlmostEqual(float(pix.min()), 114 / 255, places=6)
+
     def test_predict(self):
         # Mock model inference output
         mock_output = np.random.random((1, 300, 6))
+        mock_output[..., :4] = (
+            mock_output[..., :4] * 200 + 400
+        )  # Keep the boxes inside the image
+        mock_output[..., 2:4] += 200
         self.model.model.run.return_value = [mock_output]
 
         # Create a dummy image
@@ -70,6 +115,40 @@ class TestOnnxModel(unittest.TestCase):
         self.assertGreater(len(results[0].boxes), 0)
         self.assertIsInstance(results[0].boxes[0], YoloBox)
 
+    def test_postprocess(self):
+        preds = np.array(
+            [
+                [100, 100, 300, 300, 0.9, 0],
+                [105, 105, 300, 300, 0.8, 0],  # Duplicate of the first box
+                [105, 105, 300, 300, 0.7, 1],  # Same place, other class
+                [-50, 900, 2000, 1100, 0.6, 1],  # Partly outside the image
+                [100, 100, 200, 200, 0.1, 0],  # Low confidence
+            ],
+            dtype=np.float32,
+        )
+        result = self.model.postprocess(preds, (1024, 1024), (1024, 1024))
+
+        # Validate the filtering, deduplication and clipping
+        np.testing.assert_array_equal(result[:, 4], np.float32([0.9, 0.7, 0.6]))
+        np.testing.assert_array_equal(result[2, :4], [0, 900, 1024, 1024])
+
+        result = self.model.postprocess(preds, (1024, 1024), (1024, 1024), classes=[1])
+        np.testing.assert_array_equal(result[:, 5], [1, 1])
+
+
+class TestNMS(unittest.TestCase):
+    def test_nms(self):
+        boxes = np.array(
+            [[0, 0, 10, 10], [1, 1, 10, 10], [20, 20, 30, 30], [0, 0, 10, 9]],
+            dtype=np.float32,
+        )
+        scores = np.array([0.5, 0.9, 0.8, 0.7])
+
+        # The best box suppresses its overlaps, disjoint boxes are kept
+        np.testing.assert_array_equal(nms(boxes, scores, 0.7), [1, 2])
+        np.testing.assert_array_equal(nms(boxes, scores, 0.95), [1, 2, 3, 0])
+        self.assertEqual(len(nms(np.zeros((0, 4)), np.zeros(0))), 0)
+
 
 class TestYoloResult(unittest.TestCase):
     def test_yolo_result(self):
@@ -87,6 +166,13 @@ class TestYoloResult(unittest.TestCase):
         self.assertGreater(result.boxes[0].conf, result.boxes[1].conf)
         self.assertEqual(result.names, names)
 
+        # Validate the arrays, sorted by confidence
+        np.testing.assert_array_equal(result.conf, [0.9, 0.8])
+        np.testing.assert_array_equal(result.cls, [0, 1])
+        self.assertEqual(result.xyxy.shape, (2, 4))
+        self.assertEqual(result.class_ids(["class2"]), [1])
+        self.assertEqual(len(YoloResult([], names).boxes), 0)
+
 
 class TestYoloBox(unittest.TestCase):
     def test_yolo_box(self):
@@ -0,0 +1,75 @@
+import queue
+import threading
+import unittest
+from unittest.mock import Mock, patch
+
+from pdf2zh.events import LocalEventBus, RedisEventBus
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+
+class TestLocalEventBus(unittest.TestCase):
+    def test_publish(self):
+        bus = LocalEventBus()
+        with bus.subscribe("a") as first, bus.subscribe("a") as second:
+            with bus.subscribe("b") as other:
+                bus.publish("a", "progress", {"n": 1, "total": 2})
+                # Every subscriber of the channel receives the event
+                for subscriber in (first, second):
+                    self.assertEqual(
+                        subscriber.get_nowait(),
+                        {"event": "progress", "data": {"n": 1, "total": 2}},
+                    )
+                self.assertRaises(queue.Empty, other.get_nowait)
+
+    def test_unsubscribe(self):
+        bus = LocalEventBus()
+        with bus.subscribe("a") as subscriber:
+            pass
+        self.assertEqual(bus.subscribers, {})
+        bus.publish("a", "state", {"state": "SUCCESS"})
+        self.assertRaises(queue.Empty, subscriber.get_nowait)
+
+
+@unittest.skipIf(fakeredis is None, "fakeredis is not installed")
+class TestRedisEventBus(unittest.TestCase):
+    def setUp(self):
+        with patch("redis.Redis.from_url", return_value=fakeredis.FakeRedis()):
+            self.bus = RedisEventBus("redis://")
+
+    def test_first_subscriber(self):
+        # Events published right after subscribing are not lost
+        with self.bus.subscribe("a") as subscriber:
+            self.bus.publish("a", "state", {"state": "SUCCESS"})
+            self.assertEqual(
+                subscriber.get(timeout=5),
+                {"event": "state", "data": {"state": "SUCCESS"}},
+            )
+
+    def test_reconnect(self):
+        lost = threading.Event()
+
+        def listen():
+            yield {"type": "psubscribe", "pattern": None, "channel": b"", "data": 1}
+            lost.wait()
+            raise ConnectionError()
+
+        pubsub = self.bus.client.pubsub
+        broken = Mock()
+        broken.listen.return_value = listen()
+        with (
+            patch.object(self.bus.client, "pubsub", side_effect=[broken, pubsub()]),
+            self.bus.subscribe("a") as subscriber,
+        ):
+            lost.set()
+            # Subscribers are told to read the state again once reconnected
+            self.assertEqual(subscriber.get(timeout=5), {"event": "resync", "data": {}})
+            self.bus.publish("a", "state", {"state": "SUCCESS"})
+            self.assertEqual(subscriber.get(timeout=5)["event"], "state")
+
+
+if __name__ == "__main__":
+    unittest.main()
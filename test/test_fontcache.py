@@ -0,0 +1,41 @@
+import unittest
+from unittest.mock import Mock
+from pdf2zh.fontcache import GlyphMetrics, PDFFontMetrics
+
+
+class TestGlyphMetrics(unittest.TestCase):
+    def setUp(self):
+        self.font = Mock()
+        self.font.has_glyph.return_value = 42
+        self.font.char_lengths.return_value = [0.5]
+
+    def test_memoized(self):
+        metrics = GlyphMetrics(self.font)
+        self.assertEqual(metrics.glyph(0x4E2D), 42)
+        self.assertEqual(metrics.glyph(0x4E2D), 42)
+        self.assertEqual(metrics.advance(0x4E2D), 0.5)
+        self.assertEqual(metrics.advance(0x4E2D), 0.5)
+        self.font.has_glyph.assert_called_once_with(0x4E2D)
+        self.font.char_lengths.assert_called_once_with("中", 1)
+
+    def test_shared_per_font(self):
+        self.assertIs(GlyphMetrics.of(self.font), GlyphMetrics.of(self.font))
+        self.assertIsNot(GlyphMetrics.of(self.font), GlyphMetrics.of(Mock()))
+
+
+class TestPDFFontMetrics(unittest.TestCase):
+    def test_maps_to_self(self):
+        font = Mock()
+        font.to_unichr.side_effect = lambda code: {65: "A", 66: "X"}[code]
+        font.char_width.return_value = 0.6
+        metrics = PDFFontMetrics(font)
+        self.assertTrue(metrics.maps_to_self(65))
+        self.assertFalse(metrics.maps_to_self(66))
+        self.assertFalse(metrics.maps_to_self(0x4E2D))  # KeyError
+        self.assertEqual(metrics.width(65), 0.6)
+        self.assertEqual(metrics.width(65), 0.6)
+        font.char_width.assert_called_once_with(65)
+
+
+if __name__ == "__main__":
+    unittest.main()
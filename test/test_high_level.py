@@ -0,0 +1,169 @@
+import io
+import os
+import random
+import tempfile
+import unittest
+from unittest.mock import patch
+import numpy as np
+from pdfminer.pdfdocument import PDFDocument
+from pdfminer.pdfpage import PDFPage
+from pdfminer.pdfparser import PDFParser
+from pymupdf import Document, Font
+from pdf2zh import cache
+from pdf2zh.checkpoint import Checkpoint
+from pdf2zh.doclayout import DocLayoutModel, YoloResult
+from pdf2zh.high_level import (
+    get_pages,
+    layout_mask,
+    merge_shards,
+    translate_shard,
+    translate_stream,
+)
+from pdf2zh.profiler import Profiler
+from pdf2zh.storage import LocalBlobStore
+from pdf2zh.translator import GoogleTranslator
+
+
+class TestGetPages(unittest.TestCase):
+    def setUp(self):
+        self.doc_zh = Document()
+        for i in range(30):
+            page = self.doc_zh.new_page(width=200 + i, height=300)
+            page.insert_text((20, 50), f"page {i}")
+        self.doc_zh[3].set_rotation(90)
+        fp = io.BytesIO()
+        self.doc_zh.save(fp)
+        self.doc = PDFDocument(PDFParser(fp))
+
+    def test_all_pages(self):
+        result = list(get_pages(self.doc, self.doc_zh))
+        self.assertEqual([pageno for pageno, _ in result], list(range(30)))
+
+    def test_selected_pages_match_full_scan(self):
+        expected = dict(enumerate(PDFPage.create_pages(self.doc)))
+        result = list(get_pages(self.doc, self.doc_zh, [25, 3, 3, 0, 99]))
+        self.assertEqual([pageno for pageno, _ in result], [0, 3, 25])
+        for pageno, page in result:
+            self.assertEqual(page.pageid, expected[pageno].pageid)
+            self.assertEqual(page.mediabox, expected[pageno].mediabox)
+            self.assertEqual(page.cropbox, expected[pageno].cropbox)
+            self.assertEqual(page.rotate, expected[pageno].rotate)
+            self.assertEqual(
+                [obj.objid for obj in page.contents],
+                [obj.objid for obj in expected[pageno].contents],
+            )
+
+
+class TestLayoutMask(unittest.TestCase):
+    def test_layout_mask(self):
+        names = {0: "plain text", 1: "figure"}
+        boxes = [
+            [10, 10, 50, 50, 0.9, 0],
+            [30, 30, 80, 80, 0.8, 0],
+            [60, 60, 70, 70, 0.7, 1],
+        ]
+        mask = layout_mask(YoloResult(boxes, names), 100, 100)
+
+        # Text boxes are numbered, later boxes overwrite earlier ones
+        self.assertEqual(mask.shape, (100, 100))
+        self.assertEqual(mask[99 - 20, 20], 2)
+        self.assertEqual(mask[99 - 40, 40], 3)
+        # Figures are kept as they are, the rest of the page is 1
+        self.assertEqual(mask[99 - 65, 65], 0)
+        self.assertEqual(mask[5, 5], 1)
+        np.testing.assert_array_equal(
+            layout_mask(YoloResult([], names), 10, 20), np.ones((10, 20))
+        )
+
+
+class StaticLayoutModel(DocLayoutModel):
+    """Marks the whole page as text."""
+
+    @property
+    def stride(self) -> int:
+        return 32
+
+    def predict(self, image, imgsz=1024, **kwargs) -> list:
+        h, w = image.shape[:2]
+        boxes = np.array([[0, 0, w, h, 0.9, 0]], dtype=np.float32)
+        return [YoloResult(boxes=boxes, names={0: "plain text"})]
+
+
+class TestTranslateStream(unittest.TestCase):
+    def setUp(self):
+        self.test_db = cache.init_test_db()
+        # 使用 PyMuPDF 自带的字体，避免下载
+        self.tmpdir = tempfile.TemporaryDirectory()
+        font_path = os.path.join(self.tmpdir.name, "font.ttf")
+        with open(font_path, "wb") as f:
+            f.write(Font("cjk").buffer)
+        patches = [
+            patch.dict(os.environ, {"NOTO_FONT_PATH": font_path}),
+            patch.object(GoogleTranslator, "do_translate", lambda self, text: text),
+            patch.object(GoogleTranslator, "ignore_cache", True),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+        doc = Document()
+        for i in range(3):
+            page = doc.new_page()
+            for j in range(10):
+                text = f"page {i} line {j} of the quick brown fox"
+                page.insert_text((72, 72 + 20 * j), text, fontname="Times-Roman")
+            page.insert_text((72, 320), "a", fontname="Symbol")
+        self.stream = doc.tobytes()
+        self.kwarg = {
+            "lang_in": "en",
+            "lang_out": "zh",
+            "service": "google",
+            "thread": 1,
+            "model": StaticLayoutModel(),
+        }
+
+    def tearDown(self):
+        cache.clean_test_db(self.test_db)
+        self.tmpdir.cleanup()
+
+    def test_merge_shards(self):
+        # 子集字体的标签随机生成，固定种子后输出只取决于内容
+        random.seed(0)
+        expected = translate_stream(self.stream, **self.kwarg)
+        shards = [
+            translate_shard(self.stream, pages, **self.kwarg) for pages in ([2, 0], [1])
+        ]
+        self.assertEqual(sorted(shards[0]["pages"]), [0, 2])
+        random.seed(0)
+        result = merge_shards(self.stream, shards, "zh")
+        self.assertEqual(result, expected)
+
+    def test_resume(self):
+        random.seed(0)
+        expected = translate_stream(self.stream, **self.kwarg)
+        store = LocalBlobStore(os.path.join(self.tmpdir.name, "blobs"))
+
+        def interrupt(progress):
+            if progress.n == 3:  # 前两页完成后中断
+                raise RuntimeError("killed")
+
+        checkpoint = Checkpoint.of(self.stream, store, **self.kwarg)
+        with self.assertRaises(RuntimeError):
+            translate_stream(
+                self.stream, callback=interrupt, checkpoint=checkpoint, **self.kwarg
+            )
+        self.assertIsNotNone(checkpoint.page(1))
+        self.assertIsNone(checkpoint.page(2))
+        profiler = Profiler()
+        random.seed(0)
+        result = translate_stream(
+            self.stream,
+            checkpoint=Checkpoint.of(self.stream, store, **self.kwarg),
+            profiler=profiler,
+            **self.kwarg,
+        )
+        self.assertEqual(result, expected)
+        self.assertEqual(profiler.counters["pages_resumed"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+import unittest
+from pdf2zh.metrics import MetricsProfiler, Registry, Samples, series
+
+
+class TestSamples(unittest.TestCase):
+    def test_series(self):
+        self.assertEqual(series("a"), "a")
+        self.assertEqual(series("a", y="1", x="2"), 'a{x="2",y="1"}')
+
+    def test_escape(self):
+        self.assertEqual(series("a", x='C:\\a "b"\n'), r'a{x="C:\\a \"b\"\n"}')
+
+    def test_observe(self):
+        samples = Samples()
+        samples.observe("pdf2zh_layout_seconds", 0.3)
+        values = samples.values
+        self.assertNotIn('pdf2zh_layout_seconds_bucket{le="0.25"}', values)
+        self.assertEqual(values['pdf2zh_layout_seconds_bucket{le="0.5"}'], 1)
+        self.assertEqual(values['pdf2zh_layout_seconds_bucket{le="+Inf"}'], 1)
+        self.assertEqual(values["pdf2zh_layout_seconds_count"], 1)
+        self.assertAlmostEqual(values["pdf2zh_layout_seconds_sum"], 0.3)
+
+
+class TestRegistry(unittest.TestCase):
+    def test_render(self):
+        registry = Registry()
+        registry.inc("pdf2zh_bytes_in_total", 100)
+        registry.inc("pdf2zh_bytes_in_total", 20)
+        registry.inc("pdf2zh_cache_requests_total", 3, result="hit")
+        registry.inc("pdf2zh_cache_requests_total", 1, result="miss")
+        text = registry.render({"pdf2zh_queue_depth": ("Queued tasks.", 2)})
+        lines = text.splitlines()
+        self.assertIn("# TYPE pdf2zh_bytes_in_total counter", lines)
+        self.assertIn("pdf2zh_bytes_in_total 120.0", lines)
+        self.assertIn("pdf2zh_cache_hit_ratio 0.75", lines)
+        self.assertIn("# TYPE pdf2zh_queue_depth gauge", lines)
+        self.assertIn("pdf2zh_queue_depth 2.0", lines)
+
+    def test_render_escaped(self):
+        registry = Registry()
+        registry.inc("pdf2zh_tasks_total", state='a"\nb')
+        self.assertIn('pdf2zh_tasks_total{state="a\\"\\nb"} 1.0', registry.render())
+
+    def test_histogram_order(self):
+        registry = Registry()
+        samples = Samples()
+        for seconds in [0.01, 0.7, 100]:
+            samples.observe(
+                "pdf2zh_translator_request_seconds", seconds, service="google"
+            )
+        registry.push(samples)
+        lines = [
+            line
+            for line in registry.render().splitlines()
+            if line.startswith("pdf2zh_translator_request_seconds")
+        ]
+        buckets = [line for line in lines if "_bucket" in line]
+        self.assertIn('le="0.05",service="google"} 1.0', buckets[0])
+        self.assertIn('le="+Inf",service="google"} 3.0', buckets[-1])
+        self.assertTrue(lines[-1].startswith("pdf2zh_translator_request_seconds_count"))
+
+
+class TestMetricsProfiler(unittest.TestCase):
+    def test_flush(self):
+        registry = Registry()
+        profiler = MetricsProfiler(registry, "google")
+        profiler.add("translator", 0.2)
+        profiler.add("predict", 0.1, 0)
+        profiler.incr("pages")
+        profiler.incr("cache_hit")
+        self.assertEqual(registry.store.pull(), {})
+        profiler.flush()
+        values = registry.store.pull()
+        self.assertEqual(values["pdf2zh_pages_total"], 1)
+        self.assertEqual(values['pdf2zh_cache_requests_total{result="hit"}'], 1)
+        self.assertEqual(
+            values['pdf2zh_translator_request_seconds_count{service="google"}'], 1
+        )
+        self.assertEqual(values["pdf2zh_layout_seconds_count"], 1)
+        # 计时仍然记录在 profiler 中
+        self.assertIn("translator", profiler.totals())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,138 @@
+import hashlib
+import json
+import os
+import unittest
+from unittest.mock import Mock, patch
+from pdfminer import settings
+from pdfminer.pdfinterp import PDFInterpreterError, PDFResourceManager
+from pdfminer.pdfpage import PDFPage
+from pdfminer.pdftypes import PDFStream
+from pdfminer.psparser import LIT
+from pdf2zh.pdfinterp import PDFPageInterpreterEx
+
+FILES = os.path.join(os.path.dirname(__file__), "file")
+
+
+def make_stream(data, objid=None, **attrs):
+    stream = PDFStream(attrs, data)
+    stream.objid = objid
+    return stream
+
+
+class TestHasText(unittest.TestCase):
+    def setUp(self):
+        self.interpreter = PDFPageInterpreterEx(PDFResourceManager(), Mock(), {})
+
+    def test_text_operator(self):
+        streams = [make_stream(b"q 1 0 0 1 0 0 cm BT /F1 12 Tf (a) Tj ET Q")]
+        self.assertTrue(self.interpreter.has_text(streams, {}))
+
+    def test_vector_only(self):
+        streams = [make_stream(b"q 0 0 m 10 10 l S /BTX gs 1 w Q")]
+        self.assertFalse(self.interpreter.has_text(streams, {}))
+
+    def test_nested_forms(self):
+        image = make_stream(b"\x00" * 16, objid=10, Subtype=LIT("Image"))
+        form = {"Subtype": LIT("Form"), "Resources": {"ProcSet": []}}
+        plot = make_stream(b"0 0 m 5 5 l S", objid=11, **form)
+        label = make_stream(b"BT (x) Tj ET", objid=12, **form)
+        streams = [make_stream(b"/Im0 Do /Fm0 Do")]
+        resources = {"XObject": {"Im0": image, "Fm0": plot}}
+        self.assertFalse(self.interpreter.has_text(streams, resources))
+        resources["XObject"]["Fm1"] = label
+        self.assertTrue(self.interpreter.has_text(streams, resources))
+        self.assertEqual(self.interpreter.text_cache, {10: False, 11: False, 12: True})
+
+    def test_inherited_resources(self):
+        # A form without Resources shows text depending on its caller
+        shared = make_stream(b"/Fm1 Do", objid=13, Subtype=LIT("Form"))
+        label = make_stream(b"BT (x) Tj ET", objid=12, Subtype=LIT("Form"))
+        plot = make_stream(b"0 0 m 5 5 l S", objid=11, Subtype=LIT("Form"))
+        text = {"XObject": {"Fm1": label}}
+        self.assertTrue(self.interpreter.form_has_text(shared, text))
+        vector = {"XObject": {"Fm1": plot}}
+        self.assertFalse(self.interpreter.form_has_text(shared, vector))
+        self.assertNotIn(13, self.interpreter.text_cache)
+
+    def test_recursive_form(self):
+        loop = make_stream(b"/Fm0 Do", objid=14, Subtype=LIT("Form"))
+        streams = [make_stream(b"/Fm0 Do")]
+        self.assertTrue(self.interpreter.has_text(streams, {"XObject": {"Fm0": loop}}))
+
+    def test_cache_shared_with_dup(self):
+        self.assertIs(self.interpreter.dup().text_cache, self.interpreter.text_cache)
+
+
+class TestExecute(unittest.TestCase):
+    def setUp(self):
+        self.device = Mock()
+        # 固定设备输出，只比较解释器自身写回的指令流
+        self.device.end_page.return_value = "BT ET "
+        self.device.end_figure.return_value = "BT ET "
+
+    def test_filtered_operators(self):
+        interpreter = PDFPageInterpreterEx(PDFResourceManager(), self.device, {})
+        interpreter.init_resources({})
+        interpreter.init_state((1, 0, 0, 1, 0, 0))
+        stream = make_stream(
+            b"q 1 0 0 1 72.5 700 cm /GS0 gs 0.5 w BT /F1 12 Tf 14 TL (a) Tj T* "
+            b"[(b) -250 (c)] TJ (d) ' 1 2 (e) \" ET /P <</MCID 0>> BDC "
+            b"0 0 m 10 10 l S EMC /OC /L0 DP /X MP Q\n"
+        )
+        self.assertEqual(
+            interpreter.execute([stream]),
+            " q 1 0 0 1 72.500000 700 cm /GS0 gs 0.500000 w  BT  ET 0 0 m 10 10 l  S  Q ",
+        )
+
+    def run_text(self, resources: dict, data: bytes) -> PDFPageInterpreterEx:
+        interpreter = PDFPageInterpreterEx(PDFResourceManager(), self.device, {})
+        interpreter.init_resources(resources)
+        interpreter.init_state((1, 0, 0, 1, 0, 0))
+        interpreter.execute([make_stream(data)])
+        return interpreter
+
+    def test_missing_font_resource(self):
+        interpreter = self.run_text({}, b"BT /F1 12 Tf (a) Tj ET\n")
+        # Formula characters are written back with the name used by the page
+        font = interpreter.textstate.font
+        self.assertEqual(interpreter.fontid[font], "F1")
+        self.assertIs(interpreter.fontmap["F1"], font)
+        self.device.render_string.assert_called_once()
+
+    def test_unknown_font(self):
+        spec = {"Type": LIT("Font"), "Subtype": LIT("Type1"), "BaseFont": LIT("Times")}
+        data = b"BT /F0 12 Tf (a) Tj /F1\x00 12 Tf (b) Tj ET\n"
+        interpreter = self.run_text({"Font": {"F0": spec}}, data)
+        known, unknown = interpreter.fontmap["F0"], interpreter.fontmap["F1\x00"]
+        self.assertIsNot(known, unknown)
+        self.assertEqual(interpreter.fontid[known], "F0")
+        self.assertEqual(interpreter.fontid[unknown], "F1\x00")
+        self.assertIs(interpreter.textstate.font, unknown)
+
+    def test_unknown_font_strict(self):
+        with patch.object(settings, "STRICT", True):
+            with self.assertRaises(PDFInterpreterError):
+                self.run_text({}, b"BT /F1 12 Tf (a) Tj ET\n")
+
+    def test_patch_fixture(self):
+        # 由查表分发之前的解释器生成，逐个对象比较写回的指令流
+        with open(os.path.join(FILES, "pdfinterp.patch.json")) as f:
+            fixture = json.load(f)
+        for name, expected in fixture.items():
+            with open(os.path.join(FILES, name), "rb") as f:
+                for pageno, page in enumerate(PDFPage.get_pages(f)):
+                    obj_patch = {}
+                    interpreter = PDFPageInterpreterEx(
+                        PDFResourceManager(), self.device, obj_patch
+                    )
+                    page.page_xref = 0
+                    interpreter.process_page(page)
+                    digests = {
+                        str(xref): hashlib.sha256(ops.encode()).hexdigest()
+                        for xref, ops in obj_patch.items()
+                    }
+                    self.assertEqual(digests, expected[str(pageno)], name)
+
+
+if __name__ == "__main__":
+    unittest.main()
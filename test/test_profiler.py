@@ -0,0 +1,63 @@
+import json
+import unittest
+from pdf2zh import cache
+from pdf2zh.profiler import Profiler, stage
+from pdf2zh.translator import BaseTranslator
+
+
+class EchoTranslator(BaseTranslator):
+    name = "echo"
+
+    def do_translate(self, text):
+        return text
+
+
+class TestProfiler(unittest.TestCase):
+    def test_stage(self):
+        profiler = Profiler()
+        with profiler.stage("render", 0):
+            pass
+        with profiler.stage("render", 1):
+            pass
+        with profiler.stage("write"):
+            pass
+        report = profiler.report()
+        self.assertEqual(report["stages"]["render"]["count"], 2)
+        self.assertEqual(report["stages"]["write"]["count"], 1)
+        self.assertEqual(sorted(report["pages"]), ["0", "1"])
+        self.assertIn("render", report["pages"]["0"])
+        self.assertNotIn("write", report["pages"]["0"])
+        json.dumps(report)
+
+    def test_stage_records_on_error(self):
+        profiler = Profiler()
+        with self.assertRaises(ValueError):
+            with profiler.stage("predict", 0):
+                raise ValueError()
+        self.assertIn("predict", profiler.totals())
+
+    def test_disabled(self):
+        with stage(None, "render"):
+            pass
+
+
+class TestTranslatorProfile(unittest.TestCase):
+    def setUp(self):
+        self.test_db = cache.init_test_db()
+
+    def tearDown(self):
+        cache.clean_test_db(self.test_db)
+
+    def test_translate(self):
+        translator = EchoTranslator("en", "zh", "test")
+        translator.profiler = Profiler()
+        translator.translate("Hello")
+        translator.translate("Hello")
+        stages = translator.profiler.report()["stages"]
+        self.assertEqual(stages["translator"]["count"], 1)
+        # 两次查询加一次写入
+        self.assertEqual(stages["cache"]["count"], 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
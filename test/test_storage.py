@@ -0,0 +1,186 @@
+import io
+import os
+import tempfile
+import time
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest.mock import Mock
+from pdf2zh.storage import (
+    LocalBlobStore,
+    LocalJobIndex,
+    RedisJobIndex,
+    S3BlobStore,
+    open_store,
+)
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+
+class TestLocalBlobStore(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.store = LocalBlobStore(self.tmpdir.name)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_put_get(self):
+        self.assertFalse(self.store.exists("results/1/mono.pdf"))
+        self.assertEqual(self.store.put("results/1/mono.pdf", b"abc"), 3)
+        self.assertTrue(self.store.exists("results/1/mono.pdf"))
+        self.assertEqual(self.store.get("results/1/mono.pdf"), b"abc")
+        self.assertEqual(self.store.size("results/1/mono.pdf"), 3)
+        with self.store.open("results/1/mono.pdf") as f:
+            self.assertEqual(f.read(), b"abc")
+
+    def test_put_stream(self):
+        self.store.put("inputs/a.pdf", io.BytesIO(b"x" * 3000000))
+        self.assertEqual(self.store.size("inputs/a.pdf"), 3000000)
+        # No temporary files are left next to the blob
+        self.assertEqual(
+            os.listdir(os.path.join(self.tmpdir.name, "inputs")), ["a.pdf"]
+        )
+
+    def test_delete(self):
+        self.store.put("results/1/mono.pdf", b"abc")
+        self.store.delete("results/1/mono.pdf")
+        self.store.delete("results/1/mono.pdf")
+        self.assertFalse(self.store.exists("results/1/mono.pdf"))
+        self.assertFalse(os.path.exists(os.path.join(self.tmpdir.name, "results", "1")))
+
+    def test_touch(self):
+        self.assertFalse(self.store.touch("inputs/a.pdf"))
+        self.store.put("inputs/a.pdf", b"abc")
+        old = time.time() - 7200
+        os.utime(self.store.path("inputs/a.pdf"), (old, old))
+        self.assertTrue(self.store.touch("inputs/a.pdf"))
+        self.assertEqual(self.store.expire("inputs/", 3600), 0)
+
+    def test_invalid_key(self):
+        with self.assertRaises(ValueError):
+            self.store.put("../outside.pdf", b"abc")
+
+    def test_expire(self):
+        self.store.put("results/1/mono.pdf", b"abc")
+        self.store.put("results/2/mono.pdf", b"abc")
+        self.store.put("inputs/a.pdf", b"abc")
+        old = time.time() - 7200
+        for key in ("results/1/mono.pdf", "inputs/a.pdf"):
+            os.utime(self.store.path(key), (old, old))
+        self.assertEqual(self.store.expire("results/", 3600), 1)
+        self.assertFalse(os.path.exists(os.path.join(self.tmpdir.name, "results", "1")))
+        self.assertTrue(self.store.exists("results/2/mono.pdf"))
+        # Other prefixes are left alone
+        self.assertTrue(self.store.exists("inputs/a.pdf"))
+        self.assertEqual(self.store.expire("missing/", 3600), 0)
+
+
+class TestS3BlobStore(unittest.TestCase):
+    def test_expire(self):
+        store = S3BlobStore.__new__(S3BlobStore)
+        store.client, store.bucket, store.prefix = Mock(), "bucket", "pdf2zh/"
+        now = datetime.now(timezone.utc)
+        store.client.get_paginator.return_value.paginate.return_value = [
+            {
+                "Contents": [
+                    {"Key": "pdf2zh/results/1/mono.pdf", "LastModified": now},
+                    {
+                        "Key": "pdf2zh/results/2/mono.pdf",
+                        "LastModified": now - timedelta(hours=2),
+                    },
+                ]
+            },
+            {},
+        ]
+        self.assertEqual(store.expire("results/", 3600), 1)
+        store.client.get_paginator.return_value.paginate.assert_called_once_with(
+            Bucket="bucket", Prefix="pdf2zh/results/"
+        )
+        store.client.delete_objects.assert_called_once_with(
+            Bucket="bucket",
+            Delete={"Objects": [{"Key": "pdf2zh/results/2/mono.pdf"}], "Quiet": True},
+        )
+
+
+class TestLocalJobIndex(unittest.TestCase):
+    def test_claim(self):
+        jobs = LocalJobIndex()
+        self.assertEqual(jobs.claim("k", "a", 60), "a")
+        self.assertEqual(jobs.claim("k", "b", 60), "a")
+        jobs.set("k", "c", 60)
+        self.assertEqual(jobs.claim("k", "d", 60), "c")
+
+    def test_expired(self):
+        jobs = LocalJobIndex()
+        jobs.claim("k", "a", -1)
+        self.assertEqual(jobs.claim("k", "b", 60), "b")
+
+    def test_queued_pages(self):
+        jobs = LocalJobIndex()
+        self.assertEqual(jobs.add_pages("t", 5), 5)
+        self.assertEqual(jobs.add_pages("t", -2), 3)
+        self.assertEqual(jobs.queued_pages("t"), 3)
+        self.assertEqual(jobs.queued_pages("other"), 0)
+        # The count never drops below zero
+        self.assertEqual(jobs.add_pages("t", -9), 0)
+        self.assertEqual(jobs.queued_pages("t"), 0)
+
+
+class JobIndexTests:
+    """Sharing of jobs, run against every job index."""
+
+    def test_hold(self):
+        jobs = self.jobs
+        self.assertEqual(jobs.claim("k", "a", 60), "a")
+        self.assertTrue(jobs.hold("a", "b", 60))
+        self.assertEqual(jobs.resolve("b"), "a")
+        self.assertEqual(jobs.resolve("a"), "a")
+        self.assertEqual(jobs.release("a"), ("a", 1))
+        self.assertEqual(jobs.claim("k", "c", 60), "a")
+        # The job and its record are dropped with the last id
+        self.assertEqual(jobs.release("b"), ("a", 0))
+        self.assertEqual(jobs.resolve("b"), "b")
+        self.assertFalse(jobs.hold("a", "d", 60))
+        self.assertEqual(jobs.claim("k", "e", 60), "e")
+
+    def test_release_replaced(self):
+        jobs = self.jobs
+        jobs.claim("k", "a", 60)
+        jobs.set("k", "b", 60)
+        self.assertEqual(jobs.release("a"), ("a", 0))
+        self.assertEqual(jobs.claim("k", "c", 60), "b")
+
+    def test_release_unknown(self):
+        self.assertEqual(self.jobs.release("x"), ("x", 0))
+
+
+class TestLocalJobSharing(JobIndexTests, unittest.TestCase):
+    def setUp(self):
+        self.jobs = LocalJobIndex()
+
+
+@unittest.skipIf(fakeredis is None, "fakeredis is not installed")
+class TestRedisJobIndex(JobIndexTests, unittest.TestCase):
+    def setUp(self):
+        self.jobs = RedisJobIndex.__new__(RedisJobIndex)
+        self.jobs.client, self.jobs.prefix = fakeredis.FakeRedis(), "pdf2zh:job:"
+
+    def test_claim(self):
+        self.assertEqual(self.jobs.claim("k", "a", 60), "a")
+        self.assertEqual(self.jobs.claim("k", "b", 60), "a")
+        # The losing claim leaves no holders behind
+        self.assertFalse(self.jobs.hold("b", "c", 60))
+
+
+class TestOpenStore(unittest.TestCase):
+    def test_local(self):
+        store = open_store("file:///tmp/pdf2zh-blobs")
+        self.assertIsInstance(store, LocalBlobStore)
+        self.assertEqual(store.root, "/tmp/pdf2zh-blobs")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+import unittest
+from unittest.mock import Mock
+from pdf2zh.typesetter import OpType, Paragraph, Typesetter, tokenize
+
+
+class TestTokenize(unittest.TestCase):
+    def test_text_and_formulas(self):
+        self.assertEqual(tokenize("a {v0} b{ V 1 }c", 2), ["a ", 0, " b", 1, "c"])
+
+    def test_invalid_formulas_dropped(self):
+        self.assertEqual(tokenize("{v5}x{v }y", 2), ["x", "y"])
+
+    def test_concatenated_digits(self):
+        self.assertEqual(tokenize("{v1 2}", 13), [12])
+
+
+class TestTypesetter(unittest.TestCase):
+    def setUp(self):
+        self.noto = Mock()
+        self.noto.advance.return_value = 1.0
+        self.noto.glyph.side_effect = lambda code: code - 0x4E00
+        self.tiro = Mock()
+        self.tiro.maps_to_self.side_effect = lambda code: code < 0x80
+        self.tiro.width.return_value = 0.5
+        vch = Mock(x0=10, y0=20, size=8, cid=0x41, font="F1")
+        vch.get_text.return_value = "x"
+        self.typesetter = Typesetter(
+            fontmap={"tiro": Mock(), "F1": Mock()},
+            fontid={"F1": "F1"},
+            noto_name="noto",
+            noto_metrics=self.noto,
+            tiro_metrics=self.tiro,
+            var=[[vch]],
+            varl=[[]],
+            varf=[0.5],
+            vlen=[4.0],
+        )
+
+    def test_font_runs(self):
+        para = Paragraph(100, 0, 0, 100, 90, 110, 10, False)
+        items, lidx = self.typesetter.layout(para, "ab丁", 10)
+        self.assertEqual(lidx, 0)
+        self.assertEqual(
+            items,
+            [
+                (OpType.TEXT, 0, "tiro", 10, 0, 0, "6162"),
+                (OpType.TEXT, 0, "noto", 10, 10.0, 0, "0001"),
+            ],
+        )
+
+    def test_line_break_and_formula(self):
+        para = Paragraph(100, 0, 0, 12, 90, 110, 10, True)
+        items, lidx = self.typesetter.layout(para, "ab{v0}c", 10)
+        self.assertEqual(lidx, 1)
+        self.assertEqual(items[0], (OpType.TEXT, 0, "tiro", 10, 0, 0, "6162"))
+        self.assertEqual(items[1], (OpType.TEXT, 1, "F1", 8, 0, 0.5, "41"))
+        self.assertEqual(items[2], (OpType.TEXT, 1, "tiro", 10, 4.0, 0, "63"))
+        self.typesetter.render(items, 100, 10, 1.5)
+        self.assertEqual(
+            self.typesetter.ops[1],
+            "/F1 8.000000 Tf 1 0 0 1 0.000000 85.500000 Tm [<41>] TJ ",
+        )
+
+    def test_formula_scaled_with_text(self):
+        para = Paragraph(100, 0, 0, 100, 90, 110, 10, False)
+        items, _ = self.typesetter.layout(para, "a{v0}b", 5)
+        self.assertEqual(items[0], (OpType.TEXT, 0, "tiro", 5, 0, 0, "61"))
+        self.assertEqual(items[1], (OpType.TEXT, 0, "F1", 4, 2.5, 0.25, "41"))
+        self.assertEqual(items[2], (OpType.TEXT, 0, "tiro", 5, 4.5, 0, "62"))
+
+    def test_fit_keeps_default_line_height(self):
+        para = Paragraph(100, 0, 0, 12, 70, 110, 10, True)
+        items, size, line_height = self.typesetter.fit(para, "abcd", 1.4)
+        self.assertEqual((size, line_height), (10, 1.4))
+        self.assertEqual(items[-1][1], 1)
+
+    def test_fit_reduces_line_height(self):
+        para = Paragraph(100, 0, 0, 12, 75, 100, 10, True)
+        _, size, line_height = self.typesetter.fit(para, "abcd", 1.4)
+        self.assertEqual(size, 10)
+        self.assertAlmostEqual(line_height, 1.25)
+
+    def test_fit_shrinks_font(self):
+        para = Paragraph(100, 0, 0, 12, 80, 100, 10, True)
+        items, size, line_height = self.typesetter.fit(para, "abcdef", 1.4)
+        self.assertLess(size, 10)
+        self.assertGreaterEqual(size, 7)
+        self.assertLessEqual((items[-1][1] + 1) * size * line_height, 20)
+
+    def test_fit_single_line(self):
+        para = Paragraph(100, 0, 0, 100, 95, 100, 10, True)
+        _, size, line_height = self.typesetter.fit(para, "abc", 1.4)
+        self.assertEqual((size, line_height), (10, 1.4))
+
+    def test_fit_zero_size(self):
+        # Text set with 0 Tf has paragraphs of size 0
+        para = Paragraph(100, 0, 0, 6, 90, 110, 0, True)
+        items, size, line_height = self.typesetter.fit(para, "a{v0}b{v0}", 1.1)
+        self.assertEqual((size, line_height), (0, 1.1))
+        self.assertEqual(items[-1][1], 1)
+        self.assertEqual(items[1], (OpType.TEXT, 0, "F1", 8, 0, 0.5, "41"))
+
+
+if __name__ == "__main__":
+    unittest.main()